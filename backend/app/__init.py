@@ -1,41 +0,0 @@
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager
-from flask_cors import CORS
-from config import Config
-
-db = SQLAlchemy()
-login_manager = LoginManager()
-
-def create_app():
-    app = Flask(__name__)
-    app.config.from_object(Config)
-    
-    # Initialize extensions
-    db.init_app(app)
-    login_manager.init_app(app)
-    CORS(app)
-    
-    # User loader for Flask-Login
-    from app.models import User
-    
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
-    
-    # Register blueprints
-    from app.routes.auth import auth_bp
-    from app.routes.admin import admin_bp
-    from app.routes.doctor import doctor_bp
-    from app.routes.patient import patient_bp
-    
-    app.register_blueprint(auth_bp, url_prefix='/api/auth')
-    app.register_blueprint(admin_bp, url_prefix='/api/admin')
-    app.register_blueprint(doctor_bp, url_prefix='/api/doctor')
-    app.register_blueprint(patient_bp, url_prefix='/api/patient')
-    
-    # Create tables
-    with app.app_context():
-        db.create_all()
-    
-    return app
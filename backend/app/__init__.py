@@ -0,0 +1,74 @@
+from flask import Flask
+from flask_login import LoginManager
+from flask_cors import CORS
+from config import Config
+# The models are declared on this instance; re-exported for create_admin.py
+from app.models import db
+
+login_manager = LoginManager()
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    
+    # Initialize extensions
+    db.init_app(app)
+    login_manager.init_app(app)
+    CORS(app)
+    
+    # User loader for Flask-Login
+    from app.models import User
+    
+    @login_manager.user_loader
+    def load_user(user_id):
+        return User.query.get(int(user_id))
+    
+    # Register blueprints
+    from app.routes.auth import auth_bp
+    from app.routes.admin import admin_bp
+    from app.routes.doctor import doctor_bp
+    from app.routes.patient import patient_bp
+    from app.routes.cached_routes import cached_bp
+    from app.routes.appointments import appointments_bp
+    
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(doctor_bp, url_prefix='/api/doctor')
+    app.register_blueprint(patient_bp, url_prefix='/api/patient')
+    app.register_blueprint(cached_bp, url_prefix='/api/cached')
+    app.register_blueprint(appointments_bp, url_prefix='/api/appointments')
+    
+    # Prometheus scrape endpoint
+    from app.routes.metrics import metrics_bp
+    app.register_blueprint(metrics_bp)
+    
+    # Per-request timing, query and cache counters
+    from app.middleware.performance import setup_performance_monitoring, setup_db_monitoring
+    from app.services.metrics import setup_celery_metrics
+    setup_performance_monitoring(app)
+    setup_celery_metrics()
+    
+    # Request ids travel with the Celery tasks a request enqueues
+    from app.services.tracing import tracer, setup_celery_tracing
+    tracer.configure(app.config['TRACE_EXPORTER'], app.config['TRACE_FILE'], app.config['TRACE_FILE_MAX_BYTES'])
+    setup_celery_tracing()
+    
+    # Create tables; existing databases are upgraded once per deploy by
+    # upgrade_db.py, never from here
+    with app.app_context():
+        db.create_all()
+        setup_db_monitoring()
+        
+        # Flag N+1 patterns and routes over their @query_budget
+        from app.middleware.query_inspection import setup_query_inspection
+        setup_query_inspection(app)
+        
+        # Invalidate cached entries whenever model changes are committed
+        from app.utils.cache_invalidation import setup_cache_invalidation
+        setup_cache_invalidation()
+        
+        # Per-slot booking counters
+        from app.utils.booking_counts import setup_booking_counts
+        setup_booking_counts()
+    
+    return app
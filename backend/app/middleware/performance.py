@@ -1,25 +1,112 @@
+import re
 import time
 from flask import request, g
-from app.services.cache_service import cache_service
+from flask_login import current_user
+from app.services.metrics import observe_request
+from app.services.profiler import RequestProfiler, profile_store
+from app.services import tracing
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Incoming X-Request-ID values are reused only if they look like ids
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{8,64}$')
+
 def setup_performance_monitoring(app):
   """
-  Setup performance monitoring middleware
+  Setup performance monitoring middleware. Admin requests sent with
+  X-Profile: 1 (cProfile) or X-Profile: sample (stack sampling) are profiled
+  and stored; the response carries the profile id in X-Profile-Id.
+  Every request gets a request id (X-Request-ID, accepted from the client or
+  generated) that starts a trace, which tasks it enqueues continue.
   """
+  profile_store.directory = app.config.get('PROFILE_DIR') or profile_store.directory
+  profile_store.max_bytes = app.config.get('PROFILE_STORE_MAX_BYTES', profile_store.max_bytes)
+  profile_store.max_profiles = app.config.get('PROFILE_STORE_MAX_COUNT', profile_store.max_profiles)
+
   @app.before_request
   def start_timer():
     g.start_time = time.time()
     g.db_query_count = 0
+    g.db_query_time = 0.0
     g.cache_hits = 0
     g.cache_misses = 0
+    start_request_trace()
+
+    mode = request.headers.get('X-Profile')
+    if mode and app.config.get('PROFILING_ENABLED', True):
+      start_profiler(mode)
+
+  def start_request_trace():
+    incoming = request.headers.get('X-Request-ID', '')
+    g.request_id = incoming if _REQUEST_ID.match(incoming) else tracing.new_request_id()
+    token = tracing.start_trace(g.request_id)
+    context = tracing.span('http.request', method=request.method, path=request.path, endpoint=request.endpoint)
+    g.trace_state = (token, context, context.__enter__())
+
+  def start_profiler(mode):
+    # Checked only when the header is present: loading the user is a query
+    if not (current_user.is_authenticated and current_user.role == 'admin'):
+      return
+    profiler = RequestProfiler(
+      'sample' if mode == 'sample' else 'cprofile',
+      sample_interval=app.config.get('PROFILE_SAMPLE_INTERVAL', 0.005)
+    )
+    try:
+      profiler.start()
+    except ValueError as e:
+      # Another profiler is already active in this process
+      logger.warning(f"Request profiling unavailable: {e}")
+      return
+    g.profiler = profiler
+
+  def save_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+      return
+    duration = profiler.stop()
+    try:
+      profile_id = profile_store.save(profiler, {
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration': round(duration, 6),
+        'db_queries': getattr(g, 'db_query_count', 0),
+        'user_id': current_user.get_id()
+      })
+    except OSError as e:
+      logger.error(f"Could not store request profile: {e}")
+      return
+    response.headers['X-Profile-Id'] = profile_id
+
+  @app.teardown_request
+  def stop_profiler(exc=None):
+    # The profiler must not outlive its request, even one that failed
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+      profiler.stop()
+
+  @app.teardown_request
+  def end_request_trace(exc=None):
+    trace_state = g.pop('trace_state', None)
+    if trace_state is None:
+      return
+    token, context, attributes = trace_state
+    if exc is not None:
+      attributes['error'] = f"{type(exc).__name__}: {exc}"
+    context.__exit__(None, None, None)
+    tracing.end_trace(token)
 
   @app.after_request
   def log_performance(response):
-    # Skip for static files and health checks
-    if request.path.startswith('/static') or request.path == '/health':
+    save_profile(response)
+    if 'request_id' in g:
+      response.headers['X-Request-ID'] = g.request_id
+      g.trace_state[2]['status'] = response.status_code
+
+    # Skip for static files, health checks and metrics scrapes
+    if request.path.startswith('/static') or request.path in ('/health', '/metrics'):
       return response
 
     # Calculate request time
@@ -34,28 +121,59 @@ def setup_performance_monitoring(app):
       f"Status: {response.status_code}"
     )
 
-    # Add performance headers for monitoring
+    observe_request(
+      request.blueprint, request.endpoint, request.method, response.status_code,
+      request_time, getattr(g, 'db_query_count', 0), getattr(g, 'db_query_time', 0.0)
+    )
+
+    # Add performance headers for monitoring. Cache counters are the ones
+    # CacheService recorded for this request; no Redis round trip here
     response.headers['X-Response-Time'] = f'{request_time:.3f}'
     response.headers['X-DB-Queries'] = str(getattr(g, 'db_query_count', 0))
-    
-    if cache_service.is_connected():
-      cache_stats = cache_service.get_cache_stats()
-      response.headers['X-Cache-Hits'] = str(cache_stats.get('keyspace_hits', 0))
-      response.headers['X-Cache-Misses'] = str(cache_stats.get('keyspace_misses', 0))
+    response.headers['X-Cache-Hits'] = str(getattr(g, 'cache_hits', 0))
+    response.headers['X-Cache-Misses'] = str(getattr(g, 'cache_misses', 0))
 
     return response
 
 # Database query counter
 def setup_db_monitoring():
   """
-  Setup database query monitoring
+  Setup database query monitoring. Statements slower than
+  SLOW_QUERY_THRESHOLD_MS, from requests and Celery tasks alike, go to the
+  slow query log with their EXPLAIN plan.
   """
   from sqlalchemy import event
   from app.models import db
-  from flask import g
+  from app.services.slow_query_log import slow_query_log
+  from flask import current_app, g, has_request_context
+
+  slow_query_log.configure(
+    threshold_ms=current_app.config.get('SLOW_QUERY_THRESHOLD_MS', 200),
+    size=current_app.config.get('SLOW_QUERY_LOG_SIZE', 500),
+    explain=current_app.config.get('SLOW_QUERY_EXPLAIN', True)
+  )
 
   @event.listens_for(db.engine, "before_cursor_execute")
   def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started_at = time.perf_counter()
+    # Queries run by Celery tasks or at startup have no request to count for
+    if not has_request_context():
+      return
     if not hasattr(g, 'db_query_count'):
       g.db_query_count = 0
-    g.db_query_count += 1
\ No newline at end of file
+    g.db_query_count += 1
+
+  @event.listens_for(db.engine, "after_cursor_execute")
+  def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, '_query_started_at', None)
+    if started_at is None:
+      return
+    elapsed = time.perf_counter() - started_at
+    in_request = has_request_context()
+    if in_request:
+      g.db_query_time = getattr(g, 'db_query_time', 0.0) + elapsed
+    slow_query_log.record(
+      conn, statement, parameters, executemany, elapsed * 1000,
+      request.endpoint if in_request else None
+    )
+    tracing.record_span('db.query', started_at, statement=statement[:200])
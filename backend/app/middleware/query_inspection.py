@@ -0,0 +1,80 @@
+import logging
+import re
+from collections import Counter
+from flask import current_app, g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bin\s*\((?:\s*(?:\?|%\([^)]*\)s|%s|:\w+)\s*,?)+\)", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"%\([^)]*\)s|%s|:\w+|\?")
+_WHITESPACE = re.compile(r"\s+")
+
+class QueryBudgetExceeded(RuntimeError):
+  """Raised in test mode when a request repeats a statement or exceeds its query budget"""
+
+def fingerprint_sql(statement):
+  """
+  Reduce a SQL statement to its shape: literals and bind parameters become
+  ?, IN lists collapse to (?), whitespace and case are normalized. The same
+  query issued for different ids gets the same fingerprint.
+  """
+  fingerprint = _STRING_LITERAL.sub('?', statement)
+  fingerprint = _NUMBER_LITERAL.sub('?', fingerprint)
+  fingerprint = _PLACEHOLDER.sub('?', fingerprint)
+  fingerprint = _IN_LIST.sub('in (?)', fingerprint)
+  return _WHITESPACE.sub(' ', fingerprint).strip().lower()
+
+def _strict():
+  """Raise instead of warning: in test mode unless QUERY_INSPECTION_STRICT says otherwise"""
+  strict = current_app.config.get('QUERY_INSPECTION_STRICT')
+  return current_app.testing if strict is None else bool(strict)
+
+def _report(message, response):
+  if _strict():
+    raise QueryBudgetExceeded(message)
+  logger.warning(message)
+  response.headers.add('X-Query-Warning', message[:200])
+
+def setup_query_inspection(app):
+  """
+  Fingerprint every SQL statement of a request. After the request, any
+  fingerprint repeated more than N_PLUS_ONE_THRESHOLD times (an N+1 pattern)
+  and any route exceeding its @query_budget is logged and flagged with an
+  X-Query-Warning header, or raises QueryBudgetExceeded in test mode.
+  """
+  from sqlalchemy import event
+  from app.models import db
+
+  @event.listens_for(db.engine, "before_cursor_execute")
+  def record_fingerprint(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+      return
+    fingerprints = g.get('query_fingerprints')
+    if fingerprints is None:
+      fingerprints = g.query_fingerprints = Counter()
+    fingerprints[fingerprint_sql(statement)] += 1
+
+  @app.after_request
+  def inspect_queries(response):
+    fingerprints = g.get('query_fingerprints')
+    if not fingerprints:
+      return response
+
+    threshold = current_app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+    repeated = [(fp, count) for fp, count in fingerprints.most_common() if count > threshold]
+    if repeated:
+      fingerprint, count = repeated[0]
+      _report(
+        f"Possible N+1 in {request.endpoint}: {len(repeated)} statement(s) repeated, "
+        f"worst {count}x: {fingerprint[:120]}",
+        response
+      )
+
+    budget = g.get('query_budget')
+    total = sum(fingerprints.values())
+    if budget is not None and total > budget:
+      _report(f"Query budget exceeded in {request.endpoint}: {total} queries (budget {budget})", response)
+
+    return response
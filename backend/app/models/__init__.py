@@ -31,7 +31,7 @@ class Department(db.Model):
 
   id = db.Column(db.Integer, primary_key=True)
   name = db.Column(db.String(100), nullable=False)
-  description = db.Column(db.DateTime, default=datetime.utcnow)
+  description = db.Column(db.Text)
   created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
   # Relationships
@@ -41,8 +41,8 @@ class Doctor(db.Model):
   __tablename__ = 'doctors'
 
   id = db.Column(db.Integer, primary_key=True)
-  user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-  department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=False)
+  user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+  department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=False, index=True)
   specialization = db.Column(db.String(100),nullable=False)
   qualification = db.Column(db.String(200))
   experience = db.Column(db.Integer) #years
@@ -66,14 +66,25 @@ class DoctorAvailability(db.Model):
   end_time = db.Column(db.Time, nullable=False)
   is_available = db.Column(db.Boolean, default=True)
   max_patients = db.Column(db.Integer, default=10)
+  # Scheduled and completed appointments in this slot, maintained by
+  # app.utils.booking_counts
+  booked_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
-  __table__args__ = (db.UniqueConstraint('doctor_id', 'date', 'start_time', name='unique_doctor_slot'))
+  __table_args__ = (
+    # One slot per doctor and start time. Serves slot lookups and the
+    # per-doctor date range listings; on PostgreSQL the included columns
+    # make the availability checks index-only
+    db.Index(
+      'unique_doctor_slot', 'doctor_id', 'date', 'start_time', unique=True,
+      postgresql_include=['is_available', 'max_patients', 'booked_count']
+    ),
+  )
 
 class Patient(db.Model):
   __tablename__ = 'patients'
 
   id = db.Column(db.Integer, primary_key=True)
-  user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+  user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
   first_name = db.Column(db.String(50), nullable=False)
   last_name = db.Column(db.String(50), nullable=False)
   date_of_birth = db.Column(db.Date, nullable=False)
@@ -94,7 +105,7 @@ class Appointment(db.Model):
   patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
   doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
   appointment_date = db.Column(db.Date, nullable=False)
-  appointment_date = db.Column(db.Time, nullable=False)
+  appointment_time = db.Column(db.Time, nullable=False)
   status = db.Column(db.String(20), default='scheduled') # scheduled, completed,, cancelled, np_show
   reason = db.Column(db.Text)
   created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -104,17 +115,144 @@ class Appointment(db.Model):
   # Relationships
   treatment = db.relationship('Treatment', backref='appointment', uselist=False, cascade='all, delete-orphan')
 
-  __table_args__ = (db.UniqueConstraint('doctor_id', 'appointment_date', 'appointment_time', cascade='all, delete-orphan'))
+  # Not unique on (doctor_id, appointment_date, appointment_time): a slot
+  # takes up to DoctorAvailability.max_patients bookings
+  __table_args__ = (
+    # Slot booking counts, doctor dashboards and availability listings
+    db.Index('ix_appointments_doctor_slot', 'doctor_id', 'appointment_date', 'appointment_time', 'status'),
+    # Patient conflict checks and appointment lists
+    db.Index('ix_appointments_patient_date', 'patient_id', 'appointment_date', 'status'),
+    # Admin dashboard counts and daily reminders
+    db.Index('ix_appointments_date_status', 'appointment_date', 'status'),
+  )
 
 
 class Treatment(db.Model):
   __tablename__ = 'treatments'
 
   id = db.Column(db.Integer, primary_key=True)
-  appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False)
+  appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False, index=True)
   diagnosis = db.Column(db.Text)
   symptoms = db.Column(db.Text)
   prescription= db.Column(db.Text)
   notes = db.Column(db.Text)
   follow_up_date = db.Column(db.Date)
-  created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+  created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class AppointmentHistory(db.Model):
+  __tablename__ = 'appointment_history'
+
+  id = db.Column(db.Integer, primary_key=True)
+  appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False, index=True)
+  changed_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # User who made the change
+  change_type = db.Column(db.String(20), nullable=False)  # created, updated, cancelled, status_changed
+  previous_data = db.Column(db.Text)  # JSON string of previous data
+  new_data = db.Column(db.Text)  # JSON string of new data
+  change_reason = db.Column(db.Text)
+  changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+  # Relationships
+  appointment = db.relationship('Appointment', backref=db.backref('history', lazy=True))
+  user = db.relationship('User', foreign_keys=[changed_by])
+
+class ConflictLog(db.Model):
+  __tablename__ = 'conflict_logs'
+
+  id = db.Column(db.Integer, primary_key=True)
+  conflict_type = db.Column(db.String(50), nullable=False)  # double_booking, time_conflict, etc.
+  user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+  attempted_date = db.Column(db.Date, nullable=False)
+  attempted_time = db.Column(db.Time, nullable=False)
+  doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'))
+  patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'))
+  resolved = db.Column(db.Boolean, default=False)
+  resolved_at = db.Column(db.DateTime)
+  created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+  # Relationships
+  user = db.relationship('User', foreign_keys=[user_id])
+  doctor = db.relationship('Doctor', foreign_keys=[doctor_id])
+  patient = db.relationship('Patient', foreign_keys=[patient_id])
+
+def add_missing_columns(engine):
+  """
+  db.create_all() never alters existing tables; add columns declared above
+  that an older database lacks. Only columns that are nullable or have a
+  server default can be added this way. Returns "table.column" names added.
+  """
+  from sqlalchemy import inspect, text
+
+  inspector = inspect(engine)
+  added = []
+  for table in db.metadata.sorted_tables:
+    if not inspector.has_table(table.name):
+      continue
+    existing = {column['name'] for column in inspector.get_columns(table.name)}
+    for column in table.columns:
+      if column.name in existing or not (column.nullable or column.server_default is not None):
+        continue
+      column_type = column.type.compile(dialect=engine.dialect)
+      default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ''
+      not_null = '' if column.nullable else ' NOT NULL'
+      with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}{not_null}'))
+      added.append(f'{table.name}.{column.name}')
+  return added
+
+def create_missing_indexes(engine):
+  """
+  db.create_all() only creates indexes together with new tables; add the
+  ones declared above to tables that already exist. Returns the names of
+  the indexes created.
+  """
+  import logging
+  from sqlalchemy import inspect
+
+  inspector = inspect(engine)
+  created = []
+  for table in db.metadata.sorted_tables:
+    if not inspector.has_table(table.name):
+      continue
+    existing = {index['name'] for index in inspector.get_indexes(table.name)}
+    for index in table.indexes:
+      if index.name in existing:
+        continue
+      try:
+        index.create(bind=engine)
+        created.append(index.name)
+      except Exception as e:
+        # e.g. duplicate slots left over from before unique_doctor_slot existed
+        logging.getLogger(__name__).error(f"Could not create index {index.name}: {e}")
+  return created
+
+def rebuild_changed_indexes(engine):
+  """
+  Recreate existing PostgreSQL indexes whose INCLUDE columns differ from the
+  declarations above (create_missing_indexes only adds missing ones). Each
+  index is dropped and rebuilt in one transaction, which blocks writes to
+  its table meanwhile. Returns the names of the indexes rebuilt.
+  """
+  from sqlalchemy import inspect
+
+  if engine.dialect.name != 'postgresql':
+    return []
+
+  inspector = inspect(engine)
+  rebuilt = []
+  for table in db.metadata.sorted_tables:
+    if not inspector.has_table(table.name):
+      continue
+    existing = {index['name']: index for index in inspector.get_indexes(table.name)}
+    for index in table.indexes:
+      reflected = existing.get(index.name)
+      if reflected is None:
+        continue
+      declared = list(index.dialect_options['postgresql']['include'] or [])
+      current = list(reflected.get('dialect_options', {}).get('postgresql_include') or [])
+      if declared == current:
+        continue
+      with engine.begin() as conn:
+        index.drop(bind=conn)
+        index.create(bind=conn)
+      rebuilt.append(index.name)
+  return rebuilt
@@ -1,78 +1,58 @@
-from app.models import Doctor, Patient, Appointment, Department, DoctorAvailability
-from app.services.cache_service import cache_service, cached
+from app.models import Doctor, Patient, Appointment, Department, DoctorAvailability, db
+from app.models.read_models import load_department_views, load_doctor_view, load_doctor_views
+from app.services.cache_service import cache_service, cached, cached_batch
+from app.services.schedule_index import schedule_index
 from app.utils.cache_keys import CacheKeys
 from datetime import datetime, timedelta
+from sqlalchemy import distinct, func
 
 class CachedDoctor:
   @staticmethod
-  @cached(key_pattern=CacheKeys.department_list(), expiry=3600)
+  @cached(key_pattern=CacheKeys.department_list(), expiry=86400, local_ttl=300)
   def get_all_departments():
-    """Get all departments with caching"""
-    return Department.query.all()
+    """Get all departments (as DepartmentView snapshots) with caching"""
+    return load_department_views()
   
   @staticmethod
-  @cached(key_pattern=CacheKeys.doctor_list(), expiry=1800)
+  @cached(key_pattern=CacheKeys.doctor_list, expiry=21600, local_ttl=60, normalize=('search',))
   def get_available_doctors(search=None, department_id=None):
-    """Get available doctors with caching"""
-    from app.models import Doctor, User, Department
-    query = Doctor.query.join(User).join(Department).filter(Doctor.is_available == True)
-    
-    if search:
-      query = query.filter(
-        (User.username.ilike(f'%{search}%')) |
-        (Doctor.specialization.ilike(f'%{search}%')) |
-        (Department.name.ilike(f'%{search}%'))
-      )
-    
-    if department_id:
-        query = query.filter(Doctor.department_id == department_id)
-    
-    return query.all()
+    """Get available doctors (as DoctorView snapshots) with caching; search is case-insensitive"""
+    return load_doctor_views(search=search, department_id=department_id)
   
   @staticmethod
-  @cached(key_pattern=CacheKeys.doctor_detail("{doctor_id}"), expiry=3600)
+  @cached(key_pattern=CacheKeys.doctor_detail("{doctor_id}"), expiry=21600, negative_ttl=60, coalesce=True)
   def get_doctor_with_details(doctor_id):
-    """Get doctor details with caching"""
-    from app.models import Doctor, User, Department
-    return Doctor.query.join(User).join(Department).filter(Doctor.id == doctor_id).first()
+    """Get doctor details (as a DoctorView snapshot) with caching; unknown ids are cached briefly too"""
+    return load_doctor_view(doctor_id)
+  
+  @staticmethod
+  @cached_batch(key_pattern=CacheKeys.doctor_detail("{doctor_id}"), expiry=21600)
+  def get_doctors_with_details(doctor_ids):
+    """Get DoctorView snapshots for many doctors, sharing get_doctor_with_details' entries"""
+    return {doctor.id: doctor for doctor in load_doctor_views(doctor_ids=doctor_ids, available_only=False)}
   
   @staticmethod
-  @cached(key_pattern=CacheKeys.doctor_availability("{doctor_id}", "{start_date}", "{end_date}"), expiry=900)
+  @cached(key_pattern=CacheKeys.doctor_availability("{doctor_id}", "{start_date}", "{end_date}"), expiry=3600,
+          single_flight=True, beta=1.0, stale_ttl=300)
   def get_doctor_availability(doctor_id, start_date, end_date):
-    """Get doctor availability with caching"""
-    availability = DoctorAvailability.query.filter(
-      DoctorAvailability.doctor_id == doctor_id,
-      DoctorAvailability.date >= start_date,
-      DoctorAvailability.date <= end_date,
-      DoctorAvailability.is_available == True
-    ).order_by(DoctorAvailability.date.asc(), DoctorAvailability.start_time.asc()).all()
-    
-    # Convert to serializable format
-    result = []
-    for slot in availability:
-        # Check current bookings
-        from app.models import Appointment
-        appointment_count = Appointment.query.filter(
-          Appointment.doctor_id == doctor_id,
-          Appointment.appointment_date == slot.date,
-          Appointment.appointment_time == slot.start_time,
-          Appointment.status.in_(['scheduled', 'completed'])
-        ).count()
-        
-        result.append({
-          'id': slot.id,
-          'date': slot.date.isoformat(),
-          'start_time': slot.start_time.strftime('%H:%M'),
-          'end_time': slot.end_time.strftime('%H:%M'),
-          'is_available': slot.is_available and appointment_count < slot.max_patients,
-          'max_patients': slot.max_patients,
-          'current_appointments': appointment_count
-        })
-    return result
+    """Get doctor availability with caching, built from the schedule index"""
+    return schedule_index.availability([doctor_id], start_date, end_date).get(doctor_id, [])
+  
+  @staticmethod
+  @cached_batch(key_pattern=CacheKeys.doctor_availability("{doctor_id}", "{start_date}", "{end_date}"), expiry=3600)
+  def get_bulk_availability(doctor_ids, start_date, end_date):
+    """Get availability for many doctors, sharing get_doctor_availability's entries"""
+    return schedule_index.availability(doctor_ids, start_date, end_date)
+  
+  @staticmethod
+  @cached_batch(key_pattern=CacheKeys.doctor_next_available("{doctor_id}", "{from_date}"), expiry=3600, negative_ttl=300)
+  def get_next_available_dates(doctor_ids, from_date):
+    """Get each doctor's next date with a free slot (doctors without one are cached as such for 5 minutes)"""
+    return schedule_index.next_available_dates(doctor_ids, from_date)
 
 class CachedPatient:
   @staticmethod
-  @cached(key_pattern=CacheKeys.patient_appointments("{patient_id}", "{status}"), expiry=1800)
+  @cached(key_pattern=CacheKeys.patient_appointments, expiry=3600)
   def get_patient_appointments(patient_id, status=None):
       """Get patient appointments with caching"""
       from app.models import Appointment, Doctor, User
@@ -109,7 +89,8 @@ class CachedPatient:
 
 class CachedStats:
   @staticmethod
-  @cached(key_pattern=CacheKeys.admin_dashboard_stats(), expiry=300)
+  @cached(key_pattern=CacheKeys.admin_dashboard_stats(), expiry=300, single_flight=True, beta=1.0,
+          stale_ttl=600)
   def get_admin_dashboard_stats():
     """Get admin dashboard stats with caching"""
     from app.models import Patient, Doctor, Appointment
@@ -132,7 +113,8 @@ class CachedStats:
     return stats
   
   @staticmethod
-  @cached(key_pattern=CacheKeys.doctor_dashboard_stats("{doctor_id}"), expiry=300)
+  @cached(key_pattern=CacheKeys.doctor_dashboard_stats("{doctor_id}"), expiry=300, single_flight=True, beta=1.0,
+          stale_ttl=600)
   def get_doctor_dashboard_stats(doctor_id):
     """Get doctor dashboard stats with caching"""
     from app.models import Appointment
@@ -150,9 +132,9 @@ class CachedStats:
         Appointment.appointment_date <= today + timedelta(days=7),
         Appointment.status == 'scheduled'
       ).count(),
-      'total_patients': len(set([
-        app.patient_id for app in Appointment.query.filter_by(doctor_id=doctor_id).all()
-      ]))
+      'total_patients': db.session.query(func.count(distinct(Appointment.patient_id))).filter(
+        Appointment.doctor_id == doctor_id
+      ).scalar()
     }
     
     return doctor_stats
\ No newline at end of file
@@ -0,0 +1,196 @@
+from datetime import datetime
+from sqlalchemy import func
+from app.models import User, Doctor, Department, DoctorAvailability, db
+from app.services.cache_codec import register_snapshot_type
+
+class Snapshot:
+  """
+  Immutable, __slots__-based read model. Snapshots are built from column
+  queries (no ORM instances), so they never lazy-load and are cheap to cache.
+  """
+  __slots__ = ()
+
+  def __init__(self, **values):
+    for name in self.__slots__:
+      object.__setattr__(self, name, values.get(name))
+
+  def __setattr__(self, name, value):
+    raise AttributeError(f"{type(self).__name__} is immutable")
+
+  def __delattr__(self, name):
+    raise AttributeError(f"{type(self).__name__} is immutable")
+
+  def __eq__(self, other):
+    return type(self) is type(other) and self.to_tuple() == other.to_tuple()
+
+  def __hash__(self):
+    return hash((type(self).__name__,) + self.to_tuple())
+
+  def __repr__(self):
+    fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+    return f"{type(self).__name__}({fields})"
+
+  def __reduce__(self):
+    return (_restore_snapshot, (type(self), self.to_tuple()))
+
+  def to_tuple(self):
+    return tuple(getattr(self, name) for name in self.__slots__)
+
+  @classmethod
+  def from_tuple(cls, values):
+    return cls(**dict(zip(cls.__slots__, values)))
+
+  def to_dict(self):
+    return {name: getattr(self, name) for name in self.__slots__}
+
+  def replace(self, **changes):
+    values = self.to_dict()
+    values.update(changes)
+    return type(self)(**values)
+
+def _restore_snapshot(cls, values):
+  return cls.from_tuple(values)
+
+@register_snapshot_type
+class DepartmentView(Snapshot):
+  __slots__ = ('id', 'name', 'description', 'created_at', 'doctor_count')
+
+@register_snapshot_type
+class DoctorView(Snapshot):
+  __slots__ = (
+    'id', 'user_id', 'name', 'email', 'specialization', 'department_id',
+    'department_name', 'qualification', 'experience', 'consultation_fee',
+    'bio', 'is_available', 'created_at'
+  )
+
+def _doctor_columns():
+  return (
+    Doctor.id, Doctor.user_id, User.username, User.email, Doctor.specialization,
+    Doctor.department_id, Department.name, Doctor.qualification, Doctor.experience,
+    Doctor.consultation_fee, Doctor.bio, Doctor.is_available, Doctor.created_at
+  )
+
+def _doctor_query():
+  return db.session.query(*_doctor_columns()).join(
+    User, Doctor.user_id == User.id
+  ).join(
+    Department, Doctor.department_id == Department.id
+  )
+
+def load_doctor_views(search=None, department_id=None, specialization=None,
+                      available_only=True, doctor_ids=None):
+  """
+  Load doctors as DoctorView snapshots with a single joined query
+  """
+  query = _doctor_query()
+
+  if available_only:
+    query = query.filter(Doctor.is_available == True)
+
+  if search:
+    query = query.filter(
+      (User.username.ilike(f'%{search}%')) |
+      (Doctor.specialization.ilike(f'%{search}%')) |
+      (Department.name.ilike(f'%{search}%'))
+    )
+
+  if specialization:
+    query = query.filter(Doctor.specialization.ilike(f'%{specialization}%'))
+
+  if department_id:
+    query = query.filter(Doctor.department_id == department_id)
+
+  if doctor_ids is not None:
+    query = query.filter(Doctor.id.in_(list(doctor_ids)))
+
+  return [DoctorView.from_tuple(tuple(row)) for row in query.order_by(Doctor.id.asc()).all()]
+
+def load_doctor_view(doctor_id, available_only=False):
+  """
+  Load a single doctor as a DoctorView, or None when not found
+  """
+  query = _doctor_query().filter(Doctor.id == doctor_id)
+  if available_only:
+    query = query.filter(Doctor.is_available == True)
+
+  row = query.first()
+  return DoctorView.from_tuple(tuple(row)) if row else None
+
+def load_department_views(with_doctor_counts=False, available_only=False):
+  """
+  Load departments as DepartmentView snapshots; doctor counts come from the
+  same query via an outer join instead of one COUNT per department
+  """
+  if not with_doctor_counts:
+    rows = db.session.query(
+      Department.id, Department.name, Department.description, Department.created_at
+    ).order_by(Department.id.asc()).all()
+    return [DepartmentView.from_tuple(tuple(row)) for row in rows]
+
+  join_condition = Doctor.department_id == Department.id
+  if available_only:
+    join_condition = join_condition & (Doctor.is_available == True)
+
+  rows = db.session.query(
+    Department.id, Department.name, Department.description, Department.created_at,
+    func.count(Doctor.id)
+  ).outerjoin(
+    Doctor, join_condition
+  ).group_by(Department.id).order_by(Department.id.asc()).all()
+
+  return [DepartmentView.from_tuple(tuple(row)) for row in rows]
+
+def load_next_available_dates(doctor_ids, from_date=None, until=None):
+  """
+  Map doctor id -> earliest date on or after from_date (and, when given, on
+  or before until) with a slot that is open and not fully booked
+  """
+  if not doctor_ids:
+    return {}
+
+  from_date = from_date or datetime.now().date()
+  query = db.session.query(
+    DoctorAvailability.doctor_id, func.min(DoctorAvailability.date)
+  ).filter(
+    DoctorAvailability.doctor_id.in_(list(doctor_ids)),
+    DoctorAvailability.date >= from_date,
+    DoctorAvailability.is_available == True,
+    DoctorAvailability.booked_count < DoctorAvailability.max_patients
+  )
+  if until is not None:
+    query = query.filter(DoctorAvailability.date <= until)
+  rows = query.group_by(DoctorAvailability.doctor_id).all()
+
+  return {doctor_id: next_date for doctor_id, next_date in rows}
+
+def load_availability_slots(doctor_ids, start_date, end_date):
+  """
+  Map doctor id -> open availability slots between start_date and end_date.
+  Booking counts come from DoctorAvailability.booked_count, so this is one
+  range scan over the slot index with no appointment query.
+  """
+  if not doctor_ids:
+    return {}
+
+  doctor_ids = list(doctor_ids)
+  slots = DoctorAvailability.query.filter(
+    DoctorAvailability.doctor_id.in_(doctor_ids),
+    DoctorAvailability.date >= start_date,
+    DoctorAvailability.date <= end_date,
+    DoctorAvailability.is_available == True
+  ).order_by(
+    DoctorAvailability.doctor_id.asc(), DoctorAvailability.date.asc(), DoctorAvailability.start_time.asc()
+  ).all()
+
+  result = {doctor_id: [] for doctor_id in doctor_ids}
+  for slot in slots:
+    result.setdefault(slot.doctor_id, []).append({
+      'id': slot.id,
+      'date': slot.date.isoformat(),
+      'start_time': slot.start_time.strftime('%H:%M'),
+      'end_time': slot.end_time.strftime('%H:%M'),
+      'is_available': slot.is_available and slot.booked_count < slot.max_patients,
+      'max_patients': slot.max_patients,
+      'current_appointments': slot.booked_count
+    })
+  return result
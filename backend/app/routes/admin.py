@@ -1,7 +1,12 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, send_file
 from flask_login import login_required, current_user
 from app.models import User, Doctor, Patient, Department, Appointment, db
-from app.utils.decorators import admin_required
+from app.models.read_models import load_department_views, load_doctor_views
+from app.services.profiler import profile_store
+from app.services.slow_query_log import slow_query_log
+from app.services import tracing
+from app.services.tracing import tracer
+from app.utils.decorators import admin_required, query_budget
 from datetime import datetime, timedelta
 import json
 
@@ -63,28 +68,20 @@ def get_doctors():
       search = request.args.get('search', '')
       department_id = request.args.get('department_id', type=int)
       
-      query = Doctor.query.join(User).join(Department)
-      
-      if search:
-          query = query.filter(
-              (User.username.ilike(f'%{search}%')) |
-              (Doctor.specialization.ilike(f'%{search}%')) |
-              (Department.name.ilike(f'%{search}%'))
-          )
-      
-      if department_id:
-          query = query.filter(Doctor.department_id == department_id)
-      
-      doctors = query.all()
+      doctors = load_doctor_views(
+          search=search,
+          department_id=department_id,
+          available_only=False
+      )
       
       result = []
       for doctor in doctors:
           result.append({
               'id': doctor.id,
-              'username': doctor.user.username,
-              'email': doctor.user.email,
+              'username': doctor.name,
+              'email': doctor.email,
               'specialization': doctor.specialization,
-              'department': doctor.department.name,
+              'department': doctor.department_name,
               'qualification': doctor.qualification,
               'experience': doctor.experience,
               'consultation_fee': doctor.consultation_fee,
@@ -415,18 +412,18 @@ def get_appointments():
 @admin_bp.route('/departments', methods=['GET'])
 @login_required
 @admin_required
+@query_budget(3)
 def get_departments():
   try:
-      departments = Department.query.all()
+      departments = load_department_views(with_doctor_counts=True)
       
       result = []
       for dept in departments:
-          doctor_count = Doctor.query.filter_by(department_id=dept.id).count()
           result.append({
               'id': dept.id,
               'name': dept.name,
               'description': dept.description,
-              'doctor_count': doctor_count,
+              'doctor_count': dept.doctor_count,
               'created_at': dept.created_at.isoformat()
           })
       
@@ -468,4 +465,135 @@ def add_department():
       
   except Exception as e:
       db.session.rollback()
-      return jsonify({'error': str(e)}), 500
\ No newline at end of file
+      return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/slow-queries', methods=['GET'])
+@login_required
+@admin_required
+def get_slow_queries():
+  """
+  Slowest statement fingerprints of this process by total time, with their
+  EXPLAIN plans. ?limit= caps the list, ?recent=1 adds the latest entries,
+  ?reset=1 clears the log after reading it.
+  """
+  try:
+      limit = min(request.args.get('limit', 20, type=int), 200)
+      result = {
+          'log': slow_query_log.stats(),
+          'top': slow_query_log.top(limit)
+      }
+      
+      if request.args.get('recent', type=int):
+          result['recent'] = slow_query_log.recent(limit)
+      if request.args.get('reset', type=int):
+          slow_query_log.reset()
+      
+      return jsonify({'slow_queries': result}), 200
+      
+  except Exception as e:
+      return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiles', methods=['GET'])
+@login_required
+@admin_required
+def get_profiles():
+  """
+  Stored request profiles, newest first. Profile a request by sending it
+  as an admin with X-Profile: 1 (cProfile) or X-Profile: sample.
+  """
+  try:
+      profiles = profile_store.list()
+      return jsonify({
+          'profiles': profiles,
+          'total_size': sum(profile.get('size', 0) for profile in profiles),
+          'max_size': profile_store.max_bytes,
+          'max_profiles': profile_store.max_profiles
+      }), 200
+      
+  except Exception as e:
+      return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@login_required
+@admin_required
+def download_profile(profile_id):
+  """
+  Download a profile: .prof (pstats) or .collapsed (flamegraph stacks).
+  ?format=summary returns a pstats text report of a cProfile run instead.
+  """
+  try:
+      found = profile_store.get(profile_id)
+      if found is None:
+          return jsonify({'error': 'Profile not found'}), 404
+      metadata, path = found
+      
+      if request.args.get('format') == 'summary':
+          report = profile_store.summary(profile_id, limit=request.args.get('limit', 40, type=int))
+          if report is None:
+              return jsonify({'error': 'Summaries are only available for cProfile runs'}), 400
+          return Response(report, mimetype='text/plain')
+      
+      return send_file(path, as_attachment=True, download_name=metadata['file'])
+      
+  except Exception as e:
+      return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiles/<profile_id>', methods=['DELETE'])
+@login_required
+@admin_required
+def delete_profile(profile_id):
+  try:
+      if not profile_store.delete(profile_id):
+          return jsonify({'error': 'Profile not found'}), 404
+      return jsonify({'message': 'Profile deleted successfully'}), 200
+      
+  except Exception as e:
+      return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/traces', methods=['GET'])
+@login_required
+@admin_required
+def get_traces():
+  """
+  Most recent traces with their end-to-end duration and the tasks they
+  spawned. A trace id is the X-Request-ID of the request that started it.
+  """
+  try:
+      limit = min(request.args.get('limit', 20, type=int), 200)
+      
+      by_trace = {}
+      for span in tracer.spans():
+          by_trace.setdefault(span['trace_id'], []).append(span)
+      
+      traces = []
+      for trace_id, spans in by_trace.items():
+          summary = tracing.summarize(spans)
+          traces.append({
+              'trace_id': trace_id,
+              'started_at': summary['started_at'],
+              'duration_ms': summary['duration_ms'],
+              'root': summary['spans'][0]['name'],
+              'span_count': len(spans),
+              'tasks': [span['attributes'].get('task') for span in summary['spans'] if span['name'] == 'celery.task']
+          })
+      traces.sort(key=lambda trace: trace['started_at'], reverse=True)
+      
+      return jsonify({'traces': traces[:limit]}), 200
+      
+  except Exception as e:
+      return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/traces/<trace_id>', methods=['GET'])
+@login_required
+@admin_required
+def get_trace(trace_id):
+  """All spans of one trace (HTTP request, Celery tasks, DB, cache, SMTP, PDF)"""
+  try:
+      spans = tracer.spans(trace_id)
+      if not spans:
+          return jsonify({'error': 'Trace not found'}), 404
+      
+      return jsonify({'trace': tracing.summarize(spans)}), 200
+      
+  except Exception as e:
+      return jsonify({'error': str(e)}), 500
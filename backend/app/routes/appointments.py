@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from app.models import Appointment, Treatment, Doctor, Patient, db
+from app.models.cached_models import CachedDoctor
 from app.services.appointment_service import AppointmentService
-from app.utils.decorators import admin_required, doctor_required, patient_required
+from app.utils.decorators import admin_required, doctor_required, patient_required, query_budget
 from datetime import datetime, timedelta
 import json
 
@@ -39,6 +40,7 @@ def get_appointment_history(appointment_id):
 
 @appointments_bp.route('/conflicts/check', methods=['POST'])
 @login_required
+@query_budget(4)
 def check_appointment_conflicts():
   """
   Check for scheduling conflicts before booking
@@ -65,9 +67,11 @@ def check_appointment_conflicts():
       
       exclude_appointment_id = data.get('exclude_appointment_id')
       
-      # Validate appointment
+      # Two queries, every rule evaluated in memory; conflicts are logged
+      # by a background task
       valid, message = AppointmentService.validate_appointment_booking(
-          doctor_id, patient_id, appointment_date, appointment_time, exclude_appointment_id
+          doctor_id, patient_id, appointment_date, appointment_time, exclude_appointment_id,
+          user_id=current_user.id
       )
       
       if valid:
@@ -112,6 +116,7 @@ def get_conflict_analytics():
 
 @appointments_bp.route('/bulk-availability', methods=['POST'])
 @login_required
+@query_budget(4)
 def get_bulk_availability():
   """
   Get availability for multiple doctors at once
@@ -126,41 +131,31 @@ def get_bulk_availability():
       if not doctor_ids:
           return jsonify({'error': 'doctor_ids are required'}), 400
       
-      availability_data = {}
+      doctor_ids = [int(doctor_id) for doctor_id in doctor_ids]
+      
+      # Cached per doctor; hits come back in one round trip and the missing
+      # doctors are read from the schedule index (SQL only for unindexed days)
+      doctors = CachedDoctor.get_doctors_with_details(doctor_ids)
+      slots_by_doctor = CachedDoctor.get_bulk_availability(list(doctors), start_date, end_date)
       
+      availability_data = {}
       for doctor_id in doctor_ids:
-          doctor = Doctor.query.get(doctor_id)
+          doctor = doctors.get(doctor_id)
           if not doctor:
             continue
           
-          # Get availability slots
-          availability_slots = DoctorAvailability.query.filter(
-              DoctorAvailability.doctor_id == doctor_id,
-              DoctorAvailability.date >= start_date,
-              DoctorAvailability.date <= end_date,
-              DoctorAvailability.is_available == True
-          ).order_by(DoctorAvailability.date.asc(), DoctorAvailability.start_time.asc()).all()
-          
           available_slots = []
-          for slot in availability_slots:
-              # Check current bookings
-              appointment_count = Appointment.query.filter(
-                Appointment.doctor_id == doctor_id,
-                Appointment.appointment_date == slot.date,
-                Appointment.appointment_time == slot.start_time,
-                Appointment.status.in_(['scheduled', 'completed'])
-              ).count()
-              
-              if appointment_count < slot.max_patients:
+          for slot in slots_by_doctor.get(doctor_id, []):
+              if slot['current_appointments'] < slot['max_patients']:
                   available_slots.append({
-                    'date': slot.date.isoformat(),
-                    'start_time': slot.start_time.strftime('%H:%M'),
-                    'end_time': slot.end_time.strftime('%H:%M'),
-                    'available_slots': slot.max_patients - appointment_count
+                    'date': slot['date'],
+                    'start_time': slot['start_time'],
+                    'end_time': slot['end_time'],
+                    'available_slots': slot['max_patients'] - slot['current_appointments']
                   })
           
           availability_data[doctor_id] = {
-            'doctor_name': doctor.user.username,
+            'doctor_name': doctor.name,
             'specialization': doctor.specialization,
             'available_slots': available_slots
           }
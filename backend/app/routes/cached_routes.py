@@ -4,10 +4,21 @@ from app.services.cache_service import cache_service, cached, invalidate_cache
 from app.utils.cache_keys import CacheKeys
 from app.models.cached_models import CachedDoctor, CachedPatient, CachedStats
 from app.utils.decorators import admin_required, doctor_required, patient_required
+from datetime import datetime, timedelta
 import time
 
 cached_bp = Blueprint('cached', __name__)
 
+@cached_bp.before_request
+def require_login():
+  """
+  Every cached route needs a logged-in user (the cache management routes
+  additionally check for an admin), so a route added without
+  @login_required is still never public
+  """
+  if not current_user.is_authenticated:
+      return jsonify({'error': 'Authentication required'}), 401
+
 @cached_bp.route('/doctors', methods=['GET'])
 @login_required
 def get_doctors_cached():
@@ -27,10 +38,10 @@ def get_doctors_cached():
       for doctor in doctors:
           result.append({
               'id': doctor.id,
-              'name': doctor.user.username,
-              'email': doctor.user.email,
+              'name': doctor.name,
+              'email': doctor.email,
               'specialization': doctor.specialization,
-              'department': doctor.department.name,
+              'department': doctor.department_name,
               'qualification': doctor.qualification,
               'experience': doctor.experience,
               'consultation_fee': doctor.consultation_fee,
@@ -74,10 +85,10 @@ def get_doctor_detail_cached(doctor_id):
       result = {
           'doctor': {
               'id': doctor.id,
-              'name': doctor.user.username,
-              'email': doctor.user.email,
+              'name': doctor.name,
+              'email': doctor.email,
               'specialization': doctor.specialization,
-              'department': doctor.department.name,
+              'department': doctor.department_name,
               'qualification': doctor.qualification,
               'experience': doctor.experience,
               'consultation_fee': doctor.consultation_fee,
@@ -203,12 +214,16 @@ def clear_cache():
       data = request.get_json()
       pattern = data.get('pattern', '*')
       
-      if pattern == '*':
-          # Clear all cache
-          cache_service.delete_pattern('*')
-      else:
-          # Clear specific pattern
-          cache_service.delete_pattern(pattern)
+      if not cache_service.is_connected():
+          return jsonify({'error': 'Cache is not available', 'success': False}), 503
+      
+      # Namespaces and entity scopes are cleared by bumping their
+      # generation; other patterns fall back to a SCAN-based delete
+      if not cache_service.invalidate(pattern):
+          return jsonify({
+              'error': f'Cache could not be cleared for pattern: {pattern}',
+              'success': False
+          }), 400
       
       return jsonify({
           'message': f'Cache cleared for pattern: {pattern}',
@@ -230,26 +245,52 @@ def get_cache_stats():
       
       return jsonify({
           'cache_stats': stats,
-          'redis_connected': cache_service.is_connected()
+          'redis_connected': bool(stats),
+          'health': cache_service.health()
       }), 200
       
   except Exception as e:
       return jsonify({'error': str(e)}), 500
 
+@cached_bp.route('/cache/metrics', methods=['GET'])
+@login_required
+@admin_required
+def get_cache_metrics():
+  """
+  Per-namespace hit/miss/latency/byte counters of this process (Admin only).
+  ?keys=1 adds DBSIZE/SCAN-sampled key counts per namespace.
+  """
+  try:
+      result = cache_service.metrics.snapshot()
+      result['local_cache'] = cache_service.local_cache.stats()
+      result['budgets'] = cache_service.budget_usage()
+      
+      if request.args.get('keys', type=int):
+          result['key_counts'] = cache_service.estimate_key_counts(
+              sample_size=min(request.args.get('sample', 1000, type=int), 10000)
+          )
+      
+      return jsonify({'cache_metrics': result}), 200
+      
+  except Exception as e:
+      return jsonify({'error': str(e)}), 500
+
 @cached_bp.route('/cache/health', methods=['GET'])
+@login_required
+@admin_required
 def cache_health():
   """
-  Cache health check endpoint
+  Cache health check endpoint (Admin only). Reports the circuit breaker state, so it
+  never blocks on an unreachable Redis.
   """
   try:
-      is_healthy = cache_service.is_connected()
-      stats = cache_service.get_cache_stats() if is_healthy else {}
+      health = cache_service.health()
       
       return jsonify({
-          'status': 'healthy' if is_healthy else 'unhealthy',
-          'redis_connected': is_healthy,
-          'stats': stats
-      }), 200
+          'status': health['status'],
+          'redis_connected': health['status'] != 'unhealthy',
+          'health': health
+      }), 200 if health['status'] != 'unhealthy' else 503
       
   except Exception as e:
-      return jsonify({'error': str(e)}), 500
\ No newline at end of file
+      return jsonify({'error': str(e)}), 500
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy import func
 from app.models import User, Doctor, Patient, Appointment, Treatment, DoctorAvailability, db
-from app.utils.decorators import doctor_required
+from app.utils.decorators import doctor_required, query_budget
 from datetime import datetime, timedelta, date
 import json
 
@@ -266,15 +267,28 @@ def add_treatment(appointment_id):
 @doctor_bp.route('/patients', methods=['GET'])
 @login_required
 @doctor_required
+@query_budget(4)
 def get_patients():
   try:
       doctor = current_user.doctor_profile
       search = request.args.get('search', '')
       
-      # Get unique patients who have appointments with this doctor
-      query = db.session.query(Patient).join(Appointment).filter(
+      # Last visit and visit count per patient of this doctor, in one grouped query
+      visits = db.session.query(
+          Appointment.patient_id.label('patient_id'),
+          func.max(Appointment.appointment_date).label('last_visit'),
+          func.count(Appointment.id).label('total_visits')
+      ).filter(
           Appointment.doctor_id == doctor.id
-      ).distinct()
+      ).group_by(Appointment.patient_id).subquery()
+      
+      query = db.session.query(
+          Patient, User.email, visits.c.last_visit, visits.c.total_visits
+      ).join(
+          visits, visits.c.patient_id == Patient.id
+      ).join(
+          User, Patient.user_id == User.id
+      )
       
       if search:
         query = query.filter(
@@ -283,30 +297,21 @@ def get_patients():
           (Patient.phone.ilike(f'%{search}%'))
         )
       
-      patients = query.all()
+      rows = query.all()
       
       result = []
-      for patient in patients:
-          # Get last appointment date
-          last_appointment = Appointment.query.filter_by(
-              patient_id=patient.id,
-              doctor_id=doctor.id
-          ).order_by(Appointment.appointment_date.desc()).first()
-          
+      for patient, email, last_visit, total_visits in rows:
           result.append({
               'id': patient.id,
               'first_name': patient.first_name,
               'last_name': patient.last_name,
-              'email': patient.user.email,
+              'email': email,
               'phone': patient.phone,
               'date_of_birth': patient.date_of_birth.isoformat() if patient.date_of_birth else None,
               'gender': patient.gender,
               'blood_group': patient.blood_group,
-              'last_visit': last_appointment.appointment_date.isoformat() if last_appointment else None,
-              'total_visits': Appointment.query.filter_by(
-                  patient_id=patient.id,
-                  doctor_id=doctor.id
-              ).count()
+              'last_visit': last_visit.isoformat() if last_visit else None,
+              'total_visits': total_visits
           })
       
       return jsonify({'patients': result}), 200
@@ -387,22 +392,14 @@ def get_availability():
       
       result = []
       for slot in availability:
-          # Check if slot has appointments
-          appointment_count = Appointment.query.filter(
-              Appointment.doctor_id == doctor.id,
-              Appointment.appointment_date == slot.date,
-              Appointment.appointment_time == slot.start_time,
-              Appointment.status.in_(['scheduled', 'completed'])
-          ).count()
-          
           result.append({
               'id': slot.id,
               'date': slot.date.isoformat(),
               'start_time': slot.start_time.strftime('%H:%M'),
               'end_time': slot.end_time.strftime('%H:%M'),
-              'is_available': slot.is_available and appointment_count < slot.max_patients,
+              'is_available': slot.is_available and slot.booked_count < slot.max_patients,
               'max_patients': slot.max_patients,
-              'current_appointments': appointment_count
+              'current_appointments': slot.booked_count
           })
       
       return jsonify({'availability': result}), 200
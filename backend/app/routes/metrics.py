@@ -0,0 +1,20 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+from app.services import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+  """
+  Prometheus scrape endpoint. When METRICS_TOKEN is configured the scraper
+  must send it as a bearer token.
+  """
+  token = current_app.config.get('METRICS_TOKEN')
+  if token and request.headers.get('Authorization') != f'Bearer {token}':
+      return jsonify({'error': 'Access denied'}), 403
+  
+  if not metrics.enabled():
+      return jsonify({'error': 'prometheus_client is not installed'}), 503
+  
+  body, content_type = metrics.render_latest()
+  return Response(body, content_type=content_type)
@@ -1,7 +1,11 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from app.models import User, Doctor, Patient, Appointment, Treatment, DoctorAvailability, Department, db
-from app.utils.decorators import patient_required
+from app.models.cached_models import CachedDoctor
+from app.models.read_models import load_department_views, load_doctor_view, load_doctor_views
+from app.services.appointment_service import AppointmentService
+from app.services.schedule_index import schedule_index
+from app.utils.decorators import patient_required, query_budget
 from datetime import datetime, timedelta, date
 import json
 
@@ -59,49 +63,40 @@ def dashboard_stats():
 @patient_bp.route('/doctors', methods=['GET'])
 @login_required
 @patient_required
+@query_budget(4)
 def get_doctors():
   try:
       search = request.args.get('search', '')
       specialization = request.args.get('specialization', '')
       department_id = request.args.get('department_id', type=int)
       
-      query = Doctor.query.join(User).join(Department).filter(Doctor.is_available == True)
-      
-      if search:
-          query = query.filter(
-              (User.username.ilike(f'%{search}%')) |
-              (Doctor.specialization.ilike(f'%{search}%')) |
-              (Department.name.ilike(f'%{search}%'))
-          )
-      
-      if specialization:
-          query = query.filter(Doctor.specialization.ilike(f'%{specialization}%'))
-      
-      if department_id:
-          query = query.filter(Doctor.department_id == department_id)
+      doctors = load_doctor_views(
+          search=search,
+          department_id=department_id,
+          specialization=specialization
+      )
       
-      doctors = query.all()
+      # Next available date per listed doctor: cached hits in one MGET, one
+      # grouped query for the rest
+      next_available_dates = CachedDoctor.get_next_available_dates(
+          [doctor.id for doctor in doctors], datetime.now().date()
+      )
       
       result = []
       for doctor in doctors:
-          # Get next available slot
-          next_available = DoctorAvailability.query.filter(
-              DoctorAvailability.doctor_id == doctor.id,
-              DoctorAvailability.date >= datetime.now().date(),
-              DoctorAvailability.is_available == True
-          ).order_by(DoctorAvailability.date.asc(), DoctorAvailability.start_time.asc()).first()
+          next_available = next_available_dates.get(doctor.id)
           
           result.append({
               'id': doctor.id,
-              'name': doctor.user.username,
-              'email': doctor.user.email,
+              'name': doctor.name,
+              'email': doctor.email,
               'specialization': doctor.specialization,
-              'department': doctor.department.name,
+              'department': doctor.department_name,
               'qualification': doctor.qualification,
               'experience': doctor.experience,
               'consultation_fee': doctor.consultation_fee,
               'bio': doctor.bio,
-              'next_available': next_available.date.isoformat() if next_available else None,
+              'next_available': next_available.isoformat() if next_available else None,
               'rating': 4.5  # Placeholder for future rating system
           })
       
@@ -115,44 +110,35 @@ def get_doctors():
 @patient_required
 def get_doctor_detail(doctor_id):
   try:
-      doctor = Doctor.query.filter_by(id=doctor_id, is_available=True).first_or_404()
+      doctor = load_doctor_view(doctor_id, available_only=True)
+      if not doctor:
+          return jsonify({'error': 'Doctor not found'}), 404
       
       # Get availability for next 7 days
       start_date = datetime.now().date()
       end_date = start_date + timedelta(days=7)
       
-      availability = DoctorAvailability.query.filter(
-          DoctorAvailability.doctor_id == doctor_id,
-          DoctorAvailability.date >= start_date,
-          DoctorAvailability.date <= end_date,
-          DoctorAvailability.is_available == True
-      ).order_by(DoctorAvailability.date.asc(), DoctorAvailability.start_time.asc()).all()
+      # Read from the schedule index; SQL only for days it does not hold yet
+      availability = schedule_index.availability([doctor_id], start_date, end_date)[doctor_id]
       
       available_slots = []
       for slot in availability:
-          # Check if slot is fully booked
-          appointment_count = Appointment.query.filter(
-              Appointment.doctor_id == doctor_id,
-              Appointment.appointment_date == slot.date,
-              Appointment.appointment_time == slot.start_time,
-              Appointment.status.in_(['scheduled', 'completed'])
-          ).count()
-          
-          if appointment_count < slot.max_patients:
+          # Skip fully booked slots
+          if slot['current_appointments'] < slot['max_patients']:
               available_slots.append({
-                  'date': slot.date.isoformat(),
-                  'start_time': slot.start_time.strftime('%H:%M'),
-                  'end_time': slot.end_time.strftime('%H:%M'),
-                  'available_slots': slot.max_patients - appointment_count
+                  'date': slot['date'],
+                  'start_time': slot['start_time'],
+                  'end_time': slot['end_time'],
+                  'available_slots': slot['max_patients'] - slot['current_appointments']
               })
       
       return jsonify({
           'doctor': {
               'id': doctor.id,
-              'name': doctor.user.username,
-              'email': doctor.user.email,
+              'name': doctor.name,
+              'email': doctor.email,
               'specialization': doctor.specialization,
-              'department': doctor.department.name,
+              'department': doctor.department_name,
               'qualification': doctor.qualification,
               'experience': doctor.experience,
               'consultation_fee': doctor.consultation_fee,
@@ -232,62 +218,20 @@ def book_appointment():
       appointment_date = datetime.strptime(data['appointment_date'], '%Y-%m-%d').date()
       appointment_time = datetime.strptime(data['appointment_time'], '%H:%M').time()
       
-      # Check if doctor exists and is available
-      doctor = Doctor.query.filter_by(id=doctor_id, is_available=True).first()
-      if not doctor:
-          return jsonify({'error': 'Doctor not available'}), 400
-      
-      # Check if the requested slot is available
-      availability_slot = DoctorAvailability.query.filter(
-          DoctorAvailability.doctor_id == doctor_id,
-          DoctorAvailability.date == appointment_date,
-          DoctorAvailability.start_time == appointment_time,
-          DoctorAvailability.is_available == True
-      ).first()
-      
-      if not availability_slot:
-          return jsonify({'error': 'Selected time slot is not available'}), 400
-      
-      # Check if slot is fully booked
-      existing_appointments = Appointment.query.filter(
-          Appointment.doctor_id == doctor_id,
-          Appointment.appointment_date == appointment_date,
-          Appointment.appointment_time == appointment_time,
-          Appointment.status.in_(['scheduled', 'completed'])
-      ).count()
-      
-      if existing_appointments >= availability_slot.max_patients:
-          return jsonify({'error': 'Selected time slot is fully booked'}), 400
-      
-      # Check if patient already has an appointment at the same time
-      patient_conflict = Appointment.query.filter(
-          Appointment.patient_id == patient.id,
-          Appointment.appointment_date == appointment_date,
-          Appointment.appointment_time == appointment_time,
-          Appointment.status == 'scheduled'
-      ).first()
-      
-      if patient_conflict:
-          return jsonify({'error': 'You already have an appointment at this time'}), 400
-      
-      # Create appointment
-      appointment = Appointment(
-          patient_id=patient.id,
-          doctor_id=doctor_id,
-          appointment_date=appointment_date,
-          appointment_time=appointment_time,
-          reason=data['reason'],
-          status='scheduled'
+      # Reserve the slot, validate (doctor, slot, patient conflicts, booking
+      # window) and create the appointment in one transaction; concurrent
+      # bookings cannot overbook the slot
+      appointment, error = AppointmentService.book_appointment(
+          patient.id, doctor_id, appointment_date, appointment_time, data['reason'], user_id=current_user.id
       )
-      
-      db.session.add(appointment)
-      db.session.commit()
+      if error:
+          return jsonify({'error': error}), 400
       
       return jsonify({
           'message': 'Appointment booked successfully',
           'appointment': {
               'id': appointment.id,
-              'doctor_name': doctor.user.username,
+              'doctor_name': appointment.doctor.user.username,
               'appointment_date': appointment.appointment_date.isoformat(),
               'appointment_time': appointment.appointment_time.strftime('%H:%M'),
               'status': appointment.status
@@ -326,30 +270,13 @@ def update_appointment(appointment_id):
           new_date = datetime.strptime(data['appointment_date'], '%Y-%m-%d').date()
           new_time = datetime.strptime(data['appointment_time'], '%H:%M').time()
           
-          # Check new slot availability
-          availability_slot = DoctorAvailability.query.filter(
-              DoctorAvailability.doctor_id == appointment.doctor_id,
-              DoctorAvailability.date == new_date,
-              DoctorAvailability.start_time == new_time,
-              DoctorAvailability.is_available == True
-          ).first()
-          
-          if not availability_slot:
-              return jsonify({'error': 'Selected time slot is not available'}), 400
-          
-          # Check if new slot is available
-          existing_appointments = Appointment.query.filter(
-              Appointment.doctor_id == appointment.doctor_id,
-              Appointment.appointment_date == new_date,
-              Appointment.appointment_time == new_time,
-              Appointment.status.in_(['scheduled', 'completed'])
-          ).count()
-          
-          if existing_appointments >= availability_slot.max_patients:
-              return jsonify({'error': 'Selected time slot is fully booked'}), 400
-          
-          appointment.appointment_date = new_date
-          appointment.appointment_time = new_time
+          # Takes a place in the new slot atomically and validates the move
+          moved, error = AppointmentService.reschedule_appointment(
+              appointment, new_date, new_time, user_id=current_user.id
+          )
+          if not moved:
+              db.session.rollback()
+              return jsonify({'error': error}), 400
       
       appointment.updated_at = datetime.utcnow()
       db.session.commit()
@@ -477,20 +404,15 @@ def get_medical_history():
 @patient_required
 def get_departments():
   try:
-      departments = Department.query.all()
+      departments = load_department_views(with_doctor_counts=True, available_only=True)
       
       result = []
       for dept in departments:
-          doctor_count = Doctor.query.filter_by(
-              department_id=dept.id,
-              is_available=True
-          ).count()
-          
           result.append({
               'id': dept.id,
               'name': dept.name,
               'description': dept.description,
-              'doctor_count': doctor_count
+              'doctor_count': dept.doctor_count
           })
       
       return jsonify({'departments': result}), 200
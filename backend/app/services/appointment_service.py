@@ -1,98 +1,166 @@
 from datetime import datetime, timedelta, time
-from app.models import Appointment, DoctorAvailability, ConflictLog, AppointmentHistory, db
+from app.models import Appointment, Doctor, DoctorAvailability, ConflictLog, AppointmentHistory, db
+from app.utils.booking_counts import BOOKED_STATUSES, reserve_slot
+from flask import current_app
 from flask_login import current_user
+from sqlalchemy import and_
+from sqlalchemy.exc import OperationalError
 import json
+import logging
+import random
+import time as time_module
+
+logger = logging.getLogger(__name__)
+
+def _is_transient_conflict(error):
+  """Lock contention the transaction can simply be retried after"""
+  original = getattr(error, 'orig', None)
+  # PostgreSQL serialization failure / deadlock
+  if getattr(original, 'pgcode', None) in ('40001', '40P01'):
+    return True
+  # MySQL deadlock / lock wait timeout
+  if getattr(original, 'args', None) and original.args[0] in (1205, 1213):
+    return True
+  # SQLite busy writer
+  return 'database is locked' in str(original or error)
+
+def _with_retries(operation):
+  """
+  Run operation() (which commits or rolls back itself) and retry it after a
+  rollback when it fails on transient lock contention, with jittered
+  exponential backoff, at most BOOKING_MAX_RETRIES times
+  """
+  retries = current_app.config.get('BOOKING_MAX_RETRIES', 3)
+  base_delay = current_app.config.get('BOOKING_RETRY_BASE_DELAY', 0.05)
+  attempt = 0
+  while True:
+    try:
+      return operation()
+    except OperationalError as e:
+      db.session.rollback()
+      if attempt >= retries or not _is_transient_conflict(e):
+        raise
+      attempt += 1
+      logger.info(f"Booking hit lock contention, retry {attempt}/{retries}: {e.orig}")
+      time_module.sleep(base_delay * (2 ** (attempt - 1)) * (0.5 + random.random()))
+
+# Minimum gap between a patient's appointments on the same day
+PATIENT_BUFFER = timedelta(hours=2)
+BOOKING_HORIZON = timedelta(days=90)
+
+# Booking rules, evaluated in order by BookingContext.violation(). Each takes
+# the context and returns None or (conflict type to log or None, message).
+
+def _doctor_rule(context):
+  if not context.doctor_available:
+    return ('doctor_unavailable', "Doctor is not available")
+
+def _slot_rule(context):
+  if not context.slot_open:
+    return ('doctor_unavailable', "Doctor is not available at this time slot")
+
+def _capacity_rule(context):
+  if context.slot_occupancy() >= context.max_patients:
+    return ('doctor_unavailable', "This time slot is fully booked")
+
+def _same_time_rule(context):
+  if any(at == context.appointment_time for at in context.scheduled_times()):
+    return ('patient_conflict', "You already have an appointment scheduled at this time")
+
+def _buffer_rule(context):
+  requested = datetime.combine(context.appointment_date, context.appointment_time)
+  for at in context.scheduled_times():
+    if abs(datetime.combine(context.appointment_date, at) - requested) <= PATIENT_BUFFER:
+      return ('patient_conflict', "You have another appointment within 2 hours of this time")
+
+def _booking_window_rule(context):
+  requested = datetime.combine(context.appointment_date, context.appointment_time)
+  if requested < datetime.now():
+    return (None, "Cannot book appointments in the past")
+  if requested > datetime.now() + BOOKING_HORIZON:
+    return (None, "Cannot book appointments more than 3 months in advance")
+
+SLOT_RULES = (_slot_rule, _capacity_rule)
+BOOKING_RULES = (_doctor_rule,) + SLOT_RULES + (_same_time_rule, _buffer_rule, _booking_window_rule)
+
+class BookingContext:
+  """
+  Everything the booking rules look at, loaded in two queries: the doctor
+  joined to the requested slot, and the patient's booked appointments that
+  day (the appointment being rescheduled is excluded from the conflicts)
+  """
+  def __init__(self, doctor_id, patient_id, appointment_date, appointment_time, exclude_appointment_id=None):
+    self.doctor_id = doctor_id
+    self.patient_id = patient_id
+    self.appointment_date = appointment_date
+    self.appointment_time = appointment_time
+    self.exclude_appointment_id = int(exclude_appointment_id) if exclude_appointment_id else None
+    self.doctor_available = False
+    self.slot_open = False
+    self.max_patients = 0
+    self.booked_count = 0
+    self.same_day = []
+
+  @classmethod
+  def load(cls, doctor_id, patient_id, appointment_date, appointment_time, exclude_appointment_id=None):
+    context = cls(doctor_id, patient_id, appointment_date, appointment_time, exclude_appointment_id)
+
+    row = db.session.query(
+      Doctor.is_available,
+      DoctorAvailability.is_available,
+      DoctorAvailability.max_patients,
+      DoctorAvailability.booked_count
+    ).outerjoin(DoctorAvailability, and_(
+      DoctorAvailability.doctor_id == Doctor.id,
+      DoctorAvailability.date == appointment_date,
+      DoctorAvailability.start_time == appointment_time
+    )).filter(Doctor.id == doctor_id).first()
+    if row:
+      context.doctor_available = bool(row[0])
+      context.slot_open = bool(row[1])
+      context.max_patients = row[2] or 0
+      context.booked_count = row[3] or 0
+
+    context.same_day = db.session.query(
+      Appointment.id, Appointment.doctor_id, Appointment.appointment_time, Appointment.status
+    ).filter(
+      Appointment.patient_id == patient_id,
+      Appointment.appointment_date == appointment_date,
+      Appointment.status.in_(BOOKED_STATUSES)
+    ).all()
+    return context
+
+  def scheduled_times(self):
+    """Times of the patient's other scheduled appointments that day"""
+    return [at for appointment_id, _, at, status in self.same_day
+            if status == 'scheduled' and appointment_id != self.exclude_appointment_id]
+
+  def slot_occupancy(self):
+    """Booked places in the slot, without the appointment being rescheduled"""
+    occupancy = self.booked_count
+    for appointment_id, doctor_id, at, _ in self.same_day:
+      if appointment_id == self.exclude_appointment_id and (doctor_id, at) == (self.doctor_id, self.appointment_time):
+        occupancy -= 1
+    return occupancy
+
+  def violation(self, slot_reserved=False, needs_place=True):
+    """
+    The first broken rule as (conflict type or None, message), else None.
+    A slot already taken with reserve_slot() skips the slot rules: the
+    reservation enforced them.
+    """
+    for rule in BOOKING_RULES:
+      if rule in SLOT_RULES and slot_reserved:
+        continue
+      if rule is _capacity_rule and not needs_place:
+        continue
+      result = rule(self)
+      if result:
+        return result
+    return None
 
 class AppointmentService:
   
-  @staticmethod
-  def check_doctor_availability(doctor_id, appointment_date, appointment_time):
-      """
-      Check if doctor is available at the requested time slot
-      """
-      try:
-          # Check if doctor has availability for the date and time
-          availability_slot = DoctorAvailability.query.filter(
-            DoctorAvailability.doctor_id == doctor_id,
-            DoctorAvailability.date == appointment_date,
-            DoctorAvailability.start_time == appointment_time,
-            DoctorAvailability.is_available == True
-          ).first()
-          
-          if not availability_slot:
-              return False, "Doctor is not available at this time slot"
-          
-          # Check if slot is fully booked
-          existing_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.appointment_date == appointment_date,
-            Appointment.appointment_time == appointment_time,
-            Appointment.status.in_(['scheduled', 'completed'])
-          ).count()
-          
-          if existing_appointments >= availability_slot.max_patients:
-            return False, "This time slot is fully booked"
-          
-          return True, "Slot available"
-          
-      except Exception as e:
-          return False, f"Error checking availability: {str(e)}"
-  
-  @staticmethod
-  def check_patient_conflicts(patient_id, appointment_date, appointment_time, exclude_appointment_id=None):
-      """
-      Check if patient has any scheduling conflicts
-      """
-      try:
-          # Check if patient already has an appointment at the same time
-          query = Appointment.query.filter(
-            Appointment.patient_id == patient_id,
-            Appointment.appointment_date == appointment_date,
-            Appointment.appointment_time == appointment_time,
-            Appointment.status == 'scheduled'
-          )
-          
-          if exclude_appointment_id:
-            query = query.filter(Appointment.id != exclude_appointment_id)
-          
-          conflicting_appointment = query.first()
-          
-          if conflicting_appointment:
-            return False, "You already have an appointment scheduled at this time"
-          
-          # Check if patient has appointments within 2 hours before or after
-          appointment_datetime = datetime.combine(appointment_date, appointment_time)
-          time_buffer = timedelta(hours=2)
-          
-          start_time = appointment_datetime - time_buffer
-          end_time = appointment_datetime + time_buffer
-          
-          # Convert back to time for query
-          start_time_only = start_time.time()
-          end_time_only = end_time.time()
-          
-          time_conflict_query = Appointment.query.filter(
-            Appointment.patient_id == patient_id,
-            Appointment.appointment_date == appointment_date,
-            Appointment.status == 'scheduled'
-          )
-          
-          if exclude_appointment_id:
-            time_conflict_query = time_conflict_query.filter(Appointment.id != exclude_appointment_id)
-          
-          time_conflicts = time_conflict_query.filter(
-              ((Appointment.appointment_time >= start_time_only) & 
-                (Appointment.appointment_time <= end_time_only))
-          ).all()
-          
-          if time_conflicts:
-            return False, "You have another appointment within 2 hours of this time"
-          
-          return True, "No conflicts found"
-          
-      except Exception as e:
-        return False, f"Error checking patient conflicts: {str(e)}"
-  
   @staticmethod
   def log_conflict(conflict_type, user_id, attempted_date, attempted_time, doctor_id=None, patient_id=None, resolved=False):
       """
@@ -114,7 +182,7 @@ class AppointmentService:
         return True
       except Exception as e:
         db.session.rollback()
-        print(f"Error logging conflict: {str(e)}")
+        current_app.logger.exception(f"Error logging conflict ({conflict_type})")
         return False
   
   @staticmethod
@@ -137,55 +205,109 @@ class AppointmentService:
           return True
       except Exception as e:
           db.session.rollback()
-          print(f"Error logging appointment history: {str(e)}")
+          current_app.logger.exception(f"Error logging appointment history for appointment {appointment_id}")
           return False
   
   @staticmethod
-  def validate_appointment_booking(doctor_id, patient_id, appointment_date,appointment_time, exclude_appointment_id=None):
+  def validate_appointment_booking(doctor_id, patient_id, appointment_date,appointment_time, exclude_appointment_id=None, user_id=None):
       """
-      Comprehensive validation for appointment booking
+      Comprehensive validation for appointment booking: loads the booking
+      context in two queries and evaluates every rule in memory. Conflicts
+      are logged by a background task.
       """
-      # Check doctor availability
-      available, message = AppointmentService.check_doctor_availability(
-          doctor_id, appointment_date, appointment_time
-      )
-      if not available:
-          AppointmentService.log_conflict(
-            'doctor_unavailable',
-            patient_id,
-            appointment_date,
-            appointment_time,
-            doctor_id=doctor_id,
-            patient_id=patient_id
-          )
-          return False, message
-      
-      # Check patient conflicts
-      conflict_free, message = AppointmentService.check_patient_conflicts(
-          patient_id, appointment_date, appointment_time, exclude_appointment_id
-      )
-      if not conflict_free:
-          AppointmentService.log_conflict(
-            'patient_conflict',
-            patient_id,
-            appointment_date,
-            appointment_time,
+      context = BookingContext.load(doctor_id, patient_id, appointment_date, appointment_time, exclude_appointment_id)
+      violation = context.violation()
+      if violation:
+          AppointmentService.defer_conflict_log(violation, context, user_id)
+          return False, violation[1]
+      return True, "Validation successful"
+  
+  @staticmethod
+  def defer_conflict_log(violation, context, user_id=None):
+      """Hand a rule violation that counts as a scheduling conflict to the conflict log task"""
+      conflict_type = violation[0]
+      if conflict_type is None or not current_app.config.get('CONFLICT_LOG_ENABLED', True):
+          return
+      if user_id is None:
+          user_id = getattr(current_user, 'id', None) if getattr(current_user, 'is_authenticated', False) else None
+      try:
+          from celery_worker.tasks import log_scheduling_conflict
+          log_scheduling_conflict.delay({
+            'conflict_type': conflict_type,
+            'user_id': user_id,
+            'attempted_date': context.appointment_date.isoformat(),
+            'attempted_time': context.appointment_time.strftime('%H:%M:%S'),
+            'doctor_id': context.doctor_id,
+            'patient_id': context.patient_id
+          })
+      except Exception as e:
+          logger.error(f"Error scheduling conflict log ({conflict_type}): {str(e)}")
+  
+  @staticmethod
+  def book_appointment(patient_id, doctor_id, appointment_date, appointment_time, reason, user_id=None):
+      """
+      Book a slot atomically: reserve a place with a conditional UPDATE on
+      the slot counter, validate the booking context, insert and commit,
+      all in one transaction that is retried on lock contention.
+      Returns (appointment, None) or (None, error message).
+      """
+      def attempt():
+          appointment = Appointment(
+            patient_id=patient_id,
             doctor_id=doctor_id,
-            patient_id=patient_id
+            appointment_date=appointment_date,
+            appointment_time=appointment_time,
+            reason=reason,
+            status='scheduled'
           )
-          return False, message
+          reserved = reserve_slot(db.session, doctor_id, appointment_date, appointment_time, appointment)
+          
+          # With the slot row locked until commit, no other booking of the
+          # slot can interleave with these checks and the insert
+          context = BookingContext.load(doctor_id, patient_id, appointment_date, appointment_time)
+          violation = context.violation(slot_reserved=reserved)
+          if violation is None and not reserved:
+              # Filled up between the context load and the reservation
+              violation = ('doctor_unavailable', "This time slot is fully booked")
+          if violation:
+              db.session.rollback()
+              AppointmentService.defer_conflict_log(violation, context, user_id)
+              return None, violation[1]
+          
+          db.session.add(appointment)
+          db.session.commit()
+          return appointment, None
       
-      # Check if appointment is in the future
-      appointment_datetime = datetime.combine(appointment_date, appointment_time)
-      if appointment_datetime < datetime.now():
-          return False, "Cannot book appointments in the past"
+      return _with_retries(attempt)
+  
+  @staticmethod
+  def reschedule_appointment(appointment, new_date, new_time, user_id=None):
+      """
+      Move an appointment to another slot of its doctor, reserving the new
+      place atomically (the old place is released by the booked_count
+      listener) and validating the move like a booking. The caller commits.
+      Returns (True, None) or (False, error message).
+      """
+      if (new_date, new_time) == (appointment.appointment_date, appointment.appointment_time):
+          return True, None
       
-      # Check if within reasonable future (e.g., 3 months)
-      max_future_date = datetime.now() + timedelta(days=90)
-      if appointment_datetime > max_future_date:
-        return False, "Cannot book appointments more than 3 months in advance"
+      # Only booked appointments occupy a place in the new slot
+      reserved = appointment.status in BOOKED_STATUSES and reserve_slot(
+          db.session, appointment.doctor_id, new_date, new_time, appointment
+      )
+      context = BookingContext.load(
+          appointment.doctor_id, appointment.patient_id, new_date, new_time, exclude_appointment_id=appointment.id
+      )
+      violation = context.violation(slot_reserved=reserved, needs_place=appointment.status in BOOKED_STATUSES)
+      if violation is None and appointment.status in BOOKED_STATUSES and not reserved:
+          violation = ('doctor_unavailable', "This time slot is fully booked")
+      if violation:
+          AppointmentService.defer_conflict_log(violation, context, user_id)
+          return False, violation[1]
       
-      return True, "Validation successful"
+      appointment.appointment_date = new_date
+      appointment.appointment_time = new_time
+      return True, None
   
   @staticmethod
   def get_appointment_history(appointment_id):
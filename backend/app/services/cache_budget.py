@@ -0,0 +1,190 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import defaultdict, namedtuple
+from redis.exceptions import ResponseError
+from app.utils.cache_keys import CacheKeys
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('lru', 'lfu', 'ttl')
+
+_SIZE_UNITS = {'': 1, 'b': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3}
+
+NamespaceBudget = namedtuple('NamespaceBudget', ['limit_bytes', 'policy'])
+
+def parse_size(value):
+  """Parse 65536, '64kb', '64MB' or '1.5gb' into bytes"""
+  if isinstance(value, (int, float)):
+    return int(value)
+  match = re.fullmatch(r'\s*([\d.]+)\s*([kmg]?b?)\s*', str(value).lower())
+  if not match:
+    raise ValueError(f"Invalid cache budget size: {value!r}")
+  return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+def parse_budgets(spec, default_policy='lru'):
+  """
+  Parse namespace budgets from a dict {'doctors': '64mb'} or a string such as
+  "doctors=64mb:lfu,stats=8mb" (policy defaults to default_policy)
+  """
+  if not spec:
+    return {}
+  if isinstance(spec, dict):
+    items = spec.items()
+  else:
+    items = [item.split('=', 1) for item in str(spec).split(',') if item.strip()]
+
+  budgets = {}
+  for namespace, value in items:
+    namespace = namespace.strip()
+    size, _, policy = str(value).partition(':')
+    policy = (policy or default_policy).strip().lower()
+    if namespace not in CacheKeys.NAMESPACES:
+      raise ValueError(f"Unknown cache namespace in budget: {namespace!r}")
+    if policy not in POLICIES:
+      raise ValueError(f"Unknown cache eviction policy {policy!r} for {namespace}")
+    budgets[namespace] = NamespaceBudget(parse_size(size), policy)
+  return budgets
+
+class CacheBudgets:
+  """
+  Byte accounting and soft limits for cache namespaces.
+
+  For every namespace with a budget, writes record the entry's size in a
+  hash (cache::sizes::<ns>) and its expiry in a sorted set
+  (cache::index::<ns>). enforce() drops expired entries from the accounting
+  and, while the namespace is over its limit, unlinks its own entries until
+  usage is back under SHED_TARGET of the limit:
+    - ttl: soonest-expiring first
+    - lru: longest idle first (OBJECT IDLETIME)
+    - lfu: least frequently used first (OBJECT FREQ; needs an LFU
+      maxmemory-policy, otherwise falls back to lru)
+  Namespaces without a budget are not accounted at all.
+  """
+  SHED_TARGET = 0.9
+
+  # Run a budget check after this share of the limit was written by a process
+  CHECK_FRACTION = 0.1
+
+  # Keys inspected per enforcement pass for lru/lfu, as Redis itself samples
+  SAMPLE_SIZE = 5000
+
+  def __init__(self, budgets=None):
+    self.budgets = budgets or {}
+    self._written = defaultdict(int)
+    self._lock = threading.Lock()
+
+  def tracks(self, namespace):
+    return namespace in self.budgets
+
+  def account(self, pipe, namespace, versioned_key, size, expiry_seconds):
+    """Queue the accounting commands for a write on pipe"""
+    expires_at = time.time() + expiry_seconds if expiry_seconds else float('inf')
+    pipe.hset(CacheKeys.namespace_sizes(namespace), versioned_key, size)
+    pipe.zadd(CacheKeys.namespace_index(namespace), {versioned_key: expires_at})
+
+  def forget(self, pipe, namespace, versioned_keys):
+    """Queue removal of deleted keys from the accounting on pipe"""
+    if versioned_keys:
+      pipe.hdel(CacheKeys.namespace_sizes(namespace), *versioned_keys)
+      pipe.zrem(CacheKeys.namespace_index(namespace), *versioned_keys)
+
+  def note_write(self, namespace, size):
+    """Count bytes written by this process; True when a budget check is due"""
+    budget = self.budgets.get(namespace)
+    if budget is None:
+      return False
+    with self._lock:
+      self._written[namespace] += size
+      if self._written[namespace] < budget.limit_bytes * self.CHECK_FRACTION:
+        return False
+      self._written[namespace] = 0
+      return True
+
+  def usage(self, client, namespace):
+    """Bytes currently accounted to namespace, after dropping expired entries"""
+    sizes_key = CacheKeys.namespace_sizes(namespace)
+    index_key = CacheKeys.namespace_index(namespace)
+    now = time.time()
+
+    expired = client.zrangebyscore(index_key, '-inf', now)
+    if expired:
+      pipe = client.pipeline(transaction=False)
+      pipe.hdel(sizes_key, *expired)
+      pipe.zremrangebyscore(index_key, '-inf', now)
+      pipe.execute()
+
+    return sum(int(size) for size in client.hvals(sizes_key))
+
+  def enforce(self, client, namespace):
+    """Shed namespace entries while it is over budget; returns a summary"""
+    budget = self.budgets[namespace]
+    used = self.usage(client, namespace)
+    result = {
+      'namespace': namespace,
+      'policy': budget.policy,
+      'limit_bytes': budget.limit_bytes,
+      'used_bytes': used,
+      'shed_keys': 0,
+      'shed_bytes': 0
+    }
+    if used <= budget.limit_bytes:
+      return result
+
+    target = int(budget.limit_bytes * self.SHED_TARGET)
+    candidates = self._eviction_order(client, namespace, budget.policy)
+    sizes = client.hmget(CacheKeys.namespace_sizes(namespace), candidates) if candidates else []
+
+    victims = []
+    freed = 0
+    for key, size in zip(candidates, sizes):
+      if used - freed <= target:
+        break
+      victims.append(key)
+      freed += int(size or 0)
+
+    for start in range(0, len(victims), 500):
+      batch = victims[start:start + 500]
+      pipe = client.pipeline(transaction=False)
+      pipe.unlink(*batch)
+      self.forget(pipe, namespace, batch)
+      pipe.execute()
+
+    result.update(used_bytes=used - freed, shed_keys=len(victims), shed_bytes=freed)
+    logger.info(f"Cache namespace {namespace} over budget: shed {len(victims)} keys ({freed} bytes)")
+    return result
+
+  def _eviction_order(self, client, namespace, policy):
+    """Accounted keys of namespace, first to evict first"""
+    index_key = CacheKeys.namespace_index(namespace)
+    if policy == 'ttl':
+      return client.zrange(index_key, 0, -1)
+
+    keys = client.zrange(index_key, 0, -1)
+    if len(keys) > self.SAMPLE_SIZE:
+      keys = random.sample(keys, self.SAMPLE_SIZE)
+    if not keys:
+      return []
+
+    if policy == 'lfu':
+      try:
+        frequencies = self._object_values(client, 'freq', keys)
+        # Keys already gone (None) only need their accounting removed
+        return [key for _, key in sorted(
+          zip(frequencies, keys), key=lambda pair: -1 if pair[0] is None else pair[0]
+        )]
+      except ResponseError:
+        logger.warning("OBJECT FREQ unavailable (maxmemory-policy is not LFU); using lru")
+
+    idle_times = self._object_values(client, 'idletime', keys)
+    return [key for _, key in sorted(
+      zip(idle_times, keys), key=lambda pair: float('inf') if pair[0] is None else pair[0], reverse=True
+    )]
+
+  def _object_values(self, client, subcommand, keys):
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+      pipe.object(subcommand, key)
+    return pipe.execute()
@@ -0,0 +1,148 @@
+import json
+import logging
+import pickle
+import zlib
+from datetime import date, datetime, time
+
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+try:
+  import lz4.frame as lz4_frame
+except ImportError:
+  lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+# Header byte 1: payload format
+FORMAT_MSGPACK = b'M'
+FORMAT_JSON = b'J'
+FORMAT_PICKLE = b'P'
+
+# Header byte 2: compression
+COMPRESSION_NONE = b'-'
+COMPRESSION_ZLIB = b'z'
+COMPRESSION_LZ4 = b'4'
+
+# msgpack extension type codes
+EXT_DATETIME = 1
+EXT_DATE = 2
+EXT_TIME = 3
+EXT_SNAPSHOT = 10
+
+# Read-model classes (see app.models.read_models) that msgpack encodes as
+# [class name, field values] instead of falling back to pickle
+SNAPSHOT_TYPES = {}
+
+
+def register_snapshot_type(cls):
+  """Class decorator registering a snapshot type with the codec"""
+  SNAPSHOT_TYPES[cls.__name__] = cls
+  return cls
+
+
+def _msgpack_default(value):
+  """Encode the date/time and snapshot types our cached payloads carry"""
+  if SNAPSHOT_TYPES.get(type(value).__name__) is type(value):
+    packed = msgpack.packb(
+      [type(value).__name__, list(value.to_tuple())],
+      default=_msgpack_default, use_bin_type=True
+    )
+    return msgpack.ExtType(EXT_SNAPSHOT, packed)
+  if isinstance(value, datetime):
+    return msgpack.ExtType(EXT_DATETIME, value.isoformat().encode('ascii'))
+  if isinstance(value, date):
+    return msgpack.ExtType(EXT_DATE, value.isoformat().encode('ascii'))
+  if isinstance(value, time):
+    return msgpack.ExtType(EXT_TIME, value.isoformat().encode('ascii'))
+  raise TypeError(f"Cannot serialize {type(value).__name__} with msgpack")
+
+
+def _msgpack_ext_hook(code, data):
+  if code == EXT_DATETIME:
+    return datetime.fromisoformat(data.decode('ascii'))
+  if code == EXT_DATE:
+    return date.fromisoformat(data.decode('ascii'))
+  if code == EXT_TIME:
+    return time.fromisoformat(data.decode('ascii'))
+  if code == EXT_SNAPSHOT:
+    name, values = msgpack.unpackb(data, raw=False, ext_hook=_msgpack_ext_hook, strict_map_key=False)
+    return SNAPSHOT_TYPES[name].from_tuple(values)
+  return msgpack.ExtType(code, data)
+
+
+class CacheCodec:
+  """
+  Encodes cache values as <format byte><compression byte><payload>.
+
+  msgpack is used when installed (JSON otherwise); values neither format can
+  represent fall back to pickle. Payloads above compress_threshold bytes are
+  compressed with lz4 when installed and requested, zlib otherwise.
+  """
+  def __init__(self, serializer='msgpack', compression='zlib', compress_threshold=1024, compress_level=1):
+    if serializer == 'msgpack' and msgpack is None:
+      logger.warning("msgpack is not installed; cache values will be encoded as JSON")
+      serializer = 'json'
+    if compression == 'lz4' and lz4_frame is None:
+      logger.warning("lz4 is not installed; cache values will be compressed with zlib")
+      compression = 'zlib'
+
+    self.serializer = serializer
+    self.compression = compression
+    self.compress_threshold = compress_threshold
+    self.compress_level = compress_level
+
+  def encode(self, value):
+    """Serialize value to bytes with the codec header"""
+    fmt, payload = self._serialize(value)
+
+    compression = COMPRESSION_NONE
+    if self.compression and len(payload) >= self.compress_threshold:
+      if self.compression == 'lz4':
+        payload = lz4_frame.compress(payload)
+        compression = COMPRESSION_LZ4
+      else:
+        payload = zlib.compress(payload, self.compress_level)
+        compression = COMPRESSION_ZLIB
+
+    return fmt + compression + payload
+
+  def decode(self, data):
+    """Deserialize bytes produced by encode()"""
+    if isinstance(data, str):
+      data = data.encode('latin1')
+    if len(data) < 2:
+      raise ValueError("Cache payload is missing its codec header")
+
+    fmt, compression, payload = data[:1], data[1:2], data[2:]
+
+    if compression == COMPRESSION_ZLIB:
+      payload = zlib.decompress(payload)
+    elif compression == COMPRESSION_LZ4:
+      if lz4_frame is None:
+        raise ValueError("Cache payload is lz4-compressed but lz4 is not installed")
+      payload = lz4_frame.decompress(payload)
+    elif compression != COMPRESSION_NONE:
+      raise ValueError(f"Unknown cache compression flag {compression!r}")
+
+    if fmt == FORMAT_MSGPACK:
+      if msgpack is None:
+        raise ValueError("Cache payload is msgpack-encoded but msgpack is not installed")
+      return msgpack.unpackb(payload, raw=False, ext_hook=_msgpack_ext_hook, strict_map_key=False)
+    if fmt == FORMAT_JSON:
+      return json.loads(payload)
+    if fmt == FORMAT_PICKLE:
+      return pickle.loads(payload)
+    raise ValueError(f"Unknown cache format flag {fmt!r}")
+
+  def _serialize(self, value):
+    try:
+      if self.serializer == 'msgpack':
+        return FORMAT_MSGPACK, msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+      if self.serializer == 'json':
+        return FORMAT_JSON, json.dumps(value, separators=(',', ':')).encode('utf-8')
+    except (TypeError, ValueError, OverflowError):
+      pass
+    return FORMAT_PICKLE, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
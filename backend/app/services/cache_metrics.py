@@ -0,0 +1,80 @@
+import threading
+from collections import defaultdict
+
+def namespace_of(key):
+  """CacheKeys namespace of a logical key ("doctors::detail::5" -> "doctors")"""
+  return key.split('::', 1)[0] if key else 'unknown'
+
+def _empty_namespace():
+  return {
+    'hits': 0,
+    'local_hits': 0,
+    'misses': 0,
+    'sets': 0,
+    'deletes': 0,
+    'errors': 0,
+    'bytes_read': 0,
+    'bytes_written': 0,
+    'operations': {}
+  }
+
+class CacheMetrics:
+  """
+  In-process cache counters bucketed by CacheKeys namespace. Recording is a
+  dict update under a lock; nothing here talks to Redis.
+  """
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._namespaces = defaultdict(_empty_namespace)
+
+  def record(self, namespace, operation, seconds=0.0, hits=0, local_hits=0, misses=0,
+             sets=0, deletes=0, errors=0, bytes_read=0, bytes_written=0):
+    """Add one cache operation's outcome to the namespace's counters"""
+    with self._lock:
+      bucket = self._namespaces[namespace]
+      bucket['hits'] += hits
+      bucket['local_hits'] += local_hits
+      bucket['misses'] += misses
+      bucket['sets'] += sets
+      bucket['deletes'] += deletes
+      bucket['errors'] += errors
+      bucket['bytes_read'] += bytes_read
+      bucket['bytes_written'] += bytes_written
+
+      latency = bucket['operations'].setdefault(
+        operation, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+      )
+      latency['count'] += 1
+      latency['total_seconds'] += seconds
+      latency['max_seconds'] = max(latency['max_seconds'], seconds)
+
+  def snapshot(self):
+    """Copy of all counters with hit ratios and average latencies filled in"""
+    with self._lock:
+      namespaces = {}
+      for namespace, bucket in self._namespaces.items():
+        lookups = bucket['hits'] + bucket['misses']
+        operations = {}
+        for operation, latency in bucket['operations'].items():
+          operations[operation] = {
+            'count': latency['count'],
+            'avg_ms': round(latency['total_seconds'] / latency['count'] * 1000, 3) if latency['count'] else 0.0,
+            'max_ms': round(latency['max_seconds'] * 1000, 3)
+          }
+        namespaces[namespace] = dict(
+          bucket,
+          operations=operations,
+          hit_ratio=round(bucket['hits'] / lookups, 4) if lookups else None
+        )
+
+    totals = {
+      name: sum(bucket[name] for bucket in namespaces.values())
+      for name in ('hits', 'local_hits', 'misses', 'sets', 'deletes', 'errors', 'bytes_read', 'bytes_written')
+    }
+    lookups = totals['hits'] + totals['misses']
+    totals['hit_ratio'] = round(totals['hits'] / lookups, 4) if lookups else None
+    return {'namespaces': namespaces, 'totals': totals}
+
+  def reset(self):
+    with self._lock:
+      self._namespaces.clear()
@@ -1,83 +1,344 @@
 import redis
 import json
-import pickle
 from datetime import timedelta
 import logging
+import inspect
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
 from functools import wraps
-from flask import current_app
+from flask import current_app, g, has_app_context, has_request_context
+from app.services.cache_budget import CacheBudgets, parse_budgets
+from app.services.cache_codec import CacheCodec
+from app.services.cache_metrics import CacheMetrics, namespace_of
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.local_cache import LocalCache
+from app.services.memory_redis import MemoryRedis
+from app.services.metrics import observe_cache_lookup
+from app.services.tracing import record_span
+from app.services.single_flight import SingleFlight
+from app.utils.cache_keys import CacheKeys, bind_arguments, build_cache_key, build_key_from_arguments
 
 logger = logging.getLogger(__name__)
 
+# A missing or unusable entry, where None could be a cached value
+_MISSING = object()
+
 class CacheService:
+  # Seconds a process trusts its local copy of a generation counter; longer
+  # while the invalidation subscriber is running, since bumps are pushed to it
+  GENERATION_TTL = 1.0
+  SUBSCRIBED_GENERATION_TTL = 30.0
+  
+  # Pub/sub channel that keeps every process's local tier consistent
+  INVALIDATION_CHANNEL = 'cache::invalidation'
+  
   def __init__(self):
-      self.redis_client = None
-      self._connect()
-  
-  def _connect(self):
-    """Establish connection to Redis"""
-    try:
-      self.redis_client = redis.Redis(
-        host=current_app.config.get('REDIS_HOST', 'localhost'),
-        port=current_app.config.get('REDIS_PORT', 6379),
-        db=current_app.config.get('REDIS_DB', 0),
-        password=current_app.config.get('REDIS_PASSWORD'),
-        decode_responses=True,
-        socket_connect_timeout=5,
-        socket_timeout=5,
-        retry_on_timeout=True
-      )
-      # Test connection
-      self.redis_client.ping()
-      logger.info("Redis connection established successfully")
+      self._client = None
+      self._client_pid = None
+      self._configured = False
+      self._generations = {}
+      self._instance_id = uuid.uuid4().hex
+      self._subscriber = None
+      self._subscriber_pid = None
+      self._subscriber_ready = threading.Event()
+      self.local_cache = LocalCache()
+      self.codec = CacheCodec()
+      self.breaker = CircuitBreaker()
+      self.metrics = CacheMetrics()
+      self.budgets = CacheBudgets()
+      self.enabled = True
+  
+  def setting(self, name, default=None):
+    """Read a setting from the Flask app when available, else the environment"""
+    if has_app_context():
+      return current_app.config.get(name, default)
+    return os.environ.get(name, default)
+  
+  def _configure(self):
+    """Apply cache settings once, on first use rather than at import time"""
+    self.local_cache = LocalCache(
+      max_entries=int(self.setting('CACHE_LOCAL_MAX_ENTRIES', 1024)),
+      max_bytes=int(self.setting('CACHE_LOCAL_MAX_BYTES', 8 * 1024 * 1024))
+    )
+    self.codec = CacheCodec(
+      serializer=self.setting('CACHE_SERIALIZER', 'msgpack'),
+      compression=self.setting('CACHE_COMPRESSION', 'zlib'),
+      compress_threshold=int(self.setting('CACHE_COMPRESS_THRESHOLD', 1024))
+    )
+    self.breaker = CircuitBreaker(
+      failure_threshold=int(self.setting('CACHE_BREAKER_FAILURES', 5)),
+      recovery_timeout=float(self.setting('CACHE_BREAKER_COOLDOWN', 30))
+    )
+    self.enabled = str(self.setting('CACHE_ENABLED', True)).lower() not in ('0', 'false', 'no')
+    self.budgets = CacheBudgets(parse_budgets(
+      self.setting('CACHE_NAMESPACE_BUDGETS'),
+      default_policy=self.setting('CACHE_EVICTION_POLICY', 'lru')
+    ))
+    self._configured = True
+  
+  @property
+  def redis_client(self):
+    """
+    Redis client backed by a per-process connection pool, created lazily
+    (and again after a fork, so gunicorn/Celery children never share sockets)
+    """
+    pid = os.getpid()
+    if self._client is not None and self._client_pid == pid:
+      return self._client
+    
+    if not self._configured:
+      self._configure()
+    
+    try:
+      if self.setting('CACHE_BACKEND', 'redis') == 'memory':
+        self._client = MemoryRedis.from_url(self._redis_url())
+      else:
+        pool = redis.ConnectionPool.from_url(
+          self._redis_url(),
+          max_connections=int(self.setting('CACHE_REDIS_MAX_CONNECTIONS', 50)),
+          socket_connect_timeout=float(self.setting('CACHE_REDIS_CONNECT_TIMEOUT', 1)),
+          socket_timeout=float(self.setting('CACHE_REDIS_TIMEOUT', 1)),
+          retry_on_timeout=False,
+          health_check_interval=30
+        )
+        self._client = redis.Redis(connection_pool=pool)
+      self._client_pid = pid
+      # Generation memos and local entries may predate the fork
+      self._generations.clear()
+      self.local_cache.clear()
+      logger.info("Redis connection pool created")
     except Exception as e:
-      logger.error(f"Failed to connect to Redis: {str(e)}")
-      self.redis_client = None
+      self.record_failure("Failed to create Redis connection pool", e)
+      self._client = None
+    return self._client
+  
+  def _redis_url(self):
+    """CACHE_REDIS_URL isolates the cache from the Celery broker; REDIS_URL otherwise"""
+    if self.setting('CACHE_BACKEND', 'redis') == 'memory':
+      return self.setting('CACHE_REDIS_URL') or 'memory://'
+    return self.setting('CACHE_REDIS_URL') or self.setting('REDIS_URL') or 'redis://localhost:6379/0'
+  
+  def record_failure(self, message, error):
+    """
+    Log a cache error; only connection and timeout errors (Redis being
+    unreachable or slow) count towards opening the circuit
+    """
+    if isinstance(error, (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)):
+      self.breaker.record_failure(error)
+    logger.error(f"{message}: {str(error)}")
+  
+  def record_success(self):
+    """Report a Redis round trip made through redis_client directly (closes a half-open circuit)"""
+    self.breaker.record_success()
+  
+  def _decode_or_drop(self, key, versioned_key, payload):
+    """
+    Deserialize a stored payload; an undecodable one (corrupt, or written
+    by an incompatible codec) is deleted and reported as a miss (_MISSING)
+    """
+    try:
+      return self._deserialize(payload)
+    except Exception as e:
+      logger.warning(f"Dropping undecodable cache entry {key}: {str(e)}")
+      self.local_cache.delete(versioned_key)
+      try:
+        self.redis_client.delete(versioned_key)
+      except Exception as delete_error:
+        self.record_failure(f"Error deleting undecodable key {key}", delete_error)
+      return _MISSING
+  
+  def reset(self):
+    """
+    Drop the client, settings and in-process state so the next call
+    reconfigures from the current app config (benchmarks switch setups this way)
+    """
+    self._client = None
+    self._client_pid = None
+    self._configured = False
+    self._generations.clear()
+    self.local_cache.clear()
+    self.metrics.reset()
   
   def is_connected(self):
-    """Check if Redis is connected"""
+    """
+    Whether Redis should be used right now. Reads the circuit breaker
+    instead of sending a PING, so it costs no round trip.
+    """
+    if not self._configured:
+      self._configure()
+    return self.enabled and self.breaker.allow() and self.redis_client is not None
+  
+  def health(self):
+    """Cache health from the circuit breaker state, without network access"""
+    breaker = self.breaker.snapshot()
+    status = {
+      CircuitBreaker.CLOSED: 'healthy',
+      CircuitBreaker.HALF_OPEN: 'degraded',
+      CircuitBreaker.OPEN: 'unhealthy'
+    }[breaker['state']]
+    return {
+      'status': status,
+      'breaker': breaker,
+      'local_cache': self.local_cache.stats(),
+      'pid': os.getpid()
+    }
+  
+  def record_lookup(self, namespace, operation, started, hits=0, local_hits=0, misses=0, bytes_read=0):
+    """Count a lookup in the namespace metrics and in the current request's counters"""
+    self.metrics.record(
+      namespace, operation, time.perf_counter() - started,
+      hits=hits, local_hits=local_hits, misses=misses, bytes_read=bytes_read
+    )
+    observe_cache_lookup(namespace, hits=hits, local_hits=local_hits, misses=misses)
+    record_span('cache.' + operation, started, namespace=namespace, hits=hits, misses=misses)
+    if has_request_context() and hasattr(g, 'cache_hits'):
+      g.cache_hits += hits
+      g.cache_misses += misses
+  
+  def _record_batch_lookup(self, outcomes, started):
+    """record_lookup for get_many: outcomes maps key -> ('local'|'hit'|'miss', bytes)"""
+    elapsed = (time.perf_counter() - started) / max(len(outcomes), 1)
+    hits = misses = 0
+    for key, (outcome, size) in outcomes.items():
+      self.metrics.record(
+        namespace_of(key), 'get_many', elapsed,
+        hits=int(outcome != 'miss'), local_hits=int(outcome == 'local'),
+        misses=int(outcome == 'miss'), bytes_read=size
+      )
+      observe_cache_lookup(
+        namespace_of(key), hits=int(outcome != 'miss'), local_hits=int(outcome == 'local'),
+        misses=int(outcome == 'miss')
+      )
+      hits += outcome != 'miss'
+      misses += outcome == 'miss'
+    record_span('cache.get_many', started, keys=len(outcomes), hits=hits, misses=misses)
+    if has_request_context() and hasattr(g, 'cache_hits'):
+      g.cache_hits += hits
+      g.cache_misses += misses
+  
+  def estimate_key_counts(self, sample_size=1000):
+    """
+    Approximate key count per namespace: DBSIZE for the total, split by the
+    namespace mix of a bounded SCAN sample. Meant for on-demand reporting only.
+    """
+    if not self.is_connected():
+      return {}
+    
     try:
-      return self.redis_client and self.redis_client.ping()
-    except:
-      return False
+      total = self.redis_client.dbsize()
+      sampled = defaultdict(int)
+      seen = 0
+      for key in self.redis_client.scan_iter(count=min(sample_size, 1000)):
+        if isinstance(key, bytes):
+          key = key.decode('utf-8', 'replace')
+        sampled[namespace_of(key)] += 1
+        seen += 1
+        if seen >= sample_size:
+          break
+      self.breaker.record_success()
+      
+      scale = total / seen if seen else 0
+      return {
+        'total_keys': total,
+        'sampled_keys': seen,
+        'exact': seen >= total,
+        'namespaces': {namespace: int(round(count * scale)) for namespace, count in sorted(sampled.items())}
+      }
+    except Exception as e:
+      self.record_failure("Error estimating cache key counts", e)
+      return {}
   
-  def get(self, key):
-    """Get value from cache"""
+  def _serialize(self, value):
+    """Serialize a value for storage"""
+    return self.codec.encode(value)
+  
+  def _deserialize(self, payload):
+    """Deserialize a stored payload"""
+    return self.codec.decode(payload)
+  
+  def get(self, key, local_ttl=None):
+    """
+    Get value from cache. With local_ttl the in-process tier is checked
+    first and refilled from Redis on a local miss.
+    """
     if not self.is_connected():
       return None
     
+    started = time.perf_counter()
+    namespace = namespace_of(key)
     try:
-      value = self.redis_client.get(key)
+      versioned_key = self.versioned_key(key)
+      if local_ttl:
+        self._ensure_subscriber()
+        payload = self.local_cache.get(versioned_key)
+        if payload is not None:
+          decoded = self._decode_or_drop(key, versioned_key, payload)
+          if decoded is not _MISSING:
+            self.record_lookup(namespace, 'get', started, hits=1, local_hits=1)
+            return decoded
+      
+      value = self.redis_client.get(versioned_key)
+      self.breaker.record_success()
       if value:
-        # Try to deserialize JSON first, then fall back to pickle
-        try:
-          return json.loads(value)
-        except:
-          return pickle.loads(value.encode('latin1'))
+        decoded = self._decode_or_drop(key, versioned_key, value)
+        if decoded is not _MISSING:
+          if local_ttl:
+            self.local_cache.set(versioned_key, value, local_ttl)
+          self.record_lookup(namespace, 'get', started, hits=1, bytes_read=len(value))
+          return decoded
+      self.record_lookup(namespace, 'get', started, misses=1)
       return None
     except Exception as e:
-      logger.error(f"Error getting key {key} from cache: {str(e)}")
+      self.metrics.record(namespace, 'get', time.perf_counter() - started, errors=1)
+      self.record_failure(f"Error getting key {key} from cache", e)
       return None
   
-  def set(self, key, value, expiry_seconds=3600):
-    """Set value in cache with expiry"""
+  def set(self, key, value, expiry_seconds=3600, local_ttl=None):
+    """Set value in cache with expiry, optionally keeping a local copy"""
     if not self.is_connected():
       return False
     
+    started = time.perf_counter()
     try:
-        # Try to serialize as JSON first, then fall back to pickle
-        try:
-          serialized_value = json.dumps(value)
-        except:
-          serialized_value = pickle.dumps(value).decode('latin1')
+        serialized_value = self._serialize(value)
         
+        versioned_key = self.versioned_key(key)
+        namespace = namespace_of(key)
+        pipe = self.redis_client.pipeline(transaction=False)
         if expiry_seconds:
-          self.redis_client.setex(key, expiry_seconds, serialized_value)
+          pipe.setex(versioned_key, expiry_seconds, serialized_value)
         else:
-          self.redis_client.set(key, serialized_value)
+          pipe.set(versioned_key, serialized_value)
+        if self.budgets.tracks(namespace):
+          self.budgets.account(pipe, namespace, versioned_key, len(serialized_value), expiry_seconds)
+        pipe.execute()
+        self.breaker.record_success()
+        self._check_budget(namespace, len(serialized_value))
         
+        if local_ttl:
+          self._ensure_subscriber()
+          # Other processes may hold an older copy under the same key
+          self._publish_invalidation(keys=[versioned_key])
+          self.local_cache.set(
+            versioned_key,
+            serialized_value,
+            min(local_ttl, expiry_seconds) if expiry_seconds else local_ttl
+          )
+        
+        self.metrics.record(
+          namespace_of(key), 'set', time.perf_counter() - started,
+          sets=1, bytes_written=len(serialized_value)
+        )
+        record_span('cache.set', started, namespace=namespace, bytes=len(serialized_value))
         return True
     except Exception as e:
-      logger.error(f"Error setting key {key} in cache: {str(e)}")
+      self.metrics.record(namespace_of(key), 'set', time.perf_counter() - started, errors=1)
+      self.record_failure(f"Error setting key {key} in cache", e)
       return False
   
   def delete(self, key):
@@ -85,25 +346,545 @@ class CacheService:
     if not self.is_connected():
       return False
     
+    started = time.perf_counter()
+    try:
+      versioned_key = self.versioned_key(key)
+      namespace = namespace_of(key)
+      pipe = self.redis_client.pipeline(transaction=False)
+      pipe.delete(versioned_key)
+      if self.budgets.tracks(namespace):
+        self.budgets.forget(pipe, namespace, [versioned_key])
+      pipe.execute()
+      self.breaker.record_success()
+      self.local_cache.delete(versioned_key)
+      self._publish_invalidation(keys=[versioned_key])
+      self.metrics.record(namespace_of(key), 'delete', time.perf_counter() - started, deletes=1)
+      return True
+    except Exception as e:
+      self.metrics.record(namespace_of(key), 'delete', time.perf_counter() - started, errors=1)
+      self.record_failure(f"Error deleting key {key} from cache", e)
+      return False
+  
+  def get_many(self, keys, local_ttl=None):
+    """
+    Get several keys at once. Returns {key: value} for the hits only; Redis
+    is read with a single MGET for whatever the local tier does not have.
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys or not self.is_connected():
+      return {}
+    
+    started = time.perf_counter()
+    outcomes = {}
+    try:
+      versioned = dict(zip(keys, self.versioned_keys(keys)))
+      result = {}
+      remote = []
+      if local_ttl:
+        self._ensure_subscriber()
+        for key in keys:
+          payload = self.local_cache.get(versioned[key])
+          decoded = _MISSING if payload is None else self._decode_or_drop(key, versioned[key], payload)
+          if decoded is not _MISSING:
+            result[key] = decoded
+            outcomes[key] = ('local', 0)
+          else:
+            remote.append(key)
+      else:
+        remote = keys
+      
+      if remote:
+        values = self.redis_client.mget([versioned[key] for key in remote])
+        self.breaker.record_success()
+        for key, value in zip(remote, values):
+          decoded = self._decode_or_drop(key, versioned[key], value) if value else _MISSING
+          if decoded is not _MISSING:
+            if local_ttl:
+              self.local_cache.set(versioned[key], value, local_ttl)
+            result[key] = decoded
+            outcomes[key] = ('hit', len(value))
+          else:
+            outcomes[key] = ('miss', 0)
+      
+      self._record_batch_lookup(outcomes, started)
+      return result
+    except Exception as e:
+      self.metrics.record(namespace_of(keys[0]), 'get_many', time.perf_counter() - started, errors=1)
+      self.record_failure(f"Error getting {len(keys)} keys from cache", e)
+      return {}
+  
+  def set_many(self, mapping, expiry_seconds=3600, local_ttl=None):
+    """Set several values in one pipelined round trip"""
+    if not mapping or not self.is_connected():
+      return False
+    
+    started = time.perf_counter()
+    try:
+      keys = list(mapping)
+      versioned = dict(zip(keys, self.versioned_keys(keys)))
+      payloads = {key: self._serialize(mapping[key]) for key in keys}
+      
+      pipe = self.redis_client.pipeline(transaction=False)
+      for key in keys:
+        if expiry_seconds:
+          pipe.setex(versioned[key], expiry_seconds, payloads[key])
+        else:
+          pipe.set(versioned[key], payloads[key])
+        namespace = namespace_of(key)
+        if self.budgets.tracks(namespace):
+          self.budgets.account(pipe, namespace, versioned[key], len(payloads[key]), expiry_seconds)
+      pipe.execute()
+      self.breaker.record_success()
+      
+      written = defaultdict(int)
+      for key in keys:
+        written[namespace_of(key)] += len(payloads[key])
+      for namespace, size in written.items():
+        self._check_budget(namespace, size)
+      
+      if local_ttl:
+        self._ensure_subscriber()
+        self._publish_invalidation(keys=list(versioned.values()))
+        ttl = min(local_ttl, expiry_seconds) if expiry_seconds else local_ttl
+        for key in keys:
+          self.local_cache.set(versioned[key], payloads[key], ttl)
+      
+      elapsed = (time.perf_counter() - started) / len(keys)
+      for key in keys:
+        self.metrics.record(namespace_of(key), 'set_many', elapsed, sets=1, bytes_written=len(payloads[key]))
+      return True
+    except Exception as e:
+      self.metrics.record(namespace_of(next(iter(mapping))), 'set_many', time.perf_counter() - started, errors=1)
+      self.record_failure(f"Error setting {len(mapping)} keys in cache", e)
+      return False
+  
+  def delete_many(self, keys):
+    """Delete several keys with a single UNLINK"""
+    keys = list(dict.fromkeys(keys))
+    if not keys or not self.is_connected():
+      return False
+    
+    started = time.perf_counter()
+    try:
+      versioned = self.versioned_keys(keys)
+      pipe = self.redis_client.pipeline(transaction=False)
+      pipe.unlink(*versioned)
+      for key, versioned_key in zip(keys, versioned):
+        namespace = namespace_of(key)
+        if self.budgets.tracks(namespace):
+          self.budgets.forget(pipe, namespace, [versioned_key])
+      pipe.execute()
+      self.breaker.record_success()
+      for key in versioned:
+        self.local_cache.delete(key)
+      self._publish_invalidation(keys=versioned)
+      elapsed = (time.perf_counter() - started) / len(keys)
+      for key in keys:
+        self.metrics.record(namespace_of(key), 'delete_many', elapsed, deletes=1)
+      return True
+    except Exception as e:
+      self.metrics.record(namespace_of(keys[0]), 'delete_many', time.perf_counter() - started, errors=1)
+      self.record_failure(f"Error deleting {len(keys)} keys from cache", e)
+      return False
+  
+  def lock(self, key, timeout=10):
+    """
+    Short-lived Redis lock guarding recomputation of key, or None when
+    Redis is unavailable
+    """
+    if not self.is_connected():
+      return None
+    
+    try:
+      return self.redis_client.lock(CacheKeys.lock(key), timeout=timeout, blocking=False)
+    except Exception as e:
+      self.record_failure(f"Error creating lock for key {key}", e)
+      return None
+  
+  def add(self, key, value, expiry_seconds):
+    """Set a raw (unversioned) key only if it does not exist yet"""
+    if not self.is_connected():
+      return False
+    
+    try:
+      return bool(self.redis_client.set(key, value, ex=expiry_seconds, nx=True))
+    except Exception as e:
+      self.record_failure(f"Error adding key {key} to cache", e)
+      return False
+  
+  def delete_pattern(self, pattern, batch_size=500):
+    """
+    Delete all keys matching pattern using SCAN (never KEYS) in small batches.
+    Prefer invalidate() for namespaces; this is for sweeping and admin clears.
+    """
+    if not self.is_connected():
+      return False
+    
     try:
-      self.redis_client.delete(key)
+      batch = []
+      for key in self.redis_client.scan_iter(match=pattern, count=batch_size):
+        batch.append(key.decode('utf-8') if isinstance(key, bytes) else key)
+        if len(batch) >= batch_size:
+          self._unlink_batch(batch)
+          batch = []
+      if batch:
+        self._unlink_batch(batch)
       return True
     except Exception as e:
-      logger.error(f"Error deleting key {key} from cache: {str(e)}")
+      self.record_failure(f"Error deleting pattern {pattern} from cache", e)
       return False
   
-  def delete_pattern(self, pattern):
-    """Delete all keys matching pattern"""
+  def _unlink_batch(self, keys):
+    """Unlink keys found by a pattern scan, here and in every local tier"""
+    self.redis_client.unlink(*keys)
+    for key in keys:
+      self.local_cache.delete(key)
+    self._publish_invalidation(keys=keys)
+  
+  def _get_generations(self, scopes):
+    """Return current generation counters for scopes, using the local memo when fresh"""
+    now = time.monotonic()
+    ttl = self.SUBSCRIBED_GENERATION_TTL if self._subscriber_ready.is_set() else self.GENERATION_TTL
+    result = {}
+    missing = []
+    for scope in scopes:
+      memo = self._generations.get(scope)
+      if memo and now - memo[1] < ttl:
+        result[scope] = memo[0]
+      else:
+        missing.append(scope)
+    
+    if missing:
+      values = self.redis_client.mget([CacheKeys.generation(scope) for scope in missing])
+      for scope, value in zip(missing, values):
+        if value is None:
+          # Seed with a millisecond timestamp so a lost counter never
+          # falls back onto a generation that was used before
+          self.redis_client.set(CacheKeys.generation(scope), int(time.time() * 1000), nx=True)
+          value = self.redis_client.get(CacheKeys.generation(scope))
+        result[scope] = int(value)
+        self._generations[scope] = (result[scope], now)
+    
+    return result
+  
+  def versioned_key(self, key):
+    """
+    Embed the namespace (and entity scope) generation into a logical key,
+    e.g. doctors::availability::5::... -> doctors::g12.3::availability::5::...
+    """
+    return self.versioned_keys([key])[0]
+  
+  def versioned_keys(self, keys):
+    """versioned_key for many keys, fetching all their generations in one MGET"""
+    key_scopes = [CacheKeys.scopes_for(key) for key in keys]
+    scopes = set()
+    for namespace, scope in key_scopes:
+      scopes.add(namespace)
+      if scope:
+        scopes.add(scope)
+    generations = self._get_generations(sorted(scopes))
+    
+    result = []
+    for key, (namespace, scope) in zip(keys, key_scopes):
+      rest = key[len(namespace) + 2:]
+      if scope:
+        result.append(f"{namespace}::g{generations[namespace]}.{generations[scope]}::{rest}")
+      else:
+        result.append(f"{namespace}::g{generations[namespace]}::{rest}")
+    return result
+  
+  def bump_generation(self, scope):
+    """Invalidate every key under a namespace or entity scope with one INCR"""
     if not self.is_connected():
       return False
     
     try:
-      keys = self.redis_client.keys(pattern)
-      if keys:
-        self.redis_client.delete(*keys)
+      self._get_generations([scope])
+      self.redis_client.incr(CacheKeys.generation(scope))
+      self.breaker.record_success()
+      self._generations.pop(scope, None)
+      self._publish_invalidation(generations=[scope])
       return True
     except Exception as e:
-      logger.error(f"Error deleting pattern {pattern} from cache: {str(e)}")
+      self.record_failure(f"Error bumping cache generation for {scope}", e)
+      return False
+  
+  def _classify_target(self, target):
+    """
+    Map an invalidation target to ('generation', scope), ('pattern', pattern
+    over the stored versioned keys), ('key', key) or ('invalid', target)
+    when it cannot be mapped onto stored keys
+    """
+    prefix = target[:-3] if target.endswith('::*') else target
+    namespace, scope = CacheKeys.scopes_for(prefix)
+    if not namespace or any(char in namespace for char in '*?[]'):
+      return 'invalid', target
+    
+    # Every cached key, including the module based keys of @cached without
+    # a key pattern, is versioned by its first segment
+    if prefix == namespace or scope == prefix:
+      return 'generation', prefix
+    
+    if any(char in target for char in '*?['):
+      # Stored keys carry the generation after the namespace:
+      # doctors::list::* -> doctors::g*::list::*
+      return 'pattern', f"{namespace}::g*::{target[len(namespace) + 2:]}"
+    return 'key', target
+  
+  def _cached_namespaces(self):
+    """CacheKeys.NAMESPACES plus every other namespace with a generation counter"""
+    namespaces = set(CacheKeys.NAMESPACES)
+    prefix = CacheKeys.generation('')
+    for key in self.redis_client.scan_iter(match=f"{prefix}*", count=500):
+      scope = (key.decode('utf-8') if isinstance(key, bytes) else key)[len(prefix):]
+      if '::' not in scope:
+        namespaces.add(scope)
+    return namespaces
+  
+  def invalidate(self, target):
+    """
+    Invalidate everything ("*"), a namespace ("doctors::*"), an entity scope
+    ("doctors::availability::5"), a pattern below a namespace
+    ("doctors::list::*") or a single logical key. Returns False when the
+    target cannot be mapped onto cached keys.
+    """
+    if target == '*':
+      if not self.is_connected():
+        return False
+      try:
+        namespaces = self._cached_namespaces()
+      except Exception as e:
+        self.record_failure("Error listing cache namespaces", e)
+        return False
+      return self.invalidate_many([f"{namespace}::*" for namespace in sorted(namespaces)])
+    
+    kind, value = self._classify_target(target)
+    if kind == 'invalid':
+      return False
+    if kind == 'generation':
+      return self.bump_generation(value)
+    if kind == 'pattern':
+      return self.delete_pattern(value)
+    return self.delete(value)
+  
+  def invalidate_many(self, targets):
+    """
+    Invalidate several targets (see invalidate) in one pipelined round trip
+    """
+    if not targets or not self.is_connected():
+      return False
+    
+    scopes, keys, patterns, invalid = set(), set(), set(), set()
+    for target in targets:
+      kind, value = self._classify_target(target)
+      {'generation': scopes, 'key': keys, 'pattern': patterns, 'invalid': invalid}[kind].add(value)
+    if invalid:
+      logger.warning(f"Ignoring cache invalidation targets that match no cached keys: {sorted(invalid)}")
+    
+    try:
+      # Seed missing counters and resolve the keys to delete up front
+      if scopes:
+        self._get_generations(list(scopes))
+      versioned_keys = [self.versioned_key(key) for key in keys]
+      
+      pipe = self.redis_client.pipeline(transaction=False)
+      for scope in scopes:
+        pipe.incr(CacheKeys.generation(scope))
+      if versioned_keys:
+        pipe.delete(*versioned_keys)
+      pipe.execute()
+      self.breaker.record_success()
+      
+      for scope in scopes:
+        self._generations.pop(scope, None)
+      for versioned_key in versioned_keys:
+        self.local_cache.delete(versioned_key)
+      self._publish_invalidation(keys=versioned_keys, generations=list(scopes))
+    except Exception as e:
+      self.record_failure(f"Error invalidating cache targets {sorted(targets)}", e)
+      return False
+    
+    for pattern in patterns:
+      self.delete_pattern(pattern)
+    return not invalid
+  
+  def _publish_invalidation(self, keys=(), generations=()):
+    """Tell other processes to drop local entries and generation memos"""
+    if not keys and not generations:
+      return
+    try:
+      message = {
+        'origin': self._instance_id,
+        'keys': list(keys),
+        'generations': list(generations)
+      }
+      self.redis_client.publish(self.INVALIDATION_CHANNEL, json.dumps(message))
+    except Exception as e:
+      self.record_failure(f"Error publishing cache invalidation", e)
+  
+  def _ensure_subscriber(self):
+    """Start the invalidation listener for this process (again after a fork)"""
+    pid = os.getpid()
+    if self._subscriber_pid == pid and self._subscriber and self._subscriber.is_alive():
+      return
+    if self.redis_client is None:
+      return
+    
+    self._subscriber_pid = pid
+    self._subscriber_ready.clear()
+    # Anything cached before a fork may have missed invalidations
+    self.local_cache.clear()
+    self._generations.clear()
+    self._subscriber = threading.Thread(
+      target=self._listen_for_invalidations,
+      name='cache-invalidation-listener',
+      daemon=True
+    )
+    self._subscriber.start()
+  
+  def _subscriber_client(self):
+    """Own connection without a read timeout: listen() blocks between messages"""
+    if self.setting('CACHE_BACKEND', 'redis') == 'memory':
+      return MemoryRedis.from_url(self._redis_url())
+    return redis.Redis.from_url(
+      self._redis_url(),
+      socket_connect_timeout=float(self.setting('CACHE_REDIS_CONNECT_TIMEOUT', 1)),
+      health_check_interval=30
+    )
+  
+  def _listen_for_invalidations(self):
+    """Apply invalidations published by other processes to the local tier"""
+    while True:
+      pubsub = None
+      try:
+        pubsub = self._subscriber_client().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.INVALIDATION_CHANNEL)
+        self._subscriber_ready.set()
+        for message in pubsub.listen():
+          if message.get('type') != 'message':
+            continue
+          data = json.loads(message['data'])
+          if data.get('origin') == self._instance_id:
+            continue
+          for key in data.get('keys', []):
+            self.local_cache.delete(key)
+          for scope in data.get('generations', []):
+            self._generations.pop(scope, None)
+      except Exception as e:
+        logger.error(f"Cache invalidation listener error: {str(e)}")
+      finally:
+        # Messages may have been missed while disconnected
+        self._subscriber_ready.clear()
+        self.local_cache.clear()
+        self._generations.clear()
+        if pubsub is not None:
+          try:
+            pubsub.close()
+          except Exception:
+            pass
+      time.sleep(1)
+  
+  def sweep_orphaned_keys(self, batch_size=500):
+    """
+    Reclaim entries written under old generations. They are unreachable
+    already and would expire on their own; this just frees memory sooner.
+    """
+    if not self.is_connected():
+      return 0
+    
+    removed = 0
+    try:
+      for namespace in CacheKeys.NAMESPACES:
+        batch = []
+        for key in self.redis_client.scan_iter(match=f"{namespace}::g*", count=batch_size):
+          if self._is_orphaned(key):
+            batch.append(key)
+          if len(batch) >= batch_size:
+            removed += self._unlink_accounted(namespace, batch)
+            batch = []
+        if batch:
+          removed += self._unlink_accounted(namespace, batch)
+      return removed
+    except Exception as e:
+      self.record_failure(f"Error sweeping orphaned cache keys", e)
+      return removed
+  
+  def _unlink_accounted(self, namespace, keys):
+    """UNLINK stored keys of namespace and drop them from its byte accounting"""
+    pipe = self.redis_client.pipeline(transaction=False)
+    pipe.unlink(*keys)
+    if self.budgets.tracks(namespace):
+      self.budgets.forget(pipe, namespace, keys)
+    return pipe.execute()[0]
+  
+  def _check_budget(self, namespace, size):
+    """Schedule a budget check once this process has written enough to namespace"""
+    if not self.budgets.note_write(namespace, size):
+      return
+    if not self.add(CacheKeys.budget_check_marker(namespace), 1, 30):
+      return
+    try:
+      from celery_worker.cache_tasks import enforce_cache_budgets
+      enforce_cache_budgets.delay([namespace])
+    except Exception as e:
+      logger.error(f"Error scheduling cache budget check for {namespace}: {str(e)}")
+  
+  def enforce_budgets(self, namespaces=None):
+    """
+    Shed entries from every namespace (or the given ones) that exceeds its
+    budget. Returns one summary per namespace checked.
+    """
+    if not self.is_connected():
+      return []
+    
+    results = []
+    for namespace in namespaces or list(self.budgets.budgets):
+      if not self.budgets.tracks(namespace):
+        continue
+      try:
+        results.append(self.budgets.enforce(self.redis_client, namespace))
+        self.breaker.record_success()
+      except Exception as e:
+        self.record_failure(f"Error enforcing cache budget for {namespace}", e)
+    return results
+  
+  def budget_usage(self):
+    """Accounted bytes and limit per budgeted namespace"""
+    if not self.is_connected():
+      return {}
+    
+    try:
+      usage = {}
+      for namespace, budget in self.budgets.budgets.items():
+        usage[namespace] = {
+          'used_bytes': self.budgets.usage(self.redis_client, namespace),
+          'limit_bytes': budget.limit_bytes,
+          'policy': budget.policy
+        }
+      self.breaker.record_success()
+      return usage
+    except Exception as e:
+      self.record_failure("Error reading cache budget usage", e)
+      return {}
+  
+  def _is_orphaned(self, key):
+    """Check whether a stored (versioned) key belongs to an old generation"""
+    if isinstance(key, bytes):
+      key = key.decode('utf-8', 'replace')
+    parts = key.split('::')
+    if len(parts) < 3 or not parts[1].startswith('g'):
+      return False
+    
+    namespace = parts[0]
+    versions = parts[1][1:].split('.')
+    logical_key = '::'.join([namespace] + parts[2:])
+    _, scope = CacheKeys.scopes_for(logical_key)
+    
+    scopes = [namespace] + ([scope] if scope else [])
+    generations = self._get_generations(scopes)
+    try:
+      return [int(v) for v in versions] != [generations[s] for s in scopes]
+    except ValueError:
       return False
   
   def exists(self, key):
@@ -112,9 +893,9 @@ class CacheService:
       return False
     
     try:
-      return self.redis_client.exists(key)
+      return self.redis_client.exists(self.versioned_key(key))
     except Exception as e:
-      logger.error(f"Error checking key {key} in cache: {str(e)}")
+      self.record_failure(f"Error checking key {key} in cache", e)
       return False
   
   def increment(self, key, amount=1):
@@ -125,7 +906,7 @@ class CacheService:
     try:
       return self.redis_client.incrby(key, amount)
     except Exception as e:
-      logger.error(f"Error incrementing key {key} in cache: {str(e)}")
+      self.record_failure(f"Error incrementing key {key} in cache", e)
       return None
   
   def get_cache_stats(self):
@@ -135,59 +916,324 @@ class CacheService:
     
     try:
       info = self.redis_client.info()
+      self.breaker.record_success()
       return {
         'connected_clients': info.get('connected_clients', 0),
         'used_memory_human': info.get('used_memory_human', '0'),
         'keyspace_hits': info.get('keyspace_hits', 0),
         'keyspace_misses': info.get('keyspace_misses', 0),
         'total_commands_processed': info.get('total_commands_processed', 0),
-        'keys_count': len(self.redis_client.keys('*'))
+        'keys_count': self.redis_client.dbsize(),
+        'local_cache': self.local_cache.stats()
         }
     except Exception as e:
-      logger.error(f"Error getting cache stats: {str(e)}")
+      self.record_failure(f"Error getting cache stats", e)
       return {}
 
 # Global cache service instance
 cache_service = CacheService()
 
-def cached(key_pattern=None, expiry=3600, unless=None):
+# Coalesces identical concurrent @cached(coalesce=True) lookups in this process
+_flights = SingleFlight()
+
+def _wrap_entry(value, expiry, delta, negative=False):
+  """
+  Envelope stored by @cached: the value plus what early refresh needs.
+  negative marks a cached "not found" (value None).
+  """
+  entry = {
+    '__cached__': 1,
+    'value': value,
+    'delta': delta,
+    'expires_at': time.time() + expiry if expiry else None
+  }
+  if negative:
+    entry['negative'] = 1
+  return entry
+
+def _is_fresh_negative(entry):
+  """True for an unexpired "not found" sentinel"""
+  if not (isinstance(entry, dict) and entry.get('__cached__') == 1 and entry.get('negative')):
+    return False
+  expires_at = entry.get('expires_at')
+  return expires_at is None or time.time() < expires_at
+
+def _unwrap_entry(entry):
+  """Return (value, delta, expires_at) for an envelope or a bare legacy value"""
+  if isinstance(entry, dict) and entry.get('__cached__') == 1:
+    return entry.get('value'), entry.get('delta') or 0.0, entry.get('expires_at')
+  return entry, 0.0, None
+
+def _needs_refresh(delta, expires_at, beta):
+  """
+  True once the entry has expired or, with beta set, when XFetch decides to
+  refresh early: now - delta * beta * ln(rand) >= expires_at. Entries that are
+  expensive to rebuild (large delta) are refreshed further ahead of expiry.
+  """
+  if expires_at is None:
+    return False
+  now = time.time()
+  if now >= expires_at:
+    return True
+  if beta and delta:
+    return now - delta * beta * math.log(1.0 - random.random()) >= expires_at
+  return False
+
+def _enqueue_refresh(f, cache_key_value, args, kwargs, marker_ttl):
+  """Schedule a background recompute of f(*args, **kwargs) once per marker_ttl"""
+  if not cache_service.add(CacheKeys.refresh_marker(cache_key_value), 1, marker_ttl):
+    return False
+  
+  try:
+    from celery_worker.cache_tasks import refresh_cached_entry
+    refresh_cached_entry.delay(f"{f.__module__}:{f.__qualname__}", list(args), kwargs)
+    logger.debug(f"Background refresh enqueued for key: {cache_key_value}")
+    return True
+  except Exception as e:
+    logger.error(f"Error enqueuing refresh for key {cache_key_value}: {str(e)}")
+    return False
+
+def cached(key_pattern=None, expiry=3600, unless=None, local_ttl=None,
+           single_flight=False, lock_timeout=10, lock_wait=5.0, beta=None,
+           stale_ttl=None, negative_ttl=None, coalesce=False, normalize=()):
   """
   Decorator for caching function results
+
+  key_pattern is a CacheKeys template string or callable; call arguments are
+  bound through the function signature and normalized before the key is built
+  (see app.utils.cache_keys.build_cache_key); string arguments named in
+  normalize (e.g. search terms) are case-folded. local_ttl additionally keeps the
+  result in the per-process tier; use it for small, very hot values only.
+
+  single_flight takes a short Redis lock so only one worker recomputes an
+  expired entry; the others serve the expired value (kept lock_timeout seconds
+  past expiry) or wait up to lock_wait seconds for the new one. beta enables
+  XFetch-style probabilistic early refresh (1.0 is the usual value).
+
+  stale_ttl keeps serving an expired value for up to stale_ttl seconds while a
+  Celery task (celery_worker.cache_tasks.refresh_cached_entry) recomputes it,
+  so requests never wait on the rebuild. Arguments must be JSON-serializable.
+
+  negative_ttl caches a None result (e.g. an unknown id) as a sentinel for
+  that many seconds, so repeated lookups of missing entities skip the
+  database. coalesce makes identical concurrent calls within this process
+  share one lookup (see app.services.single_flight).
   """
+  # Keep expired entries around long enough for single-flight waiters
+  # and for stale-while-revalidate reads
+  stale_grace = max(lock_timeout, int(math.ceil(lock_wait))) if single_flight else 0
+  stale_grace = max(stale_grace, stale_ttl or 0)
+  
   def decorator(f):
+      def cache_key(*args, **kwargs):
+          return build_cache_key(key_pattern, f, args, kwargs, normalize)
+
+      def recompute(cache_key_value, args, kwargs):
+          started = time.time()
+          result = f(*args, **kwargs)
+          if result is not None:
+            entry = _wrap_entry(result, expiry, time.time() - started)
+            cache_service.set(
+              cache_key_value, entry,
+              expiry + stale_grace if expiry else None,
+              local_ttl=local_ttl
+            )
+            logger.debug(f"Cache set for key: {cache_key_value}")
+          elif negative_ttl:
+            entry = _wrap_entry(None, negative_ttl, time.time() - started, negative=True)
+            cache_service.set(cache_key_value, entry, negative_ttl, local_ttl=local_ttl)
+            logger.debug(f"Negative cache set for key: {cache_key_value}")
+          return result
+
+      def wait_for_value(cache_key_value):
+          deadline = time.time() + lock_wait
+          while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache_service.get(cache_key_value)
+            if entry is not None:
+              value, delta, expires_at = _unwrap_entry(entry)
+              if expires_at is None or time.time() < expires_at:
+                return value
+          return _MISSING
+
+      def lookup(cache_key_value, args, kwargs):
+          # Try to get from cache (local tier first when enabled)
+          entry = cache_service.get(cache_key_value, local_ttl=local_ttl)
+          value = None
+          expires_at = None
+          if entry is not None:
+            if _is_fresh_negative(entry):
+              logger.debug(f"Negative cache hit for key: {cache_key_value}")
+              return None
+            
+            value, delta, expires_at = _unwrap_entry(entry)
+            if value is not None and not _needs_refresh(delta, expires_at, beta):
+              logger.debug(f"Cache hit for key: {cache_key_value}")
+              return value
+            
+            if value is not None and stale_ttl:
+              _enqueue_refresh(f, cache_key_value, args, kwargs, lock_timeout)
+              logger.debug(f"Serving stale value for key: {cache_key_value}")
+              return value
+          
+          if not single_flight:
+            return recompute(cache_key_value, args, kwargs)
+          
+          lock = cache_service.lock(cache_key_value, timeout=lock_timeout)
+          if lock is None:
+            return recompute(cache_key_value, args, kwargs)
+          
+          try:
+            acquired = lock.acquire(blocking=False)
+          except Exception as e:
+            logger.error(f"Error acquiring lock for key {cache_key_value}: {str(e)}")
+            acquired = False
+          
+          if acquired:
+            try:
+              # Another worker may have finished rebuilding just before we locked
+              entry = cache_service.get(cache_key_value)
+              if entry is not None:
+                fresh_value, delta, fresh_expires_at = _unwrap_entry(entry)
+                if fresh_expires_at != expires_at and (
+                    fresh_expires_at is None or time.time() < fresh_expires_at) and (
+                    fresh_value is not None or _is_fresh_negative(entry)):
+                  return fresh_value
+              return recompute(cache_key_value, args, kwargs)
+            finally:
+              try:
+                lock.release()
+              except Exception:
+                # Lock expired while recomputing; it is gone either way
+                pass
+          
+          # Another worker is rebuilding: serve what we have, or wait for it
+          if value is not None:
+            logger.debug(f"Serving stale value while key is rebuilt: {cache_key_value}")
+            return value
+          
+          value = wait_for_value(cache_key_value)
+          if value is not _MISSING:
+            return value
+          return recompute(cache_key_value, args, kwargs)
+
       @wraps(f)
       def decorated_function(*args, **kwargs):
-          # Skip caching if Redis is not connected
-          if not cache_service.is_connected():
-            return f(*args, **kwargs)
-          
           # Check unless condition
           if unless and unless():
             return f(*args, **kwargs)
           
           # Generate cache key
-          if key_pattern:
-            cache_key = key_pattern
-          else:
-            # Generate key from function name and arguments
-            key_parts = [f.__module__, f.__name__]
-            key_parts.extend([str(arg) for arg in args])
-            for k, v in sorted(kwargs.items()):
-              key_parts.append(f"{k}={v}")
-            cache_key = "::".join(key_parts)
+          cache_key_value = cache_key(*args, **kwargs)
+          
+          if coalesce:
+            return _flights.do(cache_key_value, lookup, cache_key_value, args, kwargs)
+          return lookup(cache_key_value, args, kwargs)
+
+      def refresh(*args, **kwargs):
+          """Recompute and store the entry unconditionally (used by the refresh task)"""
+          return recompute(cache_key(*args, **kwargs), args, kwargs)
+
+      def prime_many(values, delta=0.0):
+          """
+          Store precomputed results, {positional args tuple: value}, in one
+          pipeline; used by cache warm-up to fill entries from bulk queries
+          """
+          entries = {
+            cache_key(*args): _wrap_entry(value, expiry, delta)
+            for args, value in values.items() if value is not None
+          }
+          if not entries:
+            return False
+          return cache_service.set_many(entries, expiry + stale_grace if expiry else None, local_ttl=local_ttl)
+
+      decorated_function.cache_key = cache_key
+      decorated_function.refresh = refresh
+      decorated_function.prime_many = prime_many
+      return decorated_function
+  return decorator
+
+def cached_batch(key_pattern=None, ids_arg=None, id_name=None, expiry=3600, local_ttl=None, negative_ttl=None):
+  """
+  Decorator caching a batch function per item.
+
+  The wrapped function takes a collection of ids (its first parameter, or
+  ids_arg) plus any other arguments, and returns {id: value} for the ids it
+  found. Each id is cached under key_pattern rendered with the other
+  arguments and the single id bound as id_name (default: ids_arg without
+  its trailing "s"), so entries are shared with @cached functions using the
+  same pattern. Hits come back in one MGET; the function is called once,
+  with the missing ids only, and its results are written back in one
+  pipeline. Ids the function found nothing for are not cached, unless
+  negative_ttl is set: then they are cached as "not found" (see @cached)
+  for that many seconds and left out of the result without a call.
+  """
+  def decorator(f):
+      parameters = list(inspect.signature(f).parameters)
+      batch_arg = ids_arg or parameters[0]
+      item_name = id_name or batch_arg.rstrip('s')
+
+      def item_keys(ids, arguments):
+          keys = {}
+          for item_id in ids:
+            item_arguments = dict(arguments)
+            item_arguments[item_name] = item_id
+            keys[item_id] = build_key_from_arguments(key_pattern, f, item_arguments)
+          return keys
+
+      @wraps(f)
+      def decorated_function(*args, **kwargs):
+          arguments = bind_arguments(f, args, kwargs)
+          ids = list(dict.fromkeys(arguments.pop(batch_arg) or []))
+          if not ids:
+            return {}
           
-          # Try to get from cache
-          cached_result = cache_service.get(cache_key)
-          if cached_result is not None:
-            logger.debug(f"Cache hit for key: {cache_key}")
-            return cached_result
+          keys = item_keys(ids, arguments)
+          entries = cache_service.get_many(list(keys.values()), local_ttl=local_ttl)
           
-          # Execute function and cache result
-          result = f(*args, **kwargs)
-          cache_service.set(cache_key, result, expiry)
-          logger.debug(f"Cache set for key: {cache_key}")
+          result = {}
+          missing = []
+          for item_id in ids:
+            entry = entries.get(keys[item_id])
+            if _is_fresh_negative(entry):
+              continue
+            value, delta, expires_at = _unwrap_entry(entry) if entry is not None else (None, 0.0, None)
+            if value is not None and (expires_at is None or time.time() < expires_at):
+              result[item_id] = value
+            else:
+              missing.append(item_id)
+          
+          if missing:
+            started = time.time()
+            loaded = f(**{batch_arg: missing}, **arguments) or {}
+            delta = (time.time() - started) / len(missing)
+            
+            fresh = {}
+            for item_id, value in loaded.items():
+              if value is None:
+                continue
+              result[item_id] = value
+              if item_id in keys:
+                fresh[keys[item_id]] = _wrap_entry(value, expiry, delta)
+            if fresh:
+              cache_service.set_many(fresh, expiry, local_ttl=local_ttl)
+            
+            if negative_ttl:
+              not_found = {
+                keys[item_id]: _wrap_entry(None, negative_ttl, delta, negative=True)
+                for item_id in missing if item_id not in result
+              }
+              if not_found:
+                cache_service.set_many(not_found, negative_ttl, local_ttl=local_ttl)
+            logger.debug(f"Batch cache: {len(ids) - len(missing)} hits, {len(missing)} misses")
           
           return result
+
+      def cache_keys(*args, **kwargs):
+          arguments = bind_arguments(f, args, kwargs)
+          return item_keys(list(arguments.pop(batch_arg) or []), arguments)
+
+      decorated_function.cache_keys = cache_keys
       return decorated_function
   return decorator
 
@@ -202,7 +1248,7 @@ def invalidate_cache(pattern):
       
       # Invalidate cache after function execution
       if cache_service.is_connected():
-        cache_service.delete_pattern(pattern)
+        cache_service.invalidate(pattern)
         logger.debug(f"Invalidated cache pattern: {pattern}")
       
       return result
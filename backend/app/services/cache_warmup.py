@@ -0,0 +1,104 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import distinct, func
+from app.models import Appointment, Doctor, db
+from app.models.cached_models import CachedDoctor, CachedStats
+from app.models.read_models import load_doctor_views
+from app.services.schedule_index import schedule_index
+
+logger = logging.getLogger(__name__)
+
+def _grouped_counts(query):
+  return {doctor_id: count for doctor_id, count in query.all()}
+
+def load_doctor_dashboard_stats(doctor_ids, today):
+  """
+  get_doctor_dashboard_stats for many doctors with three grouped queries
+  """
+  today_counts = _grouped_counts(db.session.query(
+    Appointment.doctor_id, func.count(Appointment.id)
+  ).filter(
+    Appointment.doctor_id.in_(doctor_ids),
+    Appointment.appointment_date == today
+  ).group_by(Appointment.doctor_id))
+
+  upcoming_counts = _grouped_counts(db.session.query(
+    Appointment.doctor_id, func.count(Appointment.id)
+  ).filter(
+    Appointment.doctor_id.in_(doctor_ids),
+    Appointment.appointment_date >= today,
+    Appointment.appointment_date <= today + timedelta(days=7),
+    Appointment.status == 'scheduled'
+  ).group_by(Appointment.doctor_id))
+
+  patient_counts = _grouped_counts(db.session.query(
+    Appointment.doctor_id, func.count(distinct(Appointment.patient_id))
+  ).filter(
+    Appointment.doctor_id.in_(doctor_ids)
+  ).group_by(Appointment.doctor_id))
+
+  return {
+    doctor_id: {
+      'today_appointments': today_counts.get(doctor_id, 0),
+      'upcoming_appointments': upcoming_counts.get(doctor_id, 0),
+      'total_patients': patient_counts.get(doctor_id, 0)
+    }
+    for doctor_id in doctor_ids
+  }
+
+def warm_cache(days=7):
+  """
+  Pre-populate the entries the first requests of the day would otherwise
+  miss: dashboards, departments, doctor lists per department and the next
+  `days` days of availability for every available doctor. Everything is
+  loaded with a handful of bulk queries and written with pipelined sets.
+  Returns the number of entries written per group.
+  """
+  today = datetime.now().date()
+  summary = {}
+
+  CachedStats.get_admin_dashboard_stats.refresh()
+  summary['admin_dashboard_stats'] = 1
+
+  started = time.time()
+  doctor_ids = [doctor_id for doctor_id, in db.session.query(Doctor.id).all()]
+  if doctor_ids:
+    doctor_stats = load_doctor_dashboard_stats(doctor_ids, today)
+    CachedStats.get_doctor_dashboard_stats.prime_many(
+      {(doctor_id,): stats for doctor_id, stats in doctor_stats.items()},
+      delta=(time.time() - started) / len(doctor_ids)
+    )
+  summary['doctor_dashboard_stats'] = len(doctor_ids)
+
+  departments = CachedDoctor.get_all_departments.refresh()
+  summary['departments'] = 1
+
+  # One query for every available doctor, then split per department
+  started = time.time()
+  doctors = load_doctor_views()
+  doctors_by_department = defaultdict(list)
+  for doctor in doctors:
+    doctors_by_department[doctor.department_id].append(doctor)
+  doctor_lists = {(None, None): doctors}
+  for department in departments or []:
+    doctor_lists[(None, department.id)] = doctors_by_department.get(department.id, [])
+  CachedDoctor.get_available_doctors.prime_many(
+    doctor_lists, delta=time.time() - started
+  )
+  summary['doctor_lists'] = len(doctor_lists)
+
+  started = time.time()
+  available_ids = [doctor.id for doctor in doctors]
+  end_date = today + timedelta(days=days)
+  availability = schedule_index.availability(available_ids, today, end_date)
+  if availability:
+    CachedDoctor.get_doctor_availability.prime_many(
+      {(doctor_id, today, end_date): slots for doctor_id, slots in availability.items()},
+      delta=(time.time() - started) / len(availability)
+    )
+  summary['doctor_availability'] = len(availability)
+
+  logger.info(f"Cache warm-up completed: {summary}")
+  return summary
@@ -0,0 +1,78 @@
+import threading
+import time
+
+
+class CircuitBreaker:
+  """
+  Tracks consecutive failures of a remote dependency. After failure_threshold
+  failures the circuit opens and callers skip the dependency for
+  recovery_timeout seconds; then a single probe call is let through to decide
+  whether to close it again.
+  """
+  CLOSED = 'closed'
+  OPEN = 'open'
+  HALF_OPEN = 'half_open'
+
+  def __init__(self, failure_threshold=5, recovery_timeout=30.0):
+    self.failure_threshold = failure_threshold
+    self.recovery_timeout = recovery_timeout
+    self.state = self.CLOSED
+    self.failures = 0
+    self.opened_at = None
+    self.last_error = None
+    self._probe_in_flight = False
+    self._probe_started_at = None
+    self._lock = threading.Lock()
+
+  def allow(self):
+    """Return True if a call to the dependency should be attempted"""
+    if self.state == self.CLOSED:
+      return True
+
+    with self._lock:
+      if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+        self.state = self.HALF_OPEN
+        self._probe_in_flight = False
+
+      # A probe whose outcome was never reported must not block recovery
+      probe_expired = (
+        self._probe_in_flight and
+        time.monotonic() - self._probe_started_at >= self.recovery_timeout
+      )
+      if self.state == self.HALF_OPEN and (not self._probe_in_flight or probe_expired):
+        self._probe_in_flight = True
+        self._probe_started_at = time.monotonic()
+        return True
+
+      return self.state == self.CLOSED
+
+  def record_success(self):
+    if self.state == self.CLOSED and self.failures == 0:
+      return
+    with self._lock:
+      self.state = self.CLOSED
+      self.failures = 0
+      self.opened_at = None
+      self._probe_in_flight = False
+
+  def record_failure(self, error=None):
+    with self._lock:
+      self.failures += 1
+      self.last_error = str(error) if error else None
+      if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+  def snapshot(self):
+    """Current breaker state, without touching the dependency"""
+    retry_in = None
+    if self.state == self.OPEN:
+      retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+    return {
+      'state': self.state,
+      'failures': self.failures,
+      'failure_threshold': self.failure_threshold,
+      'retry_in_seconds': round(retry_in, 1) if retry_in is not None else None,
+      'last_error': self.last_error
+    }
@@ -5,6 +5,7 @@ from email.mime.application import MimeApplication
 import os
 from datetime import datetime
 import logging
+from app.services.tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -52,11 +53,12 @@ class EmailService:
                 msg.attach(part)
           
           # Send email
-          with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-            if self.use_tls:
-              server.starttls()
-            server.login(self.smtp_username, self.smtp_password)
-            server.send_message(msg)
+          with span('smtp.send', server=self.smtp_server, attachments=len(attachments or [])):
+            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+              if self.use_tls:
+                server.starttls()
+              server.login(self.smtp_username, self.smtp_password)
+              server.send_message(msg)
           
           logger.info(f"Email sent successfully to {to_email}")
           return True
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+  """
+  Bounded in-process LRU cache with per-entry TTL and a byte budget.
+  Entries hold serialized payloads, so callers always get a fresh copy.
+  """
+  def __init__(self, max_entries=1024, max_bytes=8 * 1024 * 1024):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self._entries = OrderedDict()  # key -> (payload, expires_at, size)
+    self._bytes = 0
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    """Return the payload for key, or None when missing or expired"""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+
+      payload, expires_at, size = entry
+      if expires_at <= time.monotonic():
+        self._remove(key)
+        return None
+
+      self._entries.move_to_end(key)
+      return payload
+
+  def set(self, key, payload, ttl):
+    """Store payload for ttl seconds, evicting least recently used entries"""
+    size = len(payload)
+    if size > self.max_bytes or ttl <= 0:
+      return False
+
+    with self._lock:
+      if key in self._entries:
+        self._remove(key)
+
+      self._entries[key] = (payload, time.monotonic() + ttl, size)
+      self._bytes += size
+
+      while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+        oldest_key = next(iter(self._entries))
+        self._remove(oldest_key)
+      return True
+
+  def delete(self, key):
+    with self._lock:
+      if key in self._entries:
+        self._remove(key)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def stats(self):
+    with self._lock:
+      return {
+        'entries': len(self._entries),
+        'bytes': self._bytes,
+        'max_entries': self.max_entries,
+        'max_bytes': self.max_bytes
+      }
+
+  def _remove(self, key):
+    _, _, size = self._entries.pop(key)
+    self._bytes -= size
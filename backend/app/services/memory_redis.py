@@ -0,0 +1,583 @@
+"""
+In-process stand-in for the subset of redis-py the cache uses, selected with
+CACHE_BACKEND = 'memory'. Meant for benchmarks, CI and laptops without a Redis
+server: data lives in this process only, so pub/sub reaches subscribers in the
+same process and nothing is shared between workers.
+"""
+import fnmatch
+import queue
+import threading
+import time
+import uuid
+from redis.exceptions import LockError, LockNotOwnedError, ResponseError
+
+def _key(name):
+  return name.decode('utf-8') if isinstance(name, bytes) else str(name)
+
+def _encode(value):
+  """Store values the way Redis returns them: as bytes"""
+  if isinstance(value, bytes):
+    return value
+  if isinstance(value, str):
+    return value.encode('utf-8')
+  if isinstance(value, (int, float)) and not isinstance(value, bool):
+    return repr(value).encode('ascii')
+  raise ResponseError(f"Invalid input of type: '{type(value).__name__}'")
+
+def _score(value):
+  if isinstance(value, bytes):
+    value = value.decode('ascii')
+  if isinstance(value, str) and value.startswith('('):
+    raise ResponseError("Exclusive score ranges are not supported")
+  return float(value)
+
+class _Entry:
+  __slots__ = ('kind', 'value', 'expires_at', 'accessed_at', 'hits')
+
+  def __init__(self, kind, value, expires_at=None):
+    self.kind = kind
+    self.value = value
+    self.expires_at = expires_at
+    self.accessed_at = time.monotonic()
+    self.hits = 0
+
+class _Server:
+  """State shared by every client created for the same URL"""
+  def __init__(self, maxmemory_policy='noeviction'):
+    self.lock = threading.RLock()
+    self.data = {}
+    self.channels = {}
+    self.maxmemory_policy = maxmemory_policy
+    self.keyspace_hits = 0
+    self.keyspace_misses = 0
+    self.commands = 0
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+class MemoryPubSub:
+  def __init__(self, server, ignore_subscribe_messages=False):
+    self._server = server
+    self._queue = queue.Queue()
+    self._channels = set()
+    self.ignore_subscribe_messages = ignore_subscribe_messages
+
+  def subscribe(self, *channels):
+    with self._server.lock:
+      for channel in channels:
+        channel = _key(channel)
+        self._server.channels.setdefault(channel, set()).add(self)
+        self._channels.add(channel)
+        if not self.ignore_subscribe_messages:
+          self._queue.put({
+            'type': 'subscribe', 'pattern': None,
+            'channel': channel.encode('utf-8'), 'data': len(self._channels)
+          })
+
+  def unsubscribe(self, *channels):
+    with self._server.lock:
+      for channel in [_key(c) for c in channels] or list(self._channels):
+        self._server.channels.get(channel, set()).discard(self)
+        self._channels.discard(channel)
+
+  def _deliver(self, channel, data):
+    self._queue.put({'type': 'message', 'pattern': None, 'channel': channel.encode('utf-8'), 'data': data})
+
+  def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+    try:
+      message = self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+    except queue.Empty:
+      return None
+    if message is None:
+      return None
+    if message['type'] != 'message' and (ignore_subscribe_messages or self.ignore_subscribe_messages):
+      return None
+    return message
+
+  def listen(self):
+    while self._channels:
+      message = self._queue.get()
+      if message is None:
+        return
+      yield message
+
+  def close(self):
+    self.unsubscribe()
+    self._queue.put(None)
+
+class MemoryLock:
+  """redis-py Lock semantics on top of SET NX PX with a random token"""
+  def __init__(self, client, name, timeout=None, sleep=0.01, blocking=True, blocking_timeout=None):
+    self.client = client
+    self.name = name
+    self.timeout = timeout
+    self.sleep = sleep
+    self.blocking = blocking
+    self.blocking_timeout = blocking_timeout
+    self.token = None
+
+  def acquire(self, blocking=None, blocking_timeout=None, token=None):
+    blocking = self.blocking if blocking is None else blocking
+    blocking_timeout = self.blocking_timeout if blocking_timeout is None else blocking_timeout
+    token = _encode(token or uuid.uuid4().hex)
+    deadline = time.monotonic() + blocking_timeout if blocking_timeout is not None else None
+    while True:
+      if self.client.set(self.name, token, px=int(self.timeout * 1000) if self.timeout else None, nx=True):
+        self.token = token
+        return True
+      if not blocking or (deadline is not None and time.monotonic() >= deadline):
+        return False
+      time.sleep(self.sleep)
+
+  def locked(self):
+    return self.client.get(self.name) is not None
+
+  def owned(self):
+    return self.token is not None and self.client.get(self.name) == self.token
+
+  def release(self):
+    if self.token is None:
+      raise LockError("Cannot release an unlocked lock")
+    with self.client._server.lock:
+      if self.client.get(self.name) != self.token:
+        self.token = None
+        raise LockNotOwnedError("Cannot release a lock that's no longer owned")
+      self.client.delete(self.name)
+    self.token = None
+
+  def __enter__(self):
+    if self.acquire():
+      return self
+    raise LockError("Unable to acquire lock within the time specified")
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.release()
+
+class MemoryPipeline:
+  """Queues commands and runs them together under the server lock"""
+  def __init__(self, client):
+    self._client = client
+    self._commands = []
+
+  def __getattr__(self, name):
+    method = getattr(self._client, name)
+
+    def queue_command(*args, **kwargs):
+      self._commands.append((method, args, kwargs))
+      return self
+    return queue_command
+
+  def execute(self, raise_on_error=True):
+    results = []
+    with self._client._server.lock:
+      for method, args, kwargs in self._commands:
+        try:
+          results.append(method(*args, **kwargs))
+        except ResponseError as e:
+          if raise_on_error:
+            self._commands = []
+            raise
+          results.append(e)
+    self._commands = []
+    return results
+
+  def reset(self):
+    self._commands = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.reset()
+
+  def __len__(self):
+    return len(self._commands)
+
+class MemoryRedis:
+  """
+  Thread-safe, bytes-returning implementation of the redis-py commands used
+  by CacheService and CacheBudgets. Expired keys are removed lazily, as
+  Redis does on access.
+  """
+  def __init__(self, server=None):
+    self._server = server or _Server()
+
+  @classmethod
+  def from_url(cls, url='memory://', maxmemory_policy='noeviction', **kwargs):
+    """Clients created for the same URL share one dataset"""
+    with _servers_lock:
+      server = _servers.get(url)
+      if server is None:
+        server = _servers[url] = _Server(maxmemory_policy=maxmemory_policy)
+    return cls(server)
+
+  # Internals
+
+  def _entry(self, name, kind=None, touch=True):
+    data = self._server.data
+    name = _key(name)
+    entry = data.get(name)
+    if entry is not None and entry.expires_at is not None and entry.expires_at <= time.time():
+      del data[name]
+      entry = None
+    if entry is not None:
+      if kind and entry.kind != kind:
+        raise ResponseError("WRONGTYPE Operation against a key holding the wrong kind of value")
+      if touch:
+        entry.accessed_at = time.monotonic()
+        entry.hits += 1
+    return entry
+
+  def _container(self, name, kind, factory):
+    entry = self._entry(name, kind)
+    if entry is None:
+      entry = self._server.data[_key(name)] = _Entry(kind, factory())
+    return entry
+
+  def _count(self, hit=None):
+    self._server.commands += 1
+    if hit is True:
+      self._server.keyspace_hits += 1
+    elif hit is False:
+      self._server.keyspace_misses += 1
+
+  # Connection
+
+  def ping(self):
+    return True
+
+  def close(self):
+    pass
+
+  # Strings
+
+  def get(self, name):
+    with self._server.lock:
+      entry = self._entry(name, 'string')
+      self._count(entry is not None)
+      return entry.value if entry else None
+
+  def mget(self, keys, *args):
+    names = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+    names.extend(args)
+    with self._server.lock:
+      return [self.get(name) for name in names]
+
+  def set(self, name, value, ex=None, px=None, nx=False, xx=False, keepttl=False):
+    with self._server.lock:
+      self._count()
+      existing = self._entry(name, touch=False)
+      if (nx and existing is not None) or (xx and existing is None):
+        return None
+      expires_at = None
+      if ex is not None:
+        expires_at = time.time() + (ex.total_seconds() if hasattr(ex, 'total_seconds') else ex)
+      elif px is not None:
+        expires_at = time.time() + (px.total_seconds() if hasattr(px, 'total_seconds') else px / 1000.0)
+      elif keepttl and existing is not None:
+        expires_at = existing.expires_at
+      self._server.data[_key(name)] = _Entry('string', _encode(value), expires_at)
+      return True
+
+  def setex(self, name, time_seconds, value):
+    return self.set(name, value, ex=time_seconds)
+
+  def incrby(self, name, amount=1):
+    with self._server.lock:
+      self._count()
+      entry = self._entry(name, 'string')
+      try:
+        current = int(entry.value) if entry else 0
+      except ValueError:
+        raise ResponseError("value is not an integer or out of range")
+      value = current + int(amount)
+      if entry:
+        entry.value = _encode(value)
+      else:
+        self._server.data[_key(name)] = _Entry('string', _encode(value))
+      return value
+
+  def incr(self, name, amount=1):
+    return self.incrby(name, amount)
+
+  # Keys
+
+  def delete(self, *names):
+    with self._server.lock:
+      self._count()
+      removed = 0
+      for name in names:
+        if self._entry(name, touch=False) is not None:
+          del self._server.data[_key(name)]
+          removed += 1
+      return removed
+
+  def unlink(self, *names):
+    return self.delete(*names)
+
+  def exists(self, *names):
+    with self._server.lock:
+      self._count()
+      return sum(1 for name in names if self._entry(name, touch=False) is not None)
+
+  def expire(self, name, time_seconds):
+    with self._server.lock:
+      entry = self._entry(name, touch=False)
+      if entry is None:
+        return False
+      entry.expires_at = time.time() + time_seconds
+      return True
+
+  def ttl(self, name):
+    with self._server.lock:
+      entry = self._entry(name, touch=False)
+      if entry is None:
+        return -2
+      if entry.expires_at is None:
+        return -1
+      return max(0, int(round(entry.expires_at - time.time())))
+
+  def _live_keys(self, match=None):
+    now = time.time()
+    names = []
+    for name, entry in list(self._server.data.items()):
+      if entry.expires_at is not None and entry.expires_at <= now:
+        del self._server.data[name]
+        continue
+      if match is None or fnmatch.fnmatchcase(name, _key(match)):
+        names.append(name)
+    return names
+
+  def keys(self, pattern='*'):
+    with self._server.lock:
+      return [name.encode('utf-8') for name in self._live_keys(pattern)]
+
+  def scan(self, cursor=0, match=None, count=None, _type=None):
+    """Cursor is an offset into a snapshot of the key list; good enough for sweeps"""
+    with self._server.lock:
+      names = self._live_keys(match)
+    count = count or 10
+    batch = names[cursor:cursor + count]
+    next_cursor = cursor + count if cursor + count < len(names) else 0
+    return next_cursor, [name.encode('utf-8') for name in batch]
+
+  def scan_iter(self, match=None, count=None, _type=None):
+    with self._server.lock:
+      names = self._live_keys(match)
+    for name in names:
+      yield name.encode('utf-8')
+
+  def dbsize(self):
+    with self._server.lock:
+      return len(self._live_keys())
+
+  def flushdb(self, asynchronous=False):
+    with self._server.lock:
+      self._server.data.clear()
+      return True
+
+  def object(self, infotype, key):
+    with self._server.lock:
+      entry = self._entry(key, touch=False)
+      if entry is None:
+        return None
+      infotype = infotype.lower()
+      if infotype == 'idletime':
+        return int(time.monotonic() - entry.accessed_at)
+      if infotype == 'freq':
+        if not self._server.maxmemory_policy.endswith('lfu'):
+          raise ResponseError("An LFU maxmemory policy is not selected, access frequency not tracked.")
+        return min(entry.hits, 255)
+      if infotype == 'encoding':
+        return {'string': b'raw', 'hash': b'hashtable', 'zset': b'skiplist'}[entry.kind]
+      raise ResponseError(f"Unknown subcommand '{infotype}'")
+
+  def info(self, section=None):
+    with self._server.lock:
+      names = self._live_keys()
+      used = 0
+      for name in names:
+        entry = self._server.data[name]
+        if entry.kind == 'string':
+          used += len(entry.value)
+        elif entry.kind == 'hash':
+          used += sum(len(field) + len(value) for field, value in entry.value.items())
+        else:
+          used += sum(len(member) + 8 for member in entry.value)
+      return {
+        'redis_version': 'memory',
+        'connected_clients': 1,
+        'used_memory': used,
+        'used_memory_human': f"{used / 1024.0:.2f}K",
+        'keyspace_hits': self._server.keyspace_hits,
+        'keyspace_misses': self._server.keyspace_misses,
+        'total_commands_processed': self._server.commands,
+        'maxmemory_policy': self._server.maxmemory_policy,
+        'db0': {'keys': len(names), 'expires': 0}
+      }
+
+  # Hashes
+
+  def hset(self, name, key=None, value=None, mapping=None, items=None):
+    with self._server.lock:
+      self._count()
+      fields = dict(mapping or {})
+      if key is not None:
+        fields[key] = value
+      for pair in zip(*[iter(items or [])] * 2):
+        fields[pair[0]] = pair[1]
+      entry = self._container(name, 'hash', dict)
+      added = 0
+      for field, field_value in fields.items():
+        field = _encode(field)
+        added += field not in entry.value
+        entry.value[field] = _encode(field_value)
+      return added
+
+  def hget(self, name, key):
+    with self._server.lock:
+      entry = self._entry(name, 'hash')
+      return entry.value.get(_encode(key)) if entry else None
+
+  def hmget(self, name, keys, *args):
+    fields = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+    fields.extend(args)
+    with self._server.lock:
+      entry = self._entry(name, 'hash')
+      return [entry.value.get(_encode(field)) if entry else None for field in fields]
+
+  def hgetall(self, name):
+    with self._server.lock:
+      entry = self._entry(name, 'hash')
+      return dict(entry.value) if entry else {}
+
+  def hkeys(self, name):
+    return list(self.hgetall(name))
+
+  def hvals(self, name):
+    return list(self.hgetall(name).values())
+
+  def hlen(self, name):
+    return len(self.hgetall(name))
+
+  def hexists(self, name, key):
+    return self.hget(name, key) is not None
+
+  def hdel(self, name, *keys):
+    with self._server.lock:
+      self._count()
+      entry = self._entry(name, 'hash', touch=False)
+      if entry is None:
+        return 0
+      removed = 0
+      for field in keys:
+        if entry.value.pop(_encode(field), None) is not None:
+          removed += 1
+      if not entry.value:
+        del self._server.data[_key(name)]
+      return removed
+
+  def hincrby(self, name, key, amount=1):
+    with self._server.lock:
+      self._count()
+      entry = self._container(name, 'hash', dict)
+      field = _encode(key)
+      value = int(entry.value.get(field, b'0')) + int(amount)
+      entry.value[field] = _encode(value)
+      return value
+
+  # Sorted sets
+
+  def zadd(self, name, mapping, nx=False, xx=False, ch=False, incr=False, gt=False, lt=False):
+    with self._server.lock:
+      self._count()
+      entry = self._container(name, 'zset', dict)
+      changed = 0
+      for member, score in mapping.items():
+        member = _encode(member)
+        score = _score(score)
+        exists = member in entry.value
+        if (nx and exists) or (xx and not exists):
+          continue
+        if exists and ((gt and score <= entry.value[member]) or (lt and score >= entry.value[member])):
+          continue
+        if not exists or (ch and entry.value[member] != score):
+          changed += 1
+        entry.value[member] = score
+      return changed
+
+  def zrem(self, name, *values):
+    with self._server.lock:
+      self._count()
+      entry = self._entry(name, 'zset', touch=False)
+      if entry is None:
+        return 0
+      removed = sum(1 for value in values if entry.value.pop(_encode(value), None) is not None)
+      if not entry.value:
+        del self._server.data[_key(name)]
+      return removed
+
+  def zscore(self, name, value):
+    with self._server.lock:
+      entry = self._entry(name, 'zset')
+      return entry.value.get(_encode(value)) if entry else None
+
+  def zcard(self, name):
+    with self._server.lock:
+      entry = self._entry(name, 'zset')
+      return len(entry.value) if entry else 0
+
+  def _sorted_members(self, name):
+    entry = self._entry(name, 'zset')
+    if entry is None:
+      return []
+    return sorted(entry.value.items(), key=lambda item: (item[1], item[0]))
+
+  def zrange(self, name, start, end, desc=False, withscores=False, score_cast_func=float):
+    with self._server.lock:
+      members = self._sorted_members(name)
+    if desc:
+      members.reverse()
+    end = len(members) - 1 if end == -1 else end
+    if end < 0:
+      end += len(members)
+    selected = members[start:end + 1]
+    if withscores:
+      return [(member, score_cast_func(score)) for member, score in selected]
+    return [member for member, _ in selected]
+
+  def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False, score_cast_func=float):
+    low, high = _score(min), _score(max)
+    with self._server.lock:
+      members = [(m, s) for m, s in self._sorted_members(name) if low <= s <= high]
+    if start is not None and num is not None:
+      members = members[start:start + num]
+    if withscores:
+      return [(member, score_cast_func(score)) for member, score in members]
+    return [member for member, _ in members]
+
+  def zremrangebyscore(self, name, min, max):
+    with self._server.lock:
+      members = self.zrangebyscore(name, min, max)
+      return self.zrem(name, *members) if members else 0
+
+  # Pub/sub
+
+  def publish(self, channel, message):
+    with self._server.lock:
+      self._count()
+      subscribers = list(self._server.channels.get(_key(channel), ()))
+    for subscriber in subscribers:
+      subscriber._deliver(_key(channel), _encode(message))
+    return len(subscribers)
+
+  def pubsub(self, ignore_subscribe_messages=False, **kwargs):
+    return MemoryPubSub(self._server, ignore_subscribe_messages=ignore_subscribe_messages)
+
+  # Locks and pipelines
+
+  def lock(self, name, timeout=None, sleep=0.01, blocking=True, blocking_timeout=None, thread_local=True):
+    return MemoryLock(self, name, timeout=timeout, sleep=sleep, blocking=blocking, blocking_timeout=blocking_timeout)
+
+  def pipeline(self, transaction=True, shard_hint=None):
+    return MemoryPipeline(self)
@@ -0,0 +1,93 @@
+"""
+Prometheus metrics for the API, the database, the cache and Celery.
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory
+before the workers start: every process then writes its samples there and
+/metrics aggregates all of them. Call mark_process_dead(worker.pid) from
+gunicorn's child_exit hook so dead workers' live gauges are dropped.
+Without prometheus_client installed every recorder is a no-op.
+"""
+import logging
+import os
+
+try:
+  import prometheus_client
+  from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+  from prometheus_client import multiprocess
+except ImportError:
+  prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+# Request latency buckets (seconds): fine-grained below 1s for p95/p99
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.35, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+if prometheus_client is not None:
+  REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency',
+    ['blueprint', 'endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS
+  )
+  REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements executed per request',
+    ['endpoint'], buckets=QUERY_COUNT_BUCKETS
+  )
+  REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL per request',
+    ['endpoint'], buckets=LATENCY_BUCKETS
+  )
+  CACHE_LOOKUPS = Counter(
+    'cache_lookups_total', 'Cache lookups by namespace and result (hit, local_hit, miss)',
+    ['namespace', 'result']
+  )
+  CELERY_TASKS_PUBLISHED = Counter(
+    'celery_tasks_published_total', 'Celery tasks enqueued by this service', ['task']
+  )
+
+def enabled():
+  return prometheus_client is not None
+
+def observe_request(blueprint, endpoint, method, status, seconds, db_queries, db_seconds):
+  if prometheus_client is None:
+    return
+  endpoint = endpoint or 'unmatched'
+  REQUEST_LATENCY.labels(blueprint or 'app', endpoint, method, str(status)).observe(seconds)
+  REQUEST_DB_QUERIES.labels(endpoint).observe(db_queries)
+  REQUEST_DB_SECONDS.labels(endpoint).observe(db_seconds)
+
+def observe_cache_lookup(namespace, hits=0, local_hits=0, misses=0):
+  if prometheus_client is None:
+    return
+  if hits - local_hits:
+    CACHE_LOOKUPS.labels(namespace, 'hit').inc(hits - local_hits)
+  if local_hits:
+    CACHE_LOOKUPS.labels(namespace, 'local_hit').inc(local_hits)
+  if misses:
+    CACHE_LOOKUPS.labels(namespace, 'miss').inc(misses)
+
+def observe_task_published(task_name):
+  if prometheus_client is None:
+    return
+  CELERY_TASKS_PUBLISHED.labels(task_name or 'unknown').inc()
+
+def setup_celery_metrics():
+  """Count tasks enqueued from this process via Celery's publish signal"""
+  from celery.signals import after_task_publish
+
+  @after_task_publish.connect(weak=False, dispatch_uid='metrics.after_task_publish')
+  def count_published_task(sender=None, headers=None, **kwargs):
+    observe_task_published((headers or {}).get('task') or sender)
+
+def render_latest():
+  """(body, content type) for the /metrics endpoint"""
+  if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+  else:
+    registry = prometheus_client.REGISTRY
+  return generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid):
+  """gunicorn child_exit hook helper for multiprocess mode"""
+  if prometheus_client is not None and os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    multiprocess.mark_process_dead(pid)
@@ -0,0 +1,171 @@
+"""
+On-demand request profiling.
+
+RequestProfiler wraps either cProfile (deterministic, saved as a .prof pstats
+dump for snakeviz/pstats) or a sampling thread that walks the request
+thread's stack every few milliseconds (saved as .collapsed stacks for
+flamegraph.pl/speedscope). ProfileStore keeps the results on disk, so every
+gunicorn worker serves the same list, and deletes the oldest profiles once
+the count or total size cap is exceeded.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+_PROFILE_ID = re.compile(r'^\d{14}-[0-9a-f]{8}$')
+
+class SamplingProfiler:
+  """Samples one thread's stack on a background thread; cheap enough for slow requests"""
+  def __init__(self, interval=0.005):
+    self.interval = interval
+    self.samples = Counter()
+    self._thread_id = None
+    self._stop = threading.Event()
+    self._sampler = None
+
+  def enable(self):
+    self._thread_id = threading.get_ident()
+    self._sampler = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+    self._sampler.start()
+
+  def disable(self):
+    self._stop.set()
+    if self._sampler is not None:
+      self._sampler.join()
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      frame = sys._current_frames().get(self._thread_id)
+      stack = []
+      while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+      if stack:
+        self.samples[';'.join(reversed(stack))] += 1
+
+  def dump(self, path):
+    with open(path, 'w') as output:
+      for stack, count in self.samples.most_common():
+        output.write(f"{stack} {count}\n")
+
+class RequestProfiler:
+  """One profiling run; mode is 'cprofile' or 'sample'"""
+  EXTENSIONS = {'cprofile': '.prof', 'sample': '.collapsed'}
+
+  def __init__(self, mode='cprofile', sample_interval=0.005):
+    self.mode = mode
+    self.started_at = None
+    self._profiler = SamplingProfiler(sample_interval) if mode == 'sample' else cProfile.Profile()
+
+  def start(self):
+    self.started_at = time.perf_counter()
+    self._profiler.enable()
+
+  def stop(self):
+    self._profiler.disable()
+    return time.perf_counter() - self.started_at
+
+  def dump(self, path):
+    if self.mode == 'sample':
+      self._profiler.dump(path)
+    else:
+      self._profiler.dump_stats(path)
+
+class ProfileStore:
+  """Size- and count-capped profile directory: <id><ext> plus <id>.json metadata"""
+  def __init__(self, directory, max_bytes=50 * 1024 * 1024, max_profiles=200):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.max_profiles = max_profiles
+    self._lock = threading.Lock()
+
+  def save(self, profiler, metadata):
+    """Write the profile and its metadata, prune old ones and return the profile id"""
+    os.makedirs(self.directory, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    data_path = os.path.join(self.directory, profile_id + RequestProfiler.EXTENSIONS[profiler.mode])
+    profiler.dump(data_path)
+
+    metadata = dict(metadata, id=profile_id, mode=profiler.mode, created_at=time.time(),
+                    file=os.path.basename(data_path), size=os.path.getsize(data_path))
+    with open(os.path.join(self.directory, profile_id + '.json'), 'w') as output:
+      json.dump(metadata, output)
+
+    self.prune()
+    return profile_id
+
+  def list(self):
+    """Metadata of every stored profile, newest first"""
+    if not os.path.isdir(self.directory):
+      return []
+    profiles = []
+    for name in os.listdir(self.directory):
+      if not name.endswith('.json'):
+        continue
+      try:
+        with open(os.path.join(self.directory, name)) as metadata:
+          profiles.append(json.load(metadata))
+      except (OSError, ValueError):
+        continue
+    return sorted(profiles, key=lambda profile: profile.get('created_at', 0), reverse=True)
+
+  def get(self, profile_id):
+    """(metadata, data file path) or None; ids are validated before touching the disk"""
+    if not _PROFILE_ID.match(profile_id or ''):
+      return None
+    try:
+      with open(os.path.join(self.directory, profile_id + '.json')) as metadata_file:
+        metadata = json.load(metadata_file)
+    except (OSError, ValueError):
+      return None
+    path = os.path.join(self.directory, metadata['file'])
+    return (metadata, path) if os.path.exists(path) else None
+
+  def summary(self, profile_id, limit=40):
+    """Text report of a pstats profile sorted by cumulative time"""
+    found = self.get(profile_id)
+    if found is None or found[0]['mode'] != 'cprofile':
+      return None
+    report = io.StringIO()
+    pstats.Stats(found[1], stream=report).sort_stats('cumulative').print_stats(limit)
+    return report.getvalue()
+
+  def delete(self, profile_id):
+    found = self.get(profile_id)
+    if found is None:
+      return False
+    self._remove(found[0])
+    return True
+
+  def prune(self):
+    """Drop the oldest profiles until both caps hold"""
+    with self._lock:
+      profiles = self.list()
+      total = sum(profile.get('size', 0) for profile in profiles)
+      while profiles and (len(profiles) > self.max_profiles or total > self.max_bytes):
+        oldest = profiles.pop()
+        total -= oldest.get('size', 0)
+        self._remove(oldest)
+
+  def _remove(self, metadata):
+    for name in (metadata['file'], metadata['id'] + '.json'):
+      try:
+        os.remove(os.path.join(self.directory, name))
+      except OSError:
+        pass
+
+# Global profile store, configured by setup_performance_monitoring()
+profile_store = ProfileStore(os.path.join(tempfile.gettempdir(), 'hospital-profiles'))
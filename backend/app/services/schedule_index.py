@@ -0,0 +1,355 @@
+"""
+Per-doctor, per-day schedule index in Redis hashes.
+
+Every (doctor, day) is one hash at the versioned
+CacheKeys.appointment_slots(doctor_id, day) key:
+
+  _loaded   1 (a hash without it is partial and is reloaded)
+  s:09:00   "<slot id>|<end time>|<max patients>|<open 0/1>"
+  b:09:00   booked places
+
+Slot fields only change with DoctorAvailability rows, whose commits delete
+the hash (CACHE_DEPENDENCIES). Booked places follow the booking events
+instead: the booked_count deltas of every committed transaction are applied
+with HINCRBY, so a booking keeps the day indexed. Days without slots are
+indexed too, so next-free-slot scans skip them without SQL.
+
+A load must not store a day whose booking it may or may not have counted.
+Booking transactions therefore announce their days before the database
+commit (begin_booking: `started` and `active` counters in a guard hash per
+day) and release them with the HINCRBY after it. A load reads the guard
+before its SQL query and skips the store while a booking is active; the
+store rereads `started` and deletes the hash again when a booking began
+meanwhile. The next read then loads the day afresh.
+
+Next-free-date lookups only read days that are already indexed; doctors
+they cannot settle are answered by one grouped query over the booking
+horizon (read_models.load_next_available_dates) instead of loading every
+day up to it.
+
+Availability listings and next-free-date lookups read the index. Booking
+validation (BookingContext, for bookings and the /conflicts/check pre-check
+alike) reads the database: reserve_slot() on DoctorAvailability.booked_count
+decides every booking. A hash expires SCHEDULE_INDEX_TTL seconds after it
+was loaded, which bounds the drift of writes that bypass the ORM.
+Without Redis every lookup is answered from the database.
+"""
+import logging
+import time
+from datetime import timedelta
+from app.models import DoctorAvailability, db
+from app.models.read_models import load_availability_slots, load_next_available_dates
+from app.services.cache_service import cache_service
+from app.utils.cache_keys import CacheKeys
+
+logger = logging.getLogger(__name__)
+
+LOADED_FIELD = '_loaded'
+
+def _text(value):
+  return value.decode('utf-8') if isinstance(value, bytes) else value
+
+def _clock(at):
+  return at.strftime('%H:%M')
+
+def _days(start_date, end_date):
+  return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+class ScheduleIndex:
+  # Longest date range read from the index; wider ranges go to the database
+  MAX_RANGE_DAYS = 62
+  # Days read from the index when looking for a doctor's next free slot;
+  # doctors not settled within them are answered by one SQL query
+  SCAN_WINDOW_DAYS = 14
+  # Longest a booking transaction keeps its days announced; a process that
+  # dies before releasing them only blocks their indexing this long
+  GUARD_TTL = 60
+
+  def _ttl(self):
+    return int(cache_service.setting('SCHEDULE_INDEX_TTL', 300))
+
+  def _encode(self, slots):
+    mapping = {LOADED_FIELD: 1}
+    for start, slot in slots.items():
+      mapping[f"s:{start}"] = f"{slot['id']}|{slot['end_time']}|{slot['max_patients']}|{int(slot['open'])}"
+      mapping[f"b:{start}"] = slot['booked']
+    return mapping
+
+  def _decode(self, raw):
+    """Slots of a stored hash, or None when it is missing or partial"""
+    fields = {_text(field): _text(value) for field, value in raw.items()}
+    if LOADED_FIELD not in fields:
+      return None
+    slots = {}
+    for field, value in fields.items():
+      if not field.startswith('s:'):
+        continue
+      slot_id, end_time, max_patients, is_open = value.split('|')
+      start = field[2:]
+      slots[start] = {
+        'id': int(slot_id),
+        'start_time': start,
+        'end_time': end_time,
+        'max_patients': int(max_patients),
+        'open': is_open == '1',
+        'booked': int(fields.get(f"b:{start}") or 0)
+      }
+    return slots
+
+  def _load(self, pairs):
+    """Slots of the given (doctor_id, day) pairs from the database, in one query"""
+    doctor_ids = {doctor_id for doctor_id, _ in pairs}
+    days = [day for _, day in pairs]
+    rows = db.session.query(
+      DoctorAvailability.id, DoctorAvailability.doctor_id, DoctorAvailability.date,
+      DoctorAvailability.start_time, DoctorAvailability.end_time, DoctorAvailability.max_patients,
+      DoctorAvailability.is_available, DoctorAvailability.booked_count
+    ).filter(
+      DoctorAvailability.doctor_id.in_(list(doctor_ids)),
+      DoctorAvailability.date >= min(days),
+      DoctorAvailability.date <= max(days)
+    ).all()
+
+    result = {pair: {} for pair in pairs}
+    for slot_id, doctor_id, day, start_time, end_time, max_patients, is_available, booked_count in rows:
+      if (doctor_id, day) in result:
+        result[(doctor_id, day)][_clock(start_time)] = {
+          'id': slot_id,
+          'start_time': _clock(start_time),
+          'end_time': _clock(end_time),
+          'max_patients': max_patients,
+          'open': bool(is_available),
+          'booked': booked_count or 0
+        }
+    return result
+
+  def _read(self, pairs):
+    """
+    (indexed days, versioned key per pair) from one pipelined HGETALL round
+    trip; days that are not indexed are left out. Both are empty without Redis.
+    """
+    result = {}
+    if not cache_service.is_connected():
+      return result, {}
+
+    started = time.perf_counter()
+    try:
+      keys = cache_service.versioned_keys([CacheKeys.appointment_slots(doctor_id, day) for doctor_id, day in pairs])
+      pipe = cache_service.redis_client.pipeline(transaction=False)
+      for key in keys:
+        pipe.hgetall(key)
+      for pair, raw in zip(pairs, pipe.execute()):
+        slots = self._decode(raw or {})
+        if slots is not None:
+          result[pair] = slots
+      cache_service.record_success()
+      cache_service.record_lookup(
+        'appointments', 'hgetall', started, hits=len(result), misses=len(pairs) - len(result)
+      )
+      return result, dict(zip(pairs, keys))
+    except Exception as e:
+      cache_service.record_failure("Error reading the schedule index", e)
+      return {}, {}
+
+  def days(self, pairs):
+    """
+    Map (doctor_id, day) -> {'HH:MM': slot} for every pair: indexed days come
+    from one pipelined HGETALL round trip, the rest from one SQL query and
+    are indexed for the next caller
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+      return {}
+
+    result, versioned = self._read(pairs)
+    missing = [pair for pair in pairs if pair not in result]
+    if missing:
+      # The guards must be read before the query they protect
+      guards = self._guards(missing) if versioned else {}
+      loaded = self._load(missing)
+      result.update(loaded)
+      self._store({pair: (versioned[pair], slots, guards[pair]) for pair, slots in loaded.items() if pair in guards})
+    return result
+
+  def _guards(self, pairs):
+    """
+    Map (doctor_id, day) -> `started` counter of its guard, for the days no
+    booking is being committed on; days with an active booking are left out
+    """
+    try:
+      pipe = cache_service.redis_client.pipeline(transaction=False)
+      for doctor_id, day in pairs:
+        pipe.hmget(CacheKeys.schedule_guard(doctor_id, day), 'started', 'active')
+      guards = {}
+      for pair, (started, active) in zip(pairs, pipe.execute()):
+        if int(active or 0) <= 0:
+          guards[pair] = started
+      cache_service.record_success()
+      return guards
+    except Exception as e:
+      cache_service.record_failure("Error reading schedule index guards", e)
+      return {}
+
+  def _store(self, days):
+    """
+    Replace the hashes of freshly loaded days; days maps (doctor_id, day) ->
+    (versioned key, slots, `started` read before loading them). Days a
+    booking began on since then are deleted again.
+    """
+    if not days:
+      return
+    ttl = self._ttl()
+    try:
+      pipe = cache_service.redis_client.pipeline(transaction=True)
+      for (doctor_id, day), (key, slots, _) in days.items():
+        pipe.delete(key)
+        pipe.hset(key, mapping=self._encode(slots))
+        pipe.expire(key, ttl)
+        pipe.hget(CacheKeys.schedule_guard(doctor_id, day), 'started')
+      replies = pipe.execute()
+      raced = [key for (key, _, started), now_started in zip(days.values(), replies[3::4]) if now_started != started]
+      if raced:
+        cache_service.redis_client.delete(*raced)
+      cache_service.record_success()
+    except Exception as e:
+      cache_service.record_failure("Error writing the schedule index", e)
+
+  def availability(self, doctor_ids, start_date, end_date):
+    """
+    Same result as read_models.load_availability_slots: doctor id -> open
+    slots between start_date and end_date, ordered by date and time
+    """
+    if not doctor_ids:
+      return {}
+    doctor_ids = list(doctor_ids)
+    if (end_date - start_date).days >= self.MAX_RANGE_DAYS:
+      return load_availability_slots(doctor_ids, start_date, end_date)
+
+    dates = _days(start_date, end_date)
+    indexed = self.days([(doctor_id, day) for doctor_id in doctor_ids for day in dates])
+    result = {doctor_id: [] for doctor_id in doctor_ids}
+    for doctor_id in doctor_ids:
+      for day in dates:
+        for start, slot in sorted(indexed[(doctor_id, day)].items()):
+          if not slot['open']:
+            continue
+          result[doctor_id].append({
+            'id': slot['id'],
+            'date': day.isoformat(),
+            'start_time': start,
+            'end_time': slot['end_time'],
+            'is_available': slot['booked'] < slot['max_patients'],
+            'max_patients': slot['max_patients'],
+            'current_appointments': slot['booked']
+          })
+    return result
+
+  def next_available_dates(self, doctor_ids, from_date, horizon_days=90):
+    """
+    Map doctor id -> earliest date on or after from_date (within
+    horizon_days, the booking horizon) with an open slot that is not fully
+    booked. The first SCAN_WINDOW_DAYS are read from the index; a doctor is
+    settled there only when every earlier day is indexed. All other doctors
+    take one grouped query over the whole horizon, so this is at most one
+    Redis round trip and one SQL statement.
+    """
+    doctor_ids = list(dict.fromkeys(doctor_ids))
+    if not doctor_ids:
+      return {}
+
+    dates = _days(from_date, from_date + timedelta(days=min(self.SCAN_WINDOW_DAYS, horizon_days + 1) - 1))
+    indexed, _ = self._read([(doctor_id, day) for doctor_id in doctor_ids for day in dates])
+
+    result = {}
+    for doctor_id in doctor_ids:
+      for day in dates:
+        slots = indexed.get((doctor_id, day))
+        if slots is None:
+          break
+        if any(slot['open'] and slot['booked'] < slot['max_patients'] for slot in slots.values()):
+          result[doctor_id] = day
+          break
+
+    remaining = [doctor_id for doctor_id in doctor_ids if doctor_id not in result]
+    if remaining:
+      result.update(load_next_available_dates(remaining, from_date, until=from_date + timedelta(days=horizon_days)))
+    return result
+
+  def begin_booking(self, pairs):
+    """
+    Announce bookings about to be committed on these (doctor_id, day)
+    pairs, before the database commit. Returns the pairs announced, which
+    the transaction must hand back to apply_booking_deltas() or
+    end_booking(); none without Redis.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs or not cache_service.is_connected():
+      return set()
+    try:
+      pipe = cache_service.redis_client.pipeline(transaction=True)
+      for doctor_id, day in pairs:
+        guard = CacheKeys.schedule_guard(doctor_id, day)
+        pipe.hincrby(guard, 'started', 1)
+        pipe.hincrby(guard, 'active', 1)
+        pipe.expire(guard, self.GUARD_TTL)
+      pipe.execute()
+      cache_service.record_success()
+      return set(pairs)
+    except Exception as e:
+      cache_service.record_failure("Error announcing bookings to the schedule index", e)
+      return set()
+
+  def _release(self, pipe, pairs):
+    for doctor_id, day in pairs:
+      guard = CacheKeys.schedule_guard(doctor_id, day)
+      pipe.hincrby(guard, 'active', -1)
+      pipe.expire(guard, self.GUARD_TTL)
+
+  def end_booking(self, pairs):
+    """Release days announced by begin_booking() whose transaction did not commit"""
+    if not pairs or not cache_service.is_connected():
+      return
+    try:
+      pipe = cache_service.redis_client.pipeline(transaction=False)
+      self._release(pipe, pairs)
+      pipe.execute()
+      cache_service.record_success()
+    except Exception as e:
+      cache_service.record_failure("Error releasing schedule index guards", e)
+
+  def apply_booking_deltas(self, deltas, announced=()):
+    """
+    HINCRBY the booked places of indexed days after a commit and release
+    the announced days; deltas maps (doctor_id, day, time) -> places taken
+    (negative when released). A day that is not indexed is left alone: the
+    increment would create a partial hash, which is deleted again. Days that
+    were not announced (Redis failed before the commit) are deleted, since a
+    load may already have counted their bookings.
+    """
+    if not (deltas or announced) or not cache_service.is_connected():
+      return
+    try:
+      slots = [(slot, delta) for slot, delta in deltas.items() if slot[:2] in announced]
+      unannounced = {(doctor_id, day) for doctor_id, day, _ in deltas if (doctor_id, day) not in announced}
+      keys = cache_service.versioned_keys([CacheKeys.appointment_slots(doctor_id, day) for (doctor_id, day, _), _ in slots])
+      pipe = cache_service.redis_client.pipeline(transaction=False)
+      for key, ((_, _, at), delta) in zip(keys, slots):
+        pipe.hincrby(key, f"b:{_clock(at)}", delta)
+        pipe.hexists(key, LOADED_FIELD)
+      # After the increments: a load that sees the day released also sees them
+      self._release(pipe, announced)
+      replies = pipe.execute()
+      stale = {key for key, loaded in zip(keys, replies[1:2 * len(keys):2]) if not loaded}
+      stale.update(cache_service.versioned_keys([CacheKeys.appointment_slots(doctor_id, day) for doctor_id, day in unannounced]))
+      if stale:
+        cache_service.redis_client.delete(*stale)
+      cache_service.record_success()
+    except Exception as e:
+      cache_service.record_failure("Error updating the schedule index", e)
+
+  def invalidate(self, pairs):
+    """Drop indexed days, e.g. after booked_count was corrected outside the ORM"""
+    cache_service.invalidate_many({CacheKeys.appointment_slots(doctor_id, day) for doctor_id, day in pairs})
+
+# Global schedule index
+schedule_index = ScheduleIndex()
@@ -0,0 +1,49 @@
+import threading
+
+class _Call:
+  __slots__ = ('done', 'result', 'error')
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+
+class SingleFlight:
+  """
+  Coalesces identical concurrent calls within a process: while a call for a
+  key is running, other threads asking for the same key wait for it and get
+  its result (or its exception) instead of running their own.
+  """
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._calls = {}
+
+  def do(self, key, fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) once per key among concurrent callers"""
+    with self._lock:
+      call = self._calls.get(key)
+      leader = call is None
+      if leader:
+        call = self._calls[key] = _Call()
+
+    if not leader:
+      call.done.wait()
+      if call.error is not None:
+        raise call.error
+      return call.result
+
+    try:
+      call.result = fn(*args, **kwargs)
+      return call.result
+    except BaseException as e:
+      call.error = e
+      raise
+    finally:
+      with self._lock:
+        self._calls.pop(key, None)
+      call.done.set()
+
+  def in_flight(self):
+    """Number of keys currently being computed"""
+    with self._lock:
+      return len(self._calls)
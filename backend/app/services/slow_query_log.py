@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from app.middleware.query_inspection import fingerprint_sql
+
+logger = logging.getLogger(__name__)
+
+# Statements worth a plan: EXPLAIN on these never executes them
+_EXPLAINABLE = ('select', 'with', 'update', 'delete')
+
+# Wraps the EXPLAIN, so a failing one never aborts the request's transaction
+_SAVEPOINT = 'slow_query_explain'
+
+def parameters_shape(parameters):
+  """Types of the bind parameters, never their values (they may be patient data)"""
+  if isinstance(parameters, dict):
+    return {name: type(value).__name__ for name, value in parameters.items()}
+  if isinstance(parameters, (list, tuple)):
+    return [type(value).__name__ for value in parameters]
+  return type(parameters).__name__
+
+class SlowQueryLog:
+  """
+  Per-process ring buffer of statements slower than threshold_ms. Each entry
+  keeps the fingerprint, parameter shape, duration and endpoint; the first
+  occurrence of a fingerprint also captures its EXPLAIN plan, which is kept
+  for as long as the fingerprint is in the buffer. Under gunicorn every
+  worker has its own log.
+  """
+  def __init__(self, threshold_ms=200.0, size=500, explain=True):
+    self._lock = threading.Lock()
+    self.configure(threshold_ms, size, explain)
+
+  def configure(self, threshold_ms=None, size=None, explain=None):
+    with self._lock:
+      if threshold_ms is not None:
+        self.threshold_ms = float(threshold_ms)
+      if explain is not None:
+        self.explain = bool(explain)
+      if size is not None:
+        self.size = int(size)
+        self._entries = deque(getattr(self, '_entries', ()), maxlen=self.size)
+        self._plans = getattr(self, '_plans', OrderedDict())
+
+  def record(self, conn, statement, parameters, executemany, duration_ms, endpoint):
+    """Log the statement if it crossed the threshold; called after it executed"""
+    if duration_ms < self.threshold_ms:
+      return
+
+    fingerprint = fingerprint_sql(statement)
+    with self._lock:
+      needs_plan = self.explain and fingerprint not in self._plans
+    # EXPLAIN runs outside the lock; it is one more round trip on this connection
+    plan = self._explain(conn, statement, parameters) if needs_plan and not executemany else None
+
+    with self._lock:
+      if plan is not None:
+        self._plans[fingerprint] = plan
+        while len(self._plans) > self.size:
+          self._plans.popitem(last=False)
+      self._entries.append({
+        'fingerprint': fingerprint,
+        'parameters': parameters_shape(parameters[0] if executemany and parameters else parameters),
+        'executemany': bool(executemany),
+        'duration_ms': round(duration_ms, 3),
+        'endpoint': endpoint,
+        'at': time.time()
+      })
+
+    logger.warning(f"Slow query ({duration_ms:.1f}ms) in {endpoint or 'background'}: {fingerprint[:200]}")
+
+  def _explain(self, conn, statement, parameters):
+    """
+    EXPLAIN the statement through a raw DB-API cursor, so the plan query is
+    neither counted nor timed by the engine listeners. It runs inside a
+    SAVEPOINT on the request's connection: a failed EXPLAIN is rolled back
+    to it instead of aborting the request's transaction (PostgreSQL).
+    """
+    if not statement.lstrip().lower().startswith(_EXPLAINABLE):
+      return None
+
+    dialect = conn.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    try:
+      explain_cursor = conn.connection.cursor()
+    except Exception as e:
+      logger.debug(f"No cursor for EXPLAIN of slow query: {e}")
+      return None
+
+    try:
+      try:
+        explain_cursor.execute(f'SAVEPOINT {_SAVEPOINT}')
+      except Exception as e:
+        # e.g. an autocommit connection: no transaction to protect, no plan
+        logger.debug(f"Skipping EXPLAIN, savepoint failed: {e}")
+        return None
+
+      try:
+        explain_cursor.execute(prefix + statement, parameters)
+        columns = [column[0] for column in explain_cursor.description or ()]
+        rows = explain_cursor.fetchall()
+      except Exception as e:
+        logger.debug(f"EXPLAIN failed for slow query: {e}")
+        explain_cursor.execute(f'ROLLBACK TO SAVEPOINT {_SAVEPOINT}')
+        explain_cursor.execute(f'RELEASE SAVEPOINT {_SAVEPOINT}')
+        return None
+      explain_cursor.execute(f'RELEASE SAVEPOINT {_SAVEPOINT}')
+    except Exception as e:
+      logger.error(f"Error releasing the EXPLAIN savepoint: {e}")
+      return None
+    finally:
+      explain_cursor.close()
+
+    if dialect == 'sqlite':
+      # (id, parent, notused, detail)
+      return [row[-1] for row in rows]
+    if len(columns) == 1:
+      return [row[0] for row in rows]
+    return [dict(zip(columns, (str(value) for value in row))) for row in rows]
+
+  def recent(self, limit=50):
+    with self._lock:
+      entries = list(self._entries)[-limit:]
+    return list(reversed(entries))
+
+  def top(self, limit=20):
+    """Fingerprints in the buffer ordered by total slow time"""
+    with self._lock:
+      entries = list(self._entries)
+      plans = dict(self._plans)
+
+    grouped = {}
+    for entry in entries:
+      summary = grouped.get(entry['fingerprint'])
+      if summary is None:
+        summary = grouped[entry['fingerprint']] = {
+          'fingerprint': entry['fingerprint'],
+          'count': 0,
+          'total_ms': 0.0,
+          'max_ms': 0.0,
+          'endpoints': set(),
+          'parameters': entry['parameters'],
+          'plan': plans.get(entry['fingerprint'])
+        }
+      summary['count'] += 1
+      summary['total_ms'] += entry['duration_ms']
+      summary['max_ms'] = max(summary['max_ms'], entry['duration_ms'])
+      summary['endpoints'].add(entry['endpoint'] or 'background')
+
+    ranked = sorted(grouped.values(), key=lambda summary: summary['total_ms'], reverse=True)[:limit]
+    for summary in ranked:
+      summary['total_ms'] = round(summary['total_ms'], 3)
+      summary['avg_ms'] = round(summary['total_ms'] / summary['count'], 3)
+      summary['endpoints'] = sorted(summary['endpoints'])
+    return ranked
+
+  def stats(self):
+    with self._lock:
+      return {
+        'threshold_ms': self.threshold_ms,
+        'size': self.size,
+        'entries': len(self._entries),
+        'explain': self.explain
+      }
+
+  def reset(self):
+    with self._lock:
+      self._entries.clear()
+      self._plans.clear()
+
+# Global slow query log, configured by setup_db_monitoring()
+slow_query_log = SlowQueryLog()
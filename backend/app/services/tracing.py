@@ -0,0 +1,300 @@
+"""
+Lightweight request-to-task tracing.
+
+A trace is identified by the request id the performance middleware assigns
+(or accepts from an incoming X-Request-ID header). Tasks enqueued during
+the request carry it in their Celery message headers, so the worker
+continues the same trace: its task span, and the DB, cache, SMTP and PDF
+spans recorded inside it, share the request's trace id. End-to-end latency
+("booking -> confirmation email") is the span of the whole trace.
+
+Spans go to an in-memory ring buffer ('memory', per process, the default)
+or, when TRACE_EXPORTER=file is set, are appended as JSON lines to
+TRACE_FILE, which the web and worker processes share and /api/admin/traces
+reads back. The file costs a synchronous write per span, so it is opt-in.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Celery message header names
+REQUEST_ID_HEADER = 'request_id'
+PARENT_SPAN_HEADER = 'parent_span_id'
+ENQUEUED_AT_HEADER = 'enqueued_at'
+
+class Trace:
+  """Trace state of the current request or task"""
+  def __init__(self, trace_id, detailed=False):
+    self.trace_id = trace_id
+    self.detailed = detailed
+    self.span_stack = []
+
+  @property
+  def current_span_id(self):
+    return self.span_stack[-1] if self.span_stack else None
+
+_current_trace = ContextVar('current_trace', default=None)
+
+def new_request_id():
+  return uuid.uuid4().hex
+
+def current_trace():
+  return _current_trace.get()
+
+def current_request_id():
+  trace = _current_trace.get()
+  return trace.trace_id if trace else None
+
+class InMemoryCollector:
+  """Bounded per-process span buffer"""
+  def __init__(self, size=5000):
+    self._spans = deque(maxlen=size)
+    self._lock = threading.Lock()
+
+  def export(self, span):
+    with self._lock:
+      self._spans.append(span)
+
+  def spans(self):
+    with self._lock:
+      return list(self._spans)
+
+class FileExporter:
+  """
+  Appends one JSON line per span. Lines are written with a single append,
+  so web and worker processes can share the file; it is rotated to
+  <path>.1 once it grows beyond max_bytes, under an exclusive lock on
+  <path>.lock so only one process rotates. Reads only look at the newest
+  read_bytes of the two files.
+  """
+  def __init__(self, path, max_bytes=20 * 1024 * 1024, read_bytes=4 * 1024 * 1024):
+    self.path = path
+    self.max_bytes = max_bytes
+    self.read_bytes = read_bytes
+    self._lock = threading.Lock()
+
+  def _size(self, path):
+    try:
+      return os.path.getsize(path)
+    except OSError:
+      return 0
+
+  def _rotate(self):
+    """Move the file to <path>.1, unless another process just did"""
+    with open(self.path + '.lock', 'a') as lock_file:
+      if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+      # Re-checked under the lock: a second rotation would replace the
+      # spans the first one just moved to <path>.1
+      if self._size(self.path) > self.max_bytes:
+        os.replace(self.path, self.path + '.1')
+
+  def export(self, span):
+    line = json.dumps(span, default=str) + '\n'
+    with self._lock:
+      try:
+        if self._size(self.path) > self.max_bytes:
+          self._rotate()
+        with open(self.path, 'a') as output:
+          output.write(line)
+      except OSError as e:
+        logger.debug(f"Could not export span: {e}")
+
+  def _read_tail(self, path, budget):
+    """Spans in the last `budget` bytes of path, skipping a cut-off first line"""
+    spans = []
+    try:
+      with open(path, 'rb') as spans_file:
+        size = os.fstat(spans_file.fileno()).st_size
+        if size > budget:
+          spans_file.seek(size - budget)
+          spans_file.readline()
+        for line in spans_file:
+          try:
+            spans.append(json.loads(line))
+          except ValueError:
+            continue
+    except OSError:
+      pass
+    return spans
+
+  def spans(self):
+    budget = self.read_bytes
+    newest = self._read_tail(self.path, budget)
+    budget -= self._size(self.path)
+    older = self._read_tail(self.path + '.1', budget) if budget > 0 else []
+    return older + newest
+
+class Tracer:
+  def __init__(self):
+    self.exporter = None
+
+  def configure(self, exporter='memory', path=None, max_bytes=20 * 1024 * 1024, buffer_size=5000):
+    """exporter is 'memory', 'file' or 'none'"""
+    if exporter == 'file':
+      self.exporter = FileExporter(path or os.path.join(tempfile.gettempdir(), 'hospital-traces.jsonl'), max_bytes)
+    elif exporter == 'none':
+      self.exporter = None
+    else:
+      self.exporter = InMemoryCollector(buffer_size)
+
+  def configure_from_env(self):
+    self.configure(
+      os.environ.get('TRACE_EXPORTER') or 'memory',
+      os.environ.get('TRACE_FILE'),
+      int(os.environ.get('TRACE_FILE_MAX_BYTES') or 20 * 1024 * 1024)
+    )
+
+  def export(self, span):
+    if self.exporter is not None:
+      self.exporter.export(span)
+
+  def spans(self, trace_id=None):
+    spans = self.exporter.spans() if self.exporter is not None else []
+    if trace_id is not None:
+      spans = [span for span in spans if span.get('trace_id') == trace_id]
+    return spans
+
+tracer = Tracer()
+tracer.configure_from_env()
+
+def start_trace(trace_id=None, detailed=False, parent_span_id=None):
+  """Make trace_id the current trace; returns the token for end_trace()"""
+  trace = Trace(trace_id or new_request_id(), detailed=detailed)
+  if parent_span_id:
+    trace.span_stack.append(parent_span_id)
+  return _current_trace.set(trace)
+
+def end_trace(token):
+  _current_trace.reset(token)
+
+def _build_span(trace_id, span_id, parent_id, name, started_at, duration, attributes, error=None):
+  span = {
+    'trace_id': trace_id,
+    'span_id': span_id,
+    'parent_id': parent_id,
+    'name': name,
+    'start': started_at,
+    'duration_ms': round(duration * 1000, 3),
+    'attributes': attributes
+  }
+  if error is not None:
+    span['error'] = error
+  return span
+
+@contextmanager
+def span(name, **attributes):
+  """
+  Time the block as a child of the current span. Yields the attributes dict,
+  so the block can add to it; a no-op outside a trace.
+  """
+  trace = _current_trace.get()
+  if trace is None:
+    yield attributes
+    return
+
+  span_id = uuid.uuid4().hex[:16]
+  parent_id = trace.current_span_id
+  started_at = time.time()
+  started = time.perf_counter()
+  trace.span_stack.append(span_id)
+  error = None
+  try:
+    yield attributes
+  except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+    raise
+  finally:
+    trace.span_stack.pop()
+    tracer.export(_build_span(
+      trace.trace_id, span_id, parent_id, name, started_at, time.perf_counter() - started, attributes, error
+    ))
+
+def record_span(name, started, **attributes):
+  """
+  Export an already finished operation (started is a perf_counter value) as
+  a span. Only detailed traces (Celery tasks) record these: DB statements
+  and cache calls are too frequent to trace for every HTTP request.
+  """
+  trace = _current_trace.get()
+  if trace is None or not trace.detailed:
+    return
+  duration = time.perf_counter() - started
+  tracer.export(_build_span(
+    trace.trace_id, uuid.uuid4().hex[:16], trace.current_span_id, name,
+    time.time() - duration, duration, attributes
+  ))
+
+def summarize(spans):
+  """Spans of one trace ordered by start, with its end-to-end duration"""
+  spans = sorted(spans, key=lambda span: span['start'])
+  if not spans:
+    return {'spans': [], 'duration_ms': 0.0}
+  finished = max(span['start'] + span['duration_ms'] / 1000 for span in spans)
+  return {
+    'trace_id': spans[0]['trace_id'],
+    'started_at': spans[0]['start'],
+    'duration_ms': round((finished - spans[0]['start']) * 1000, 3),
+    'spans': spans
+  }
+
+def setup_celery_tracing():
+  """
+  Propagate the current request id through task headers when publishing,
+  and continue the trace around every task execution on the worker
+  """
+  from celery.signals import before_task_publish, task_prerun, task_postrun
+
+  @before_task_publish.connect(weak=False, dispatch_uid='tracing.inject_trace_headers')
+  def inject_trace_headers(headers=None, **kwargs):
+    trace = _current_trace.get()
+    if headers is None or trace is None:
+      return
+    headers[REQUEST_ID_HEADER] = trace.trace_id
+    headers[PARENT_SPAN_HEADER] = trace.current_span_id
+    headers[ENQUEUED_AT_HEADER] = time.time()
+
+  def task_header(request, name):
+    # Custom headers land on the request itself, or in request.headers on
+    # some Celery versions
+    return getattr(request, name, None) or (getattr(request, 'headers', None) or {}).get(name)
+
+  @task_prerun.connect(weak=False, dispatch_uid='tracing.start_task_trace')
+  def start_task_trace(task_id=None, task=None, **kwargs):
+    request = task.request
+    token = start_trace(
+      task_header(request, REQUEST_ID_HEADER) or task_id, detailed=True,
+      parent_span_id=task_header(request, PARENT_SPAN_HEADER)
+    )
+    enqueued_at = task_header(request, ENQUEUED_AT_HEADER)
+    context = span(
+      'celery.task', task=task.name, task_id=task_id,
+      queue_wait_ms=round((time.time() - enqueued_at) * 1000, 3) if enqueued_at else None
+    )
+    attributes = context.__enter__()
+    request._trace_state = (token, context, attributes)
+
+  @task_postrun.connect(weak=False, dispatch_uid='tracing.end_task_trace')
+  def end_task_trace(task=None, state=None, **kwargs):
+    trace_state = getattr(task.request, '_trace_state', None)
+    if trace_state is None:
+      return
+    token, context, attributes = trace_state
+    task.request._trace_state = None
+    attributes['state'] = state
+    context.__exit__(None, None, None)
+    end_trace(token)
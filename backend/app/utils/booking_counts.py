@@ -0,0 +1,216 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import bindparam, event, func, inspect, update
+from sqlalchemy.orm import Session
+from app.models import Appointment, DoctorAvailability, db
+from app.services.cache_service import cache_service
+from app.services.schedule_index import schedule_index
+from app.utils.cache_keys import CacheKeys
+
+logger = logging.getLogger(__name__)
+
+# Appointments that occupy a place in their slot
+BOOKED_STATUSES = ('scheduled', 'completed')
+
+_PENDING_DELTAS_KEY = 'booked_count_deltas'
+_ANNOUNCED_DAYS_KEY = 'schedule_index_days'
+
+# DoctorAvailability.booked_count is the number of BOOKED_STATUSES
+# appointments in the slot. It is adjusted with relative UPDATEs in the same
+# transaction as the appointment change, so concurrent bookings never lose
+# an increment; reconcile_booked_counts() repairs drift from writes that
+# bypass the ORM.
+
+def _slot_of(row):
+  """(doctor_id, date, time) of the slot a booked appointment occupies, else None"""
+  # A pending Appointment has no status until the column default applies
+  status = row.status or 'scheduled'
+  if status not in BOOKED_STATUSES or row.doctor_id is None:
+    return None
+  return (row.doctor_id, row.appointment_date, row.appointment_time)
+
+def _previous_slot(obj):
+  """_slot_of() the appointment as it was before this flush"""
+  state = inspect(obj)
+  values = {}
+  for key in ('doctor_id', 'appointment_date', 'appointment_time', 'status'):
+    history = state.attrs[key].history
+    values[key] = history.deleted[0] if history.deleted else getattr(obj, key)
+  return _slot_of(SimpleNamespace(**values))
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+  """
+  Registered with active_history, so setting an expired attribute (e.g.
+  after a commit) loads the old value first and _previous_slot() sees it
+  """
+
+def _booking_deltas(session):
+  deltas = defaultdict(int)
+  for obj in session.new:
+    if isinstance(obj, Appointment):
+      slot = _slot_of(obj)
+      # Already counted by reserve_slot()
+      if slot and not obj.__dict__.pop('_slot_reserved', False):
+        deltas[slot] += 1
+  for obj in session.dirty:
+    if isinstance(obj, Appointment) and session.is_modified(obj, include_collections=False):
+      before, after = _previous_slot(obj), _slot_of(obj)
+      reserved = obj.__dict__.pop('_slot_reserved', False)
+      if before != after:
+        if before:
+          deltas[before] -= 1
+        if after and not reserved:
+          deltas[after] += 1
+  for obj in session.deleted:
+    if isinstance(obj, Appointment):
+      # Deleted rows report their loaded (pre-delete) state
+      slot = _previous_slot(obj)
+      if slot:
+        deltas[slot] -= 1
+  return {slot: delta for slot, delta in deltas.items() if delta}
+
+_slot_adjustment = update(DoctorAvailability.__table__).where(
+  DoctorAvailability.__table__.c.doctor_id == bindparam('slot_doctor_id'),
+  DoctorAvailability.__table__.c.date == bindparam('slot_date'),
+  DoctorAvailability.__table__.c.start_time == bindparam('slot_time')
+).values(booked_count=DoctorAvailability.__table__.c.booked_count + bindparam('delta'))
+
+def _remember_deltas(session, deltas):
+  """
+  Keep the transaction's booked_count changes for the schedule index until
+  commit, announcing days it has not touched yet (see ScheduleIndex.begin_booking)
+  """
+  pending = session.info.setdefault(_PENDING_DELTAS_KEY, defaultdict(int))
+  for slot, delta in deltas.items():
+    pending[slot] += delta
+
+  announced = session.info.setdefault(_ANNOUNCED_DAYS_KEY, set())
+  days = {(doctor_id, day) for doctor_id, day, _ in deltas} - announced
+  if days:
+    announced.update(schedule_index.begin_booking(days))
+
+def _publish_deltas(session):
+  """after_commit: apply the committed changes to the schedule index"""
+  pending = session.info.pop(_PENDING_DELTAS_KEY, None) or {}
+  announced = session.info.pop(_ANNOUNCED_DAYS_KEY, None) or set()
+  if pending or announced:
+    schedule_index.apply_booking_deltas({slot: delta for slot, delta in pending.items() if delta}, announced)
+
+def _discard_deltas(session, transaction=None):
+  """after_rollback, or a transaction closed without either: nothing to apply"""
+  if transaction is not None and transaction.parent is not None:
+    return
+  session.info.pop(_PENDING_DELTAS_KEY, None)
+  announced = session.info.pop(_ANNOUNCED_DAYS_KEY, None)
+  if announced:
+    schedule_index.end_booking(announced)
+
+def _adjust_booked_counts(session, flush_context):
+  """after_flush: move the flushed appointments' places between slot counters"""
+  deltas = _booking_deltas(session)
+  if not deltas:
+    return
+
+  session.connection().execute(_slot_adjustment, [
+    {'slot_doctor_id': doctor_id, 'slot_date': day, 'slot_time': at, 'delta': delta}
+    for (doctor_id, day, at), delta in deltas.items()
+  ])
+  _remember_deltas(session, deltas)
+
+  # Slots already loaded in this session now hold a stale counter
+  for obj in list(session.identity_map.values()):
+    if isinstance(obj, DoctorAvailability) and (obj.doctor_id, obj.date, obj.start_time) in deltas:
+      session.expire(obj, ['booked_count'])
+
+def reserve_slot(session, doctor_id, slot_date, slot_time, appointment=None):
+  """
+  Atomically take one place in an open slot: a single conditional UPDATE
+  (booked_count < max_patients) that the database serializes per row, so
+  concurrent bookings cannot overbook. Returns False when the slot is
+  missing, closed or full. Pass the appointment that will occupy the place
+  so the flush listener does not count it a second time.
+  """
+  table = DoctorAvailability.__table__
+  result = session.execute(
+    update(table).where(
+      table.c.doctor_id == doctor_id,
+      table.c.date == slot_date,
+      table.c.start_time == slot_time,
+      table.c.is_available == True,
+      table.c.booked_count < table.c.max_patients
+    ).values(booked_count=table.c.booked_count + 1)
+  )
+  if result.rowcount != 1:
+    return False
+  _remember_deltas(session, {(doctor_id, slot_date, slot_time): 1})
+  if appointment is not None:
+    appointment._slot_reserved = True
+  return True
+
+def setup_booking_counts():
+  """
+  Keep DoctorAvailability.booked_count in step with appointments created,
+  cancelled, rescheduled, deleted or moved between booked statuses
+  """
+  if event.contains(Session, 'after_flush', _adjust_booked_counts):
+    return
+  for attribute in (Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time, Appointment.status):
+    event.listen(attribute, 'set', _keep_previous_value, active_history=True)
+  event.listen(Session, 'after_flush', _adjust_booked_counts)
+  event.listen(Session, 'after_commit', _publish_deltas)
+  event.listen(Session, 'after_rollback', _discard_deltas)
+  event.listen(Session, 'after_transaction_end', _discard_deltas)
+
+def reconcile_booked_counts(start_date=None, doctor_ids=None, repair=True):
+  """
+  Recount bookings per slot on or after start_date (default: today) and
+  compare with booked_count; with repair, correct the drifted slots by the
+  difference. Each slot's booked_count and its booking count are read in one
+  statement, so they come from the same snapshot; the correction is relative,
+  so bookings committed between that read and the repair are kept.
+  Returns {'checked', 'drifted', 'repaired', 'examples'}.
+  """
+  start_date = start_date or datetime.now().date()
+
+  actual_count = db.session.query(func.count(Appointment.id)).filter(
+    Appointment.doctor_id == DoctorAvailability.doctor_id,
+    Appointment.appointment_date == DoctorAvailability.date,
+    Appointment.appointment_time == DoctorAvailability.start_time,
+    Appointment.status.in_(BOOKED_STATUSES)
+  ).correlate(DoctorAvailability).scalar_subquery()
+  slot_query = db.session.query(
+    DoctorAvailability.id, DoctorAvailability.doctor_id, DoctorAvailability.date,
+    DoctorAvailability.booked_count, actual_count
+  ).filter(DoctorAvailability.date >= start_date)
+  if doctor_ids:
+    slot_query = slot_query.filter(DoctorAvailability.doctor_id.in_(list(doctor_ids)))
+
+  checked = 0
+  drifted = []
+  for slot_id, doctor_id, day, booked_count, actual in slot_query.all():
+    checked += 1
+    if (booked_count or 0) != actual:
+      drifted.append({'slot_id': slot_id, 'doctor_id': doctor_id, 'date': day, 'recorded': booked_count, 'actual': actual})
+
+  if drifted:
+    logger.warning(f"{len(drifted)} of {checked} slots have a drifted booked_count")
+  if drifted and repair:
+    db.session.execute(
+      update(DoctorAvailability.__table__).where(
+        DoctorAvailability.__table__.c.id == bindparam('slot_id')
+      ).values(booked_count=DoctorAvailability.__table__.c.booked_count + bindparam('correction')),
+      [{'slot_id': slot['slot_id'], 'correction': slot['actual'] - (slot['recorded'] or 0)} for slot in drifted]
+    )
+    db.session.commit()
+    # Core updates bypass the commit-time cache invalidation
+    cache_service.invalidate_many({CacheKeys.doctor_availability_scope(slot['doctor_id']) for slot in drifted})
+    schedule_index.invalidate({(slot['doctor_id'], slot['date']) for slot in drifted})
+
+  return {
+    'checked': checked,
+    'drifted': len(drifted),
+    'repaired': len(drifted) if repair else 0,
+    'examples': [dict(slot, date=slot['date'].isoformat()) for slot in drifted[:20]]
+  }
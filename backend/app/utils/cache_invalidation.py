@@ -1,24 +1,35 @@
-from app.services.cache_service import invalidate_cache
+import logging
+from functools import wraps
+from types import SimpleNamespace
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.services.cache_service import cache_service
 from app.utils.cache_keys import CacheKeys
 
+logger = logging.getLogger(__name__)
+
+# Invalidation bumps generation counters (O(1) INCR) instead of deleting
+# keys by pattern; orphaned entries are reclaimed by the sweeper task.
+
 def invalidate_doctor_cache(doctor_id=None):
   """
   Invalidate doctor-related cache
   """
   def decorator(f):
+      @wraps(f)
       def decorated_function(*args, **kwargs):
           result = f(*args, **kwargs)
-          
+
           # Invalidate doctor lists and details
-          invalidate_cache(CacheKeys.pattern_doctors())
-          invalidate_cache(CacheKeys.pattern_stats())
-          invalidate_cache(CacheKeys.pattern_search())
-          
+          cache_service.invalidate(CacheKeys.pattern_doctors())
+          cache_service.invalidate(CacheKeys.pattern_stats())
+          cache_service.invalidate(CacheKeys.pattern_search())
+
           # Invalidate specific doctor if provided
           if doctor_id:
-              invalidate_cache(CacheKeys.doctor_detail(doctor_id))
-              invalidate_cache(CacheKeys.doctor_dashboard_stats(doctor_id))
-          
+              cache_service.invalidate(CacheKeys.doctor_detail(doctor_id))
+              cache_service.invalidate(CacheKeys.doctor_dashboard_stats(doctor_id))
+
           return result
       return decorated_function
   return decorator
@@ -28,19 +39,20 @@ def invalidate_patient_cache(patient_id=None):
   Invalidate patient-related cache
   """
   def decorator(f):
+      @wraps(f)
       def decorated_function(*args, **kwargs):
           result = f(*args, **kwargs)
-          
+
           # Invalidate patient lists and details
-          invalidate_cache(CacheKeys.pattern_patients())
-          invalidate_cache(CacheKeys.pattern_stats())
-          
+          cache_service.invalidate(CacheKeys.pattern_patients())
+          cache_service.invalidate(CacheKeys.pattern_stats())
+
           # Invalidate specific patient if provided
           if patient_id:
-              invalidate_cache(CacheKeys.patient_detail(patient_id))
-              invalidate_cache(CacheKeys.patient_appointments(patient_id, '*'))
-              invalidate_cache(CacheKeys.patient_dashboard_stats(patient_id))
-          
+              cache_service.invalidate(CacheKeys.patient_detail(patient_id))
+              cache_service.invalidate(CacheKeys.patient_appointments(patient_id))
+              cache_service.invalidate(CacheKeys.patient_dashboard_stats(patient_id))
+
           return result
       return decorated_function
   return decorator
@@ -50,25 +62,26 @@ def invalidate_appointment_cache(appointment_id=None, doctor_id=None, patient_id
   Invalidate appointment-related cache
   """
   def decorator(f):
+      @wraps(f)
       def decorated_function(*args, **kwargs):
           result = f(*args, **kwargs)
-          
+
           # Invalidate appointment caches
-          invalidate_cache(CacheKeys.pattern_appointments())
-          invalidate_cache(CacheKeys.pattern_stats())
-          
+          cache_service.invalidate(CacheKeys.pattern_appointments())
+          cache_service.invalidate(CacheKeys.pattern_stats())
+
           # Invalidate specific caches if IDs provided
           if appointment_id:
-              invalidate_cache(CacheKeys.appointment_detail(appointment_id))
-          
+              cache_service.invalidate(CacheKeys.appointment_detail(appointment_id))
+
           if doctor_id:
-              invalidate_cache(CacheKeys.doctor_dashboard_stats(doctor_id))
-              invalidate_cache(CacheKeys.pattern_doctors())
-          
+              cache_service.invalidate(CacheKeys.doctor_dashboard_stats(doctor_id))
+              cache_service.invalidate(CacheKeys.doctor_availability_scope(doctor_id))
+
           if patient_id:
-              invalidate_cache(CacheKeys.patient_appointments(patient_id, '*'))
-              invalidate_cache(CacheKeys.patient_dashboard_stats(patient_id))
-          
+              cache_service.invalidate(CacheKeys.patient_appointments(patient_id))
+              cache_service.invalidate(CacheKeys.patient_dashboard_stats(patient_id))
+
           return result
       return decorated_function
   return decorator
@@ -78,13 +91,131 @@ def invalidate_department_cache():
   Invalidate department-related cache
   """
   def decorator(f):
+      @wraps(f)
       def decorated_function(*args, **kwargs):
           result = f(*args, **kwargs)
-          
-          invalidate_cache(CacheKeys.pattern_departments())
-          invalidate_cache(CacheKeys.pattern_doctors())  # Doctors depend on departments
-          invalidate_cache(CacheKeys.pattern_search())
-          
+
+          cache_service.invalidate(CacheKeys.pattern_departments())
+          cache_service.invalidate(CacheKeys.pattern_doctors())  # Doctors depend on departments
+          cache_service.invalidate(CacheKeys.pattern_search())
+
           return result
       return decorated_function
-  return decorator
\ No newline at end of file
+  return decorator
+
+# Declarative dependency table: for each model, the cache targets
+# (namespaces, entity scopes or keys, see CacheService.invalidate) that a
+# changed row makes stale. Rules receive the row's current state and, for
+# updates, its previous state too, so moves (e.g. a reschedule) clear both.
+CACHE_DEPENDENCIES = {
+  'Department': lambda row: [
+    CacheKeys.pattern_departments(),
+    CacheKeys.pattern_doctors(),  # Doctor lists embed the department name
+    CacheKeys.pattern_search(),
+    CacheKeys.admin_dashboard_stats()
+  ],
+  'Doctor': lambda row: [
+    CacheKeys.pattern_doctors(),
+    CacheKeys.pattern_search(),
+    CacheKeys.pattern_departments(),  # Department doctor counts
+    CacheKeys.admin_dashboard_stats(),
+    CacheKeys.doctor_dashboard_stats(row.id)
+  ],
+  'User': lambda row: [
+    CacheKeys.pattern_doctors(),  # Doctor lists embed username and email
+    CacheKeys.pattern_search()
+  ] if row.role == 'doctor' else [],
+  'DoctorAvailability': lambda row: [
+    CacheKeys.doctor_availability_scope(row.doctor_id),
+    CacheKeys.appointment_slots(row.doctor_id, row.date)
+  ],
+  # The schedule index (appointments::slots) follows bookings through
+  # booked_count deltas instead, see app.services.schedule_index
+  'Appointment': lambda row: [
+    CacheKeys.appointment_detail(row.id),
+    CacheKeys.doctor_availability_scope(row.doctor_id),
+    CacheKeys.doctor_dashboard_stats(row.doctor_id),
+    CacheKeys.patient_appointments(row.patient_id),
+    CacheKeys.patient_dashboard_stats(row.patient_id),
+    CacheKeys.admin_dashboard_stats()
+  ],
+  'Patient': lambda row: [
+    CacheKeys.patient_detail(row.id),
+    CacheKeys.patient_appointments(row.id),
+    CacheKeys.patient_dashboard_stats(row.id),
+    CacheKeys.pattern_search(),
+    CacheKeys.admin_dashboard_stats()
+  ],
+}
+
+_PENDING_KEY = 'cache_invalidation_targets'
+
+def _previous_state(obj):
+  """
+  Snapshot of obj with pre-flush values for changed columns, or None when
+  nothing that could move the row between cache entries has changed
+  """
+  state = inspect(obj)
+  values = {}
+  changed = False
+  for attr in state.mapper.column_attrs:
+    history = state.attrs[attr.key].history
+    if history.deleted:
+      values[attr.key] = history.deleted[0]
+      changed = True
+    else:
+      values[attr.key] = getattr(obj, attr.key)
+  return SimpleNamespace(**values) if changed else None
+
+def targets_for(obj, include_previous=True):
+  """
+  Cache targets invalidated by a change to obj according to CACHE_DEPENDENCIES
+  """
+  rule = CACHE_DEPENDENCIES.get(type(obj).__name__)
+  if rule is None:
+    return set()
+
+  targets = set(rule(obj))
+  if include_previous:
+    previous = _previous_state(obj)
+    if previous is not None:
+      targets.update(rule(previous))
+  return {target for target in targets if target}
+
+def _collect_targets(session, flush_context):
+  """after_flush: remember what the flushed rows invalidate until commit"""
+  pending = session.info.setdefault(_PENDING_KEY, set())
+  try:
+    for obj in session.new:
+      pending.update(targets_for(obj, include_previous=False))
+    for obj in session.dirty:
+      if session.is_modified(obj, include_collections=False):
+        pending.update(targets_for(obj))
+    for obj in session.deleted:
+      pending.update(targets_for(obj, include_previous=False))
+  except Exception as e:
+    # Never fail a write because of cache bookkeeping
+    logger.error(f"Error collecting cache invalidation targets: {str(e)}")
+
+def _apply_targets(session):
+  """after_commit: invalidate everything the transaction touched in one batch"""
+  targets = session.info.pop(_PENDING_KEY, None)
+  if targets:
+    cache_service.invalidate_many(targets)
+    logger.debug(f"Invalidated {len(targets)} cache targets after commit")
+
+def _discard_targets(session):
+  """after_rollback: nothing was written, so nothing is stale"""
+  session.info.pop(_PENDING_KEY, None)
+
+def setup_cache_invalidation():
+  """
+  Invalidate cached entries automatically whenever a transaction that
+  changed Doctor, Department, DoctorAvailability, Appointment, Patient or
+  (doctor) User rows commits
+  """
+  if event.contains(Session, 'after_flush', _collect_targets):
+    return
+  event.listen(Session, 'after_flush', _collect_targets)
+  event.listen(Session, 'after_commit', _apply_targets)
+  event.listen(Session, 'after_rollback', _discard_targets)
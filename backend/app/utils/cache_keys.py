@@ -1,4 +1,18 @@
+import hashlib
+import inspect
+from datetime import date, datetime, time
+
+# Keys longer than this are shortened to "<namespace>::#<sha1>", or
+# "<entity scope>::#<sha1>" for scoped key families
+MAX_KEY_LENGTH = 200
+
 class CacheKeys:
+  # Top-level namespaces, each versioned by a generation counter
+  NAMESPACES = ('doctors', 'patients', 'appointments', 'departments', 'stats', 'search')
+  
+  # Key families that are also versioned per entity ("<prefix>::<id>")
+  SCOPED_PREFIXES = ('doctors::availability', 'patients::appointments', 'appointments::slots')
+  
   # Doctor related cache keys
   @staticmethod
   def doctor_list(search=None, department_id=None):
@@ -17,6 +31,14 @@ class CacheKeys:
   def doctor_availability(doctor_id, start_date, end_date):
     return f"doctors::availability::{doctor_id}::{start_date}::{end_date}"
   
+  @staticmethod
+  def doctor_next_available(doctor_id, from_date):
+    return f"doctors::availability::{doctor_id}::next::{from_date}"
+  
+  @staticmethod
+  def doctor_availability_scope(doctor_id):
+    return f"doctors::availability::{doctor_id}"
+  
   # Patient related cache keys
   @staticmethod
   def patient_detail(patient_id):
@@ -69,6 +91,47 @@ class CacheKeys:
   def search_patients(query):
     return f"search::patients::{query}"
   
+  # Recompute locks (single-flight)
+  @staticmethod
+  def lock(key):
+    return f"cache::lock::{key}"
+  
+  # Marks a background refresh as already enqueued
+  @staticmethod
+  def refresh_marker(key):
+    return f"cache::refresh::{key}"
+  
+  # Per-namespace byte accounting (see app.services.cache_budget)
+  @staticmethod
+  def namespace_sizes(namespace):
+    return f"cache::sizes::{namespace}"
+  
+  @staticmethod
+  def namespace_index(namespace):
+    return f"cache::index::{namespace}"
+  
+  @staticmethod
+  def budget_check_marker(namespace):
+    return f"cache::budget::{namespace}"
+  
+  # Bookings being committed per indexed day (see app.services.schedule_index)
+  @staticmethod
+  def schedule_guard(doctor_id, date):
+    return f"cache::schedule_guard::{doctor_id}::{date}"
+  
+  # Generation counters
+  @staticmethod
+  def generation(scope):
+    return f"cache::gen::{scope}"
+  
+  @staticmethod
+  def scopes_for(key):
+    """Return (namespace, entity scope or None) that version the given key"""
+    parts = key.split('::')
+    if len(parts) >= 3 and '::'.join(parts[:2]) in CacheKeys.SCOPED_PREFIXES:
+      return parts[0], '::'.join(parts[:3])
+    return parts[0], None
+  
   # Pattern for bulk invalidation
   @staticmethod
   def pattern_doctors():
@@ -92,4 +155,102 @@ class CacheKeys:
   
   @staticmethod
   def pattern_search():
-    return "search::*"
\ No newline at end of file
+    return "search::*"
+
+def normalize_key_value(value, fold_case=False):
+  """
+  Normalize a single argument into a stable cache key segment. Strings are
+  kept verbatim unless fold_case is set (for case-insensitive arguments such
+  as search terms), which strips and lower-cases them.
+  """
+  if value is None:
+    return None
+  if isinstance(value, bool):
+    return '1' if value else '0'
+  if isinstance(value, (datetime, date, time)):
+    return value.isoformat()
+  if isinstance(value, str):
+    return value.strip().lower() if fold_case else value
+  if isinstance(value, (list, tuple, set, frozenset)):
+    items = [normalize_key_value(item, fold_case) for item in value]
+    if isinstance(value, (set, frozenset)):
+      items = sorted(items, key=str)
+    return ','.join(str(item) for item in items)
+  if isinstance(value, dict):
+    return ','.join(f"{k}={normalize_key_value(v, fold_case)}" for k, v in sorted(value.items()))
+  return str(value)
+
+def shorten_key(key):
+  """
+  Hash oversized keys while keeping the namespace and entity scope prefix,
+  so generation bumps of either still reach the shortened key
+  """
+  if len(key) <= MAX_KEY_LENGTH:
+    return key
+  namespace, scope = CacheKeys.scopes_for(key)
+  digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+  return f"{scope or namespace}::#{digest}"
+
+class _KeyFormatter(dict):
+  """Mapping for str.format_map that reports unknown template arguments"""
+  def __missing__(self, name):
+    raise KeyError(f"Cache key template references unknown argument '{name}'")
+
+def bind_arguments(func, args, kwargs):
+  """
+  Bind call arguments to the function signature, including defaults
+  """
+  signature = inspect.signature(func)
+  bound = signature.bind(*args, **kwargs)
+  bound.apply_defaults()
+  arguments = {}
+  for name, value in bound.arguments.items():
+    parameter = signature.parameters[name]
+    if parameter.kind == inspect.Parameter.VAR_KEYWORD:
+      arguments.update(value)
+    elif parameter.kind == inspect.Parameter.VAR_POSITIONAL:
+      arguments[name] = tuple(value)
+    else:
+      arguments[name] = value
+  return arguments
+
+def build_cache_key(key_pattern, func, args, kwargs, normalize=()):
+  """
+  Build a cache key for a call of func. Arguments named in normalize are
+  case-folded (see normalize_key_value); all other strings are kept verbatim.
+
+  key_pattern may be:
+    - None: "<module>::<function>::<name>=<value>..." from the bound arguments
+    - a string template from CacheKeys, e.g. CacheKeys.doctor_detail("{doctor_id}")
+    - a CacheKeys callable, e.g. CacheKeys.doctor_list, called with the
+      matching bound arguments
+  """
+  return build_key_from_arguments(key_pattern, func, bind_arguments(func, args, kwargs), normalize)
+
+def build_key_from_arguments(key_pattern, func, arguments, normalize=()):
+  """
+  Build a cache key from already bound arguments (see build_cache_key)
+  """
+  arguments = {
+    name: normalize_key_value(value, fold_case=name in normalize)
+    for name, value in arguments.items()
+  }
+
+  if key_pattern is None:
+    key_parts = [func.__module__, func.__qualname__]
+    key_parts.extend(f"{name}={value}" for name, value in arguments.items())
+    cache_key = "::".join(key_parts)
+  elif callable(key_pattern):
+    parameters = inspect.signature(key_pattern).parameters
+    accepts_all = any(p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters.values())
+    cache_key = key_pattern(**{
+      name: value for name, value in arguments.items()
+      if accepts_all or name in parameters
+    })
+  else:
+    cache_key = key_pattern.format_map(_KeyFormatter({
+      name: 'none' if value is None else value
+      for name, value in arguments.items()
+    }))
+
+  return shorten_key(cache_key)
@@ -1,5 +1,5 @@
 from functools import wraps
-from flask import jsonify
+from flask import g, jsonify
 from flask_login import current_user
 
 def role_required(roles):
@@ -26,4 +26,18 @@ def patient_required(f):
   return role_required(['patient'])(f)
 
 def doctor_or_admin_required(f):
-  return role_required(['doctor', 'admin'])(f)
\ No newline at end of file
+  return role_required(['doctor', 'admin'])(f)
+
+def query_budget(max_queries):
+  """
+  Declare the most SQL statements a route may issue per request; checked by
+  app.middleware.query_inspection (raises in test mode, warns otherwise)
+  """
+  def decorator(f):
+      @wraps(f)
+      def decorated_function(*args, **kwargs):
+          g.query_budget = max_queries
+          return f(*args, **kwargs)
+      decorated_function.query_budget = max_queries
+      return decorated_function
+  return decorator
@@ -0,0 +1,235 @@
+"""
+Concurrent booking benchmark
+
+Releases N client threads at once against a small set of hot slots and
+reports bookings/sec, outcome counts and latency for two strategies:
+check-then-insert (the old route logic: slot lookup, COUNT, conflict check,
+INSERT) and the atomic path (AppointmentService.book_appointment). Every
+slot is then recounted; the atomic run fails the benchmark (exit code 1) if
+any slot holds more than max_patients bookings or booked_count drifted.
+
+Usage (from backend/):
+  python -m benchmarks.booking_benchmark --clients 200
+  DATABASE_URL=postgresql://... python -m benchmarks.booking_benchmark --pool-size 50
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, time as dt_time, timedelta
+
+from benchmarks.cache_benchmark import percentile
+
+
+def seed(doctors, slots, patients, max_patients, day):
+  """Benchmark doctors with `slots` hourly slots on `day`, and enough patients; resets earlier runs"""
+  from app.models import User, Department, Doctor, Patient, db
+
+  department = Department.query.filter_by(name='Booking benchmark').first()
+  if department is None:
+    department = Department(name='Booking benchmark', description='Booking benchmark')
+    db.session.add(department)
+    db.session.flush()
+
+  def ensure_users(role, count):
+    existing = dict(db.session.query(User.username, User.id).filter(User.username.like(f'booking_{role}_%')).all())
+    missing = [{'username': f'booking_{role}_{number}', 'email': f'booking_{role}_{number}@example.com',
+                'password_hash': 'x', 'role': role, 'is_active': True}
+               for number in range(count) if f'booking_{role}_{number}' not in existing]
+    if missing:
+      db.session.execute(User.__table__.insert(), missing)
+    return [user_id for user_id, in db.session.query(User.id).filter(
+      User.username.like(f'booking_{role}_%')).order_by(User.id).limit(count).all()]
+
+  def ensure_profiles(model, user_ids, row):
+    known = {user_id for user_id, in db.session.query(model.user_id).filter(model.user_id.in_(user_ids)).all()}
+    missing = [row(user_id) for user_id in user_ids if user_id not in known]
+    if missing:
+      db.session.execute(model.__table__.insert(), missing)
+
+  doctor_users = ensure_users('doctor', doctors)
+  ensure_profiles(Doctor, doctor_users, lambda user_id: {
+    'user_id': user_id, 'department_id': department.id, 'specialization': 'General',
+    'experience': 10, 'consultation_fee': 500.0, 'is_available': True
+  })
+  patient_users = ensure_users('patient', patients)
+  ensure_profiles(Patient, patient_users, lambda user_id: {
+    'user_id': user_id, 'first_name': 'Booking', 'last_name': str(user_id),
+    'date_of_birth': datetime(1990, 1, 1).date(), 'gender': 'female'
+  })
+
+  doctor_ids = [doctor_id for doctor_id, in db.session.query(Doctor.id).filter(Doctor.user_id.in_(doctor_users)).all()]
+  patient_ids = [patient_id for patient_id, in db.session.query(Patient.id).filter(Patient.user_id.in_(patient_users)).all()]
+  slot_times = [dt_time(9 + number, 0) for number in range(slots)]
+
+  reset_slots(doctor_ids, slot_times, max_patients, day)
+  return doctor_ids, patient_ids, slot_times
+
+
+def reset_slots(doctor_ids, slot_times, max_patients, day):
+  """Empty the benchmark slots between runs"""
+  from app.models import DoctorAvailability, Appointment, db
+
+  Appointment.query.filter(Appointment.doctor_id.in_(doctor_ids)).delete(synchronize_session=False)
+  DoctorAvailability.query.filter(DoctorAvailability.doctor_id.in_(doctor_ids)).delete(synchronize_session=False)
+  db.session.execute(DoctorAvailability.__table__.insert(), [
+    {'doctor_id': doctor_id, 'date': day, 'start_time': at, 'end_time': dt_time(at.hour + 1, 0),
+     'is_available': True, 'max_patients': max_patients, 'booked_count': 0}
+    for doctor_id in doctor_ids for at in slot_times
+  ])
+  db.session.commit()
+
+
+def check_then_insert(patient_id, doctor_id, day, at):
+  """The pre-atomic booking route: every check is a separate query"""
+  from app.models import Appointment, DoctorAvailability, db
+
+  slot = DoctorAvailability.query.filter_by(doctor_id=doctor_id, date=day, start_time=at, is_available=True).first()
+  if not slot:
+    return None, 'Selected time slot is not available'
+  booked = Appointment.query.filter(
+    Appointment.doctor_id == doctor_id, Appointment.appointment_date == day,
+    Appointment.appointment_time == at, Appointment.status.in_(['scheduled', 'completed'])
+  ).count()
+  if booked >= slot.max_patients:
+    return None, 'Selected time slot is fully booked'
+  appointment = Appointment(patient_id=patient_id, doctor_id=doctor_id, appointment_date=day,
+                            appointment_time=at, reason='Booking benchmark', status='scheduled')
+  db.session.add(appointment)
+  db.session.commit()
+  return appointment, None
+
+
+def atomic(patient_id, doctor_id, day, at):
+  from app.services.appointment_service import AppointmentService
+  return AppointmentService.book_appointment(patient_id, doctor_id, day, at, 'Booking benchmark')
+
+
+def run_strategy(app, strategy, clients, attempts, doctor_ids, patient_ids, slot_times, day):
+  from app.models import db
+
+  barrier = threading.Barrier(clients)
+  outcomes = Counter()
+  latencies = []
+  lock = threading.Lock()
+
+  def client(number):
+    rng = random.Random(number)
+    local_outcomes = Counter()
+    local_latencies = []
+    with app.app_context():
+      barrier.wait()
+      for attempt in range(attempts):
+        patient_id = patient_ids[(number * attempts + attempt) % len(patient_ids)]
+        started = time.perf_counter()
+        try:
+          appointment, error = strategy(patient_id, rng.choice(doctor_ids), day, rng.choice(slot_times))
+          local_outcomes['booked' if appointment else error] += 1
+        except Exception as e:
+          db.session.rollback()
+          local_outcomes[f'error: {type(e).__name__}'] += 1
+        local_latencies.append((time.perf_counter() - started) * 1000)
+    with lock:
+      outcomes.update(local_outcomes)
+      latencies.extend(local_latencies)
+
+  threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+  started = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - started
+  return outcomes, latencies, elapsed
+
+
+def verify(doctor_ids, day):
+  """(overbooked slots, drifted counters) after a run"""
+  from sqlalchemy import func
+  from app.models import Appointment, DoctorAvailability, db
+
+  counts = dict(((doctor_id, at), count) for doctor_id, at, count in db.session.query(
+    Appointment.doctor_id, Appointment.appointment_time, func.count(Appointment.id)
+  ).filter(
+    Appointment.doctor_id.in_(doctor_ids), Appointment.appointment_date == day,
+    Appointment.status.in_(['scheduled', 'completed'])
+  ).group_by(Appointment.doctor_id, Appointment.appointment_time).all())
+
+  overbooked, drifted = [], []
+  for slot in DoctorAvailability.query.filter(DoctorAvailability.doctor_id.in_(doctor_ids)).all():
+    actual = counts.get((slot.doctor_id, slot.start_time), 0)
+    if actual > slot.max_patients:
+      overbooked.append((slot.doctor_id, slot.start_time.strftime('%H:%M'), actual, slot.max_patients))
+    if actual != slot.booked_count:
+      drifted.append((slot.doctor_id, slot.start_time.strftime('%H:%M'), slot.booked_count, actual))
+  return overbooked, drifted
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+  parser.add_argument('--clients', type=int, default=200)
+  parser.add_argument('--attempts', type=int, default=5, help='booking attempts per client')
+  parser.add_argument('--doctors', type=int, default=5)
+  parser.add_argument('--slots', type=int, default=8, help='hot slots per doctor')
+  parser.add_argument('--max-patients', type=int, default=10)
+  parser.add_argument('--pool-size', type=int, default=50, help='database connections shared by the clients')
+  args = parser.parse_args()
+
+  # Config reads the environment at import time
+  os.environ.setdefault('DATABASE_URL', 'sqlite:///booking_benchmark.db')
+  os.environ['CACHE_BACKEND'] = 'memory'
+  os.environ['TRACE_EXPORTER'] = 'none'
+  os.environ['SLOW_QUERY_EXPLAIN'] = 'false'
+  # Refusals would each enqueue a conflict log task
+  os.environ['CONFLICT_LOG_ENABLED'] = 'false'
+
+  from config import Config
+  Config.SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': args.pool_size, 'max_overflow': 0, 'pool_timeout': 120}
+  if Config.SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+    # Wait for the writer lock instead of failing at once; retries cover the rest
+    Config.SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {'timeout': 30, 'check_same_thread': False}
+
+  from app import create_app
+
+  app = create_app()
+  day = datetime.now().date() + timedelta(days=1)
+  capacity = args.doctors * args.slots * args.max_patients
+  total = args.clients * args.attempts
+  with app.app_context():
+    doctor_ids, patient_ids, slot_times = seed(args.doctors, args.slots, total, args.max_patients, day)
+
+  print(f"{args.clients} clients x {args.attempts} attempts = {total} bookings for {capacity} places")
+  failed = False
+  for label, strategy in (('check-then-insert', check_then_insert), ('atomic', atomic)):
+    with app.app_context():
+      reset_slots(doctor_ids, slot_times, args.max_patients, day)
+
+    outcomes, latencies, elapsed = run_strategy(
+      app, strategy, args.clients, args.attempts, doctor_ids, patient_ids, slot_times, day
+    )
+    with app.app_context():
+      overbooked, drifted = verify(doctor_ids, day)
+
+    print(f"\n{label}")
+    print(f"  {outcomes['booked'] / elapsed:.1f} bookings/sec, {total / elapsed:.1f} attempts/sec over {elapsed:.2f}s")
+    print(f"  latency p50 {percentile(latencies, 50):.1f}ms, p99 {percentile(latencies, 99):.1f}ms")
+    for outcome, count in outcomes.most_common():
+      print(f"  {outcome}: {count}")
+    print(f"  overbooked slots: {len(overbooked)}, drifted counters: {len(drifted)}")
+    for doctor_id, at, actual, max_patients in overbooked[:10]:
+      print(f"    doctor {doctor_id} {at}: {actual} bookings for {max_patients} places")
+
+    if label == 'atomic' and (overbooked or drifted or outcomes['booked'] > capacity):
+      failed = True
+
+  if failed:
+    print("\nFAIL: the atomic booking path overbooked or lost count")
+    sys.exit(1)
+  print("\nOK: no overbooking on the atomic path")
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,227 @@
+"""
+Cache benchmark suite
+
+Replays a request mix against the /api/cached routes through the Flask test
+client, once per cache configuration, and reports hit ratio, p50/p99 latency
+and DB queries per request. Runs on the in-process memory backend by default,
+so no Redis server is needed.
+
+The mix is either a JSON file of weighted path templates (see
+benchmarks/request_mix.json; sampled with a fixed seed so every configuration
+sees the same sequence) or a recorded log with one "<role> <path>" per line,
+replayed in order.
+
+Usage (from backend/):
+  python -m benchmarks.cache_benchmark --requests 2000
+  python -m benchmarks.cache_benchmark --mix recorded_requests.txt --backend redis
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+# Cache configurations compared by the benchmark, as overrides of BASELINE
+BASELINE = {'CACHE_ENABLED': True, 'CACHE_SERIALIZER': 'msgpack', 'CACHE_COMPRESSION': 'zlib'}
+CONFIGURATIONS = [
+  ('no-cache', {'CACHE_ENABLED': False}),
+  ('msgpack+zlib', {'CACHE_SERIALIZER': 'msgpack', 'CACHE_COMPRESSION': 'zlib'}),
+  ('json', {'CACHE_SERIALIZER': 'json', 'CACHE_COMPRESSION': None}),
+  ('pickle+lz4', {'CACHE_SERIALIZER': 'pickle', 'CACHE_COMPRESSION': 'lz4'}),
+]
+
+DEFAULT_MIX = os.path.join(os.path.dirname(__file__), 'request_mix.json')
+
+
+def percentile(values, pct):
+  if not values:
+    return 0.0
+  ordered = sorted(values)
+  index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+  return ordered[index]
+
+
+def seed_data(doctors=50, patients=200, days=7):
+  """Create departments, doctors, patients, a week of slots and some bookings"""
+  from app.models import User, Department, Doctor, Patient, DoctorAvailability, Appointment, db
+
+  if Doctor.query.first():
+    return
+
+  rng = random.Random(7)
+  departments = [Department(name=name, description=f'{name} department')
+                 for name in ('Cardiology', 'Neurology', 'Pediatrics', 'Orthopedics', 'Dermatology')]
+  db.session.add_all(departments)
+
+  admin = User(username='bench_admin', email='bench_admin@example.com', role='admin')
+  admin.set_password('bench')
+  db.session.add(admin)
+  db.session.flush()
+
+  doctor_rows = []
+  for number in range(doctors):
+    user = User(username=f'bench_doctor_{number}', email=f'bench_doctor_{number}@example.com', role='doctor')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.flush()
+    department = departments[number % len(departments)]
+    doctor = Doctor(
+      user_id=user.id, department_id=department.id, specialization=department.name,
+      qualification='MD', experience=rng.randint(1, 30), consultation_fee=rng.choice([300, 500, 800]),
+      bio='Benchmark doctor'
+    )
+    db.session.add(doctor)
+    doctor_rows.append(doctor)
+
+  patient_rows = []
+  for number in range(patients):
+    user = User(username=f'bench_patient_{number}', email=f'bench_patient_{number}@example.com', role='patient')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.flush()
+    patient = Patient(
+      user_id=user.id, first_name='Bench', last_name=str(number),
+      date_of_birth=date(1990, 1, 1), gender=rng.choice(['male', 'female'])
+    )
+    db.session.add(patient)
+    patient_rows.append(patient)
+  db.session.flush()
+
+  today = datetime.now().date()
+  for doctor in doctor_rows:
+    for offset in range(days + 1):
+      day = today + timedelta(days=offset)
+      for hour in range(9, 17):
+        db.session.add(DoctorAvailability(
+          doctor_id=doctor.id, date=day, start_time=dt_time(hour, 0), end_time=dt_time(hour + 1, 0),
+          max_patients=4
+        ))
+        for _ in range(rng.randint(0, 3)):
+          db.session.add(Appointment(
+            patient_id=rng.choice(patient_rows).id, doctor_id=doctor.id,
+            appointment_date=day, appointment_time=dt_time(hour, 0), reason='Benchmark'
+          ))
+  db.session.commit()
+
+
+def load_mix(path, count, ids):
+  """Return the list of (role, path) requests to replay"""
+  if not path.endswith('.json'):
+    with open(path) as recorded:
+      requests = [tuple(line.split(None, 1)) for line in recorded if line.strip() and not line.startswith('#')]
+    return [(role, request_path.strip()) for role, request_path in requests][:count or None]
+
+  with open(path) as mix_file:
+    entries = json.load(mix_file)['requests']
+
+  rng = random.Random(42)
+  weights = [entry['weight'] for entry in entries]
+  requests = []
+  for entry in rng.choices(entries, weights=weights, k=count):
+    # Skewed popularity: a few doctors get most of the detail views
+    doctor_index = min(int(rng.paretovariate(1.2)) - 1, len(ids['doctor_ids']) - 1)
+    requests.append((entry['role'], entry['path'].format(
+      doctor_id=ids['doctor_ids'][doctor_index],
+      department_id=rng.choice(ids['department_ids']),
+      missing_doctor_id=ids['missing_doctor_id'] + rng.randint(0, 50)
+    )))
+  return requests
+
+
+def login_clients(app):
+  """One test client per role, logged in through the Flask-Login session"""
+  from app.models import User
+
+  clients = {}
+  for role in ('admin', 'doctor', 'patient'):
+    with app.app_context():
+      user = User.query.filter_by(role=role).order_by(User.id.asc()).first()
+    if user is None:
+      continue
+    client = app.test_client()
+    with client.session_transaction() as session:
+      session['_user_id'] = str(user.id)
+      session['_fresh'] = True
+    clients[role] = client
+  return clients
+
+
+def run_configuration(app, label, overrides, requests, clients, counter):
+  from app.services.cache_service import cache_service
+  from app.utils.cache_keys import CacheKeys
+
+  app.config.update(dict(BASELINE, **overrides))
+  with app.app_context():
+    cache_service.reset()
+    # Start cold without flushing a Redis that may be shared with Celery
+    for namespace in CacheKeys.NAMESPACES:
+      cache_service.bump_generation(namespace)
+    cache_service.metrics.reset()
+
+  counter.reset()
+  latencies = []
+  errors = 0
+  for role, path in requests:
+    client = clients.get(role)
+    if client is None:
+      continue
+    started = time.perf_counter()
+    response = client.get(path)
+    latencies.append((time.perf_counter() - started) * 1000)
+    if response.status_code >= 500:
+      errors += 1
+
+  totals = cache_service.metrics.snapshot()['totals']
+  return {
+    'configuration': label,
+    'requests': len(latencies),
+    'hit_ratio': totals['hit_ratio'] or 0.0,
+    'p50_ms': percentile(latencies, 50),
+    'p99_ms': percentile(latencies, 99),
+    'queries_per_request': counter.count / len(latencies) if latencies else 0.0,
+    'errors': errors
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+  parser.add_argument('--requests', type=int, default=1000, help='requests to sample from a weighted mix')
+  parser.add_argument('--mix', default=DEFAULT_MIX, help='weighted .json mix or recorded "<role> <path>" log')
+  parser.add_argument('--backend', choices=['memory', 'redis'], default='memory')
+  parser.add_argument('--doctors', type=int, default=50)
+  args = parser.parse_args()
+
+  # Config reads the environment at import time
+  os.environ['CACHE_BACKEND'] = args.backend
+  os.environ.setdefault('DATABASE_URL', 'sqlite:///cache_benchmark.db')
+
+  from app import create_app
+  from app.models import Department, Doctor, db
+  from benchmarks.stampede_benchmark import QueryCounter
+
+  app = create_app()
+  with app.app_context():
+    seed_data(doctors=args.doctors)
+    ids = {
+      'doctor_ids': [doctor_id for doctor_id, in Doctor.query.with_entities(Doctor.id).order_by(Doctor.id).all()],
+      'department_ids': [dept_id for dept_id, in Department.query.with_entities(Department.id).all()],
+    }
+    ids['missing_doctor_id'] = max(ids['doctor_ids']) + 1000
+    counter = QueryCounter(db.engine)
+
+  requests = load_mix(args.mix, args.requests, ids)
+  clients = login_clients(app)
+
+  print(f"{len(requests)} requests, backend={args.backend}")
+  print(f"{'configuration':<15}{'hit ratio':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'queries/req':>13}{'errors':>8}")
+  for label, overrides in CONFIGURATIONS:
+    result = run_configuration(app, label, overrides, requests, clients, counter)
+    print(
+      f"{result['configuration']:<15}{result['hit_ratio']:>10.1%}{result['p50_ms']:>10.2f}"
+      f"{result['p99_ms']:>10.2f}{result['queries_per_request']:>13.2f}{result['errors']:>8}"
+    )
+
+
+if __name__ == '__main__':
+  main()
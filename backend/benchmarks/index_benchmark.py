@@ -0,0 +1,210 @@
+"""
+Index benchmark
+
+Seeds a large schedule (about 1M appointments by default) and times the
+appointment and availability hot paths twice: with the composite indexes
+declared on Appointment and DoctorAvailability dropped, then with them
+created. Caching is disabled, so every call reaches the database.
+
+Usage (from backend/):
+  python -m benchmarks.index_benchmark
+  python -m benchmarks.index_benchmark --appointments 200000 --iterations 20
+  DATABASE_URL=postgresql://... python -m benchmarks.index_benchmark
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from benchmarks.cache_benchmark import percentile
+
+BATCH_SIZE = 20000
+
+
+def seed_schedule(appointments, doctors, patients, history_days, future_days):
+  """Bulk-insert users, doctors, patients, slots and appointments with Core inserts"""
+  from app.models import User, Department, Doctor, Patient, DoctorAvailability, Appointment, db
+
+  if Appointment.query.count() >= appointments:
+    return
+
+  rng = random.Random(21)
+  today = datetime.now().date()
+  started = time.perf_counter()
+
+  def insert(model, rows):
+    for offset in range(0, len(rows), BATCH_SIZE):
+      db.session.execute(model.__table__.insert(), rows[offset:offset + BATCH_SIZE])
+
+  insert(Department, [{'name': name, 'description': f'{name} department'}
+                      for name in ('Cardiology', 'Neurology', 'Pediatrics', 'Orthopedics', 'Dermatology')])
+  department_ids = [department_id for department_id, in db.session.query(Department.id).all()]
+
+  insert(User, [{'username': f'index_{role}_{number}', 'email': f'index_{role}_{number}@example.com',
+                 'password_hash': 'x', 'role': role, 'is_active': True}
+                for role, count in (('doctor', doctors), ('patient', patients)) for number in range(count)])
+  users = dict(db.session.query(User.username, User.id).filter(User.username.like('index_%')).all())
+
+  insert(Doctor, [{'user_id': users[f'index_doctor_{number}'], 'department_id': department_ids[number % len(department_ids)],
+                   'specialization': 'General', 'experience': 10, 'consultation_fee': 500.0, 'is_available': True}
+                  for number in range(doctors)])
+  insert(Patient, [{'user_id': users[f'index_patient_{number}'], 'first_name': 'Index', 'last_name': str(number),
+                    'date_of_birth': datetime(1990, 1, 1).date(), 'gender': 'female'}
+                   for number in range(patients)])
+  doctor_ids = [doctor_id for doctor_id, in db.session.query(Doctor.id).all()]
+  patient_ids = [patient_id for patient_id, in db.session.query(Patient.id).all()]
+
+  # Slots for the last month and the bookable future
+  slot_days = [today + timedelta(days=offset) for offset in range(-30, future_days + 1)]
+  insert(DoctorAvailability, [
+    {'doctor_id': doctor_id, 'date': day, 'start_time': dt_time(hour, 0), 'end_time': dt_time(hour + 1, 0),
+     'is_available': True, 'max_patients': 4}
+    for doctor_id in doctor_ids for day in slot_days for hour in range(9, 17)
+  ])
+
+  rows = []
+  for _ in range(appointments):
+    day = today + timedelta(days=rng.randint(-history_days, future_days))
+    if day < today:
+      status = rng.choices(['completed', 'cancelled', 'no_show'], weights=[85, 10, 5])[0]
+    else:
+      status = rng.choices(['scheduled', 'cancelled'], weights=[92, 8])[0]
+    rows.append({
+      'patient_id': rng.choice(patient_ids), 'doctor_id': rng.choice(doctor_ids), 'appointment_date': day,
+      'appointment_time': dt_time(rng.randint(9, 16), 0), 'status': status, 'reason': 'Index benchmark'
+    })
+    if len(rows) == BATCH_SIZE:
+      insert(Appointment, rows)
+      rows = []
+  insert(Appointment, rows)
+  db.session.commit()
+
+  # Core inserts bypass the booked_count listener
+  from app.utils.booking_counts import reconcile_booked_counts
+  reconcile_booked_counts(start_date=today - timedelta(days=30))
+  print(f"Seeded {appointments} appointments in {time.perf_counter() - started:.1f}s")
+
+
+def benchmark_indexes():
+  """The indexes under test: everything declared on the two hot tables"""
+  from app.models import Appointment, DoctorAvailability
+  return list(Appointment.__table__.indexes) + list(DoctorAvailability.__table__.indexes)
+
+
+def set_indexes(engine, present):
+  from sqlalchemy import text
+
+  for index in benchmark_indexes():
+    if present:
+      index.create(bind=engine, checkfirst=True)
+    else:
+      index.drop(bind=engine, checkfirst=True)
+  with engine.begin() as conn:
+    conn.execute(text('ANALYZE'))
+
+
+def scenarios(ids, future_days):
+  """name -> callable(rng) running one hot-path operation"""
+  from app.models.cached_models import CachedStats
+  from app.models.read_models import load_availability_slots
+  from app.services.appointment_service import BookingContext
+
+  today = datetime.now().date()
+
+  def booking_day(rng):
+    return today + timedelta(days=rng.randint(1, future_days)), dt_time(rng.randint(9, 16), 0)
+
+  def booking_validation(rng):
+    day, at = booking_day(rng)
+    BookingContext.load(rng.choice(ids['doctor_ids']), rng.choice(ids['patient_ids']), day, at).violation()
+
+  def availability_one_doctor(rng):
+    load_availability_slots([rng.choice(ids['doctor_ids'])], today, today + timedelta(days=7))
+
+  def availability_bulk(rng):
+    load_availability_slots(rng.sample(ids['doctor_ids'], 20), today, today + timedelta(days=7))
+
+  def doctor_dashboard(rng):
+    CachedStats.get_doctor_dashboard_stats(rng.choice(ids['doctor_ids']))
+
+  def admin_dashboard(rng):
+    CachedStats.get_admin_dashboard_stats()
+
+  return [
+    ('booking validation', booking_validation),
+    ('availability (1 doctor)', availability_one_doctor),
+    ('availability (20 doctors)', availability_bulk),
+    ('doctor dashboard', doctor_dashboard),
+    ('admin dashboard', admin_dashboard),
+  ]
+
+
+def run_scenarios(cases, iterations):
+  from app.models import db
+
+  results = {}
+  for name, operation in cases:
+    # Same parameter sequence with and without indexes
+    rng = random.Random(name)
+    operation(rng)
+    latencies = []
+    for _ in range(iterations):
+      started = time.perf_counter()
+      operation(rng)
+      latencies.append((time.perf_counter() - started) * 1000)
+      db.session.rollback()
+    results[name] = latencies
+  return results
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+  parser.add_argument('--appointments', type=int, default=1000000)
+  parser.add_argument('--doctors', type=int, default=200)
+  parser.add_argument('--patients', type=int, default=20000)
+  parser.add_argument('--history-days', type=int, default=730, help='days of past appointments')
+  parser.add_argument('--future-days', type=int, default=60, help='days of bookable slots')
+  parser.add_argument('--iterations', type=int, default=50)
+  args = parser.parse_args()
+
+  # Config reads the environment at import time; measure the database only
+  os.environ.setdefault('DATABASE_URL', 'sqlite:///index_benchmark.db')
+  os.environ['CACHE_ENABLED'] = 'false'
+  os.environ['CACHE_BACKEND'] = 'memory'
+  os.environ['SLOW_QUERY_EXPLAIN'] = 'false'
+  os.environ['TRACE_EXPORTER'] = 'none'
+
+  from app import create_app
+  from app.models import Doctor, Patient, db
+
+  app = create_app()
+  with app.app_context():
+    set_indexes(db.engine, present=False)
+    seed_schedule(args.appointments, args.doctors, args.patients, args.history_days, args.future_days)
+    ids = {
+      'doctor_ids': [doctor_id for doctor_id, in db.session.query(Doctor.id).all()],
+      'patient_ids': [patient_id for patient_id, in db.session.query(Patient.id).all()],
+    }
+    cases = scenarios(ids, args.future_days)
+
+    before = run_scenarios(cases, args.iterations)
+    started = time.perf_counter()
+    set_indexes(db.engine, present=True)
+    print(f"Created {len(benchmark_indexes())} indexes in {time.perf_counter() - started:.1f}s")
+    after = run_scenarios(cases, args.iterations)
+    dialect = db.engine.dialect.name
+
+  print(f"{args.iterations} iterations per scenario, {dialect}")
+  print(f"{'scenario':<27}{'p50 before':>12}{'p50 after':>11}{'p95 before':>12}{'p95 after':>11}{'speedup':>9}")
+  for name, _ in cases:
+    p50_before, p50_after = percentile(before[name], 50), percentile(after[name], 50)
+    print(
+      f"{name:<27}{p50_before:>12.2f}{p50_after:>11.2f}"
+      f"{percentile(before[name], 95):>12.2f}{percentile(after[name], 95):>11.2f}"
+      f"{p50_before / p50_after if p50_after else 0:>8.1f}x"
+    )
+
+
+if __name__ == '__main__':
+  main()
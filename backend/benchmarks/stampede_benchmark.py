@@ -0,0 +1,105 @@
+"""
+Cache stampede benchmark
+
+Expires a cached admin dashboard entry and releases N concurrent clients at
+the same instant, then reports how many SQL statements hit the database with
+and without single-flight recomputation.
+
+Runs on the in-process memory backend by default, so no Redis server is
+needed; its locks are shared by the client threads of this one process.
+--backend redis measures against the Redis at CACHE_REDIS_URL/REDIS_URL
+(default localhost:6379), with locks as every worker process would see them.
+
+Usage (from backend/):
+  python -m benchmarks.stampede_benchmark --clients 50 --rounds 5
+  REDIS_URL=redis://localhost:6379/0 python -m benchmarks.stampede_benchmark --backend redis
+"""
+import argparse
+import os
+import threading
+import time
+from sqlalchemy import event
+
+
+class QueryCounter:
+  """Thread-safe counter of statements sent to the database"""
+  def __init__(self, engine):
+    self.count = 0
+    self._lock = threading.Lock()
+    event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+  def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+    with self._lock:
+      self.count += 1
+
+  def reset(self):
+    with self._lock:
+      self.count = 0
+
+
+def run_burst(app, func, key, clients, counter, cache_service):
+  """Drop the key (a synchronized expiry) and call func from every client at once"""
+  cache_service.delete(key)
+  counter.reset()
+  barrier = threading.Barrier(clients)
+  errors = []
+
+  def client():
+    with app.app_context():
+      barrier.wait()
+      try:
+        func()
+      except Exception as e:
+        errors.append(e)
+
+  threads = [threading.Thread(target=client) for _ in range(clients)]
+  started = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - started
+
+  return counter.count, elapsed, len(errors)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+  parser.add_argument('--clients', type=int, default=50)
+  parser.add_argument('--rounds', type=int, default=5)
+  parser.add_argument('--backend', choices=['memory', 'redis'], default='memory')
+  args = parser.parse_args()
+
+  # Config reads the environment at import time
+  os.environ['CACHE_BACKEND'] = args.backend
+  from app import create_app, db
+
+  app = create_app()
+  with app.app_context():
+    from app.models.cached_models import CachedStats
+    from app.services.cache_service import cache_service, cached
+
+    if not cache_service.is_connected():
+      raise SystemExit('Redis is not reachable; start it or set REDIS_URL')
+
+    counter = QueryCounter(db.engine)
+    compute_stats = CachedStats.get_admin_dashboard_stats.__wrapped__
+    variants = [
+      ('plain', 'stats::bench_plain',
+        cached(key_pattern='stats::bench_plain', expiry=300)(compute_stats)),
+      ('single_flight', 'stats::bench_single_flight',
+        cached(key_pattern='stats::bench_single_flight', expiry=300, single_flight=True)(compute_stats)),
+    ]
+
+    print(f"{'variant':<15}{'round':>6}{'db queries':>12}{'elapsed (s)':>13}{'errors':>8}")
+    for label, key, func in variants:
+      totals = 0
+      for round_number in range(1, args.rounds + 1):
+        queries, elapsed, errors = run_burst(app, func, key, args.clients, counter, cache_service)
+        totals += queries
+        print(f"{label:<15}{round_number:>6}{queries:>12}{elapsed:>13.3f}{errors:>8}")
+      print(f"{label:<15}{'avg':>6}{totals / args.rounds:>12.1f}")
+
+
+if __name__ == '__main__':
+  main()
@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.schedules import crontab
 import os
 
 def make_celery():
@@ -11,7 +12,8 @@ def make_celery():
     include=[
       'celery_worker.tasks',
       'celery_worker.report_tasks',
-      'celery_worker.reminder_tasks'
+      'celery_worker.reminder_tasks',
+      'celery_worker.cache_tasks'
     ]
   )
   
@@ -35,9 +37,29 @@ def make_celery():
           'task': 'celery_worker.tasks.cleanup_old_task_results',
           'schedule': 86400.0,  # Daily
         },
+        'sweep-orphaned-cache-keys': {
+          'task': 'tasks.sweep_orphaned_cache_keys',
+          'schedule': 3600.0,  # Hourly
+        },
+        'enforce-cache-budgets': {
+          'task': 'cache_tasks.enforce_cache_budgets',
+          'schedule': 60.0,  # Every minute
+        },
+        'reconcile-booked-counts': {
+          'task': 'tasks.reconcile_booked_counts',
+          'schedule': crontab(hour=3, minute=15),  # Nightly, off-peak
+        },
+        'warm-cache': {
+          'task': 'cache_tasks.warm_cache',
+          'schedule': crontab(hour=int(os.environ.get('CACHE_WARMUP_HOUR', 6)), minute=30),  # Before opening hours
+        },
     }
   )
   
   return celery
 
-celery = make_celery()
\ No newline at end of file
+celery = make_celery()
+
+# Continue the enqueuing request's trace around every task
+from app.services.tracing import setup_celery_tracing
+setup_celery_tracing()
\ No newline at end of file
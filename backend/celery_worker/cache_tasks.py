@@ -0,0 +1,95 @@
+from celery_worker import celery
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+_flask_app = None
+
+def get_flask_app():
+  """
+  Lazily create the Flask app so tasks can use the database and cache
+  """
+  global _flask_app
+  if _flask_app is None:
+    from app import create_app
+    _flask_app = create_app()
+  return _flask_app
+
+def resolve_cached_function(function_path):
+  """
+  Resolve "module:Qualified.name" to a function decorated with @cached
+  """
+  module_name, qualname = function_path.split(':', 1)
+  target = importlib.import_module(module_name)
+  for attribute in qualname.split('.'):
+    target = getattr(target, attribute)
+  return target
+
+@celery.task(bind=True, name='cache_tasks.refresh_cached_entry')
+def refresh_cached_entry(self, function_path, args, kwargs):
+  """
+  Recompute a stale @cached entry in the background (stale-while-revalidate)
+  """
+  try:
+    with get_flask_app().app_context():
+      function = resolve_cached_function(function_path)
+      function.refresh(*args, **kwargs)
+    
+    logger.info(f"Refreshed cached entry for {function_path}")
+    return {
+      'status': 'completed',
+      'function': function_path
+    }
+      
+  except Exception as e:
+    logger.error(f"Error in refresh_cached_entry for {function_path}: {str(e)}")
+    return {
+      'status': 'failed',
+      'error': str(e)
+    }
+
+@celery.task(bind=True, name='cache_tasks.warm_cache')
+def warm_cache(self, days=7):
+  """
+  Pre-populate dashboards, department/doctor lists and next-week availability
+  before opening hours (see app.services.cache_warmup)
+  """
+  try:
+    with get_flask_app().app_context():
+      from app.services.cache_warmup import warm_cache as run_warm_cache
+      summary = run_warm_cache(days=days)
+    
+    return {
+      'status': 'completed',
+      'entries': summary
+    }
+      
+  except Exception as e:
+    logger.error(f"Error in warm_cache: {str(e)}")
+    return {
+      'status': 'failed',
+      'error': str(e)
+    }
+
+@celery.task(bind=True, name='cache_tasks.enforce_cache_budgets')
+def enforce_cache_budgets(self, namespaces=None):
+  """
+  Shed entries from cache namespaces that exceed their memory budget
+  """
+  try:
+    with get_flask_app().app_context():
+      from app.services.cache_service import cache_service
+      results = cache_service.enforce_budgets(namespaces)
+    
+    return {
+      'status': 'completed',
+      'namespaces': results
+    }
+      
+  except Exception as e:
+    logger.error(f"Error in enforce_cache_budgets: {str(e)}")
+    return {
+      'status': 'failed',
+      'error': str(e)
+    }
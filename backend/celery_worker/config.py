@@ -1,5 +1,6 @@
 import os
 from datetime import timedelta
+from celery.schedules import crontab
 
 class CeleryConfig:
   broker_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
@@ -26,6 +27,22 @@ class CeleryConfig:
           'task': 'celery_worker.tasks.cleanup_old_task_results',
           'schedule': timedelta(days=1),
       },
+      'sweep-orphaned-cache-keys': {
+          'task': 'tasks.sweep_orphaned_cache_keys',
+          'schedule': timedelta(hours=1),
+      },
+      'enforce-cache-budgets': {
+          'task': 'cache_tasks.enforce_cache_budgets',
+          'schedule': timedelta(minutes=1),
+      },
+      'reconcile-booked-counts': {
+          'task': 'tasks.reconcile_booked_counts',
+          'schedule': crontab(hour=3, minute=15),
+      },
+      'warm-cache': {
+          'task': 'cache_tasks.warm_cache',
+          'schedule': crontab(hour=int(os.environ.get('CACHE_WARMUP_HOUR', 6)), minute=30),
+      },
   }
   
   # Result expiry
@@ -1,6 +1,7 @@
 from celery_worker import celery
 from app.models import Appointment, Doctor, Patient, Treatment, db
 from app.services.email_service import email_service
+from app.services.tracing import span
 from datetime import datetime, timedelta
 import logging
 from sqlalchemy import func, and_
@@ -281,7 +282,10 @@ def generate_pdf_report(doctor, report_data, month_name):
   </html>
   """
   
-  return HTML(string=html_content).write_pdf()
+  with span('pdf.render', doctor_id=doctor.id) as attributes:
+    pdf_content = HTML(string=html_content).write_pdf()
+    attributes['bytes'] = len(pdf_content)
+  return pdf_content
 
 @celery.task(bind=True, name='report_tasks.generate_custom_report')
 def generate_custom_report(self, doctor_id, start_date, end_date, email):
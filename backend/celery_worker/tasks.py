@@ -28,6 +28,31 @@ def cleanup_old_task_results(self):
       'error': str(e)
     }
 
+@celery.task(bind=True, name='tasks.sweep_orphaned_cache_keys')
+def sweep_orphaned_cache_keys(self):
+  """
+  Reclaim cache entries left behind by generation-based invalidation
+  """
+  try:
+    from celery_worker.cache_tasks import get_flask_app
+    from app.services.cache_service import cache_service
+    
+    # The app config selects the cache backend, URL and budgets
+    with get_flask_app().app_context():
+      removed = cache_service.sweep_orphaned_keys()
+    logger.info(f"Cache sweep removed {removed} orphaned keys")
+    return {
+      'status': 'completed',
+      'removed_keys': removed
+    }
+      
+  except Exception as e:
+    logger.error(f"Error in sweep_orphaned_cache_keys: {str(e)}")
+    return {
+      'status': 'failed',
+      'error': str(e)
+    }
+
 @celery.task(bind=True, name='tasks.get_task_status')
 def get_task_status(self, task_id):
   """
@@ -48,4 +73,59 @@ def get_task_status(self, task_id):
     return {
       'status': 'error',
       'error': str(e)
-    }
\ No newline at end of file
+    }
+
+@celery.task(bind=True, name='tasks.reconcile_booked_counts')
+def reconcile_booked_counts(self, start_date=None):
+  """
+  Verify DoctorAvailability.booked_count against the appointments table and
+  repair drifted slots (from today, or from start_date as YYYY-MM-DD)
+  """
+  try:
+    from celery_worker.cache_tasks import get_flask_app
+    from app.utils.booking_counts import reconcile_booked_counts as reconcile
+    
+    with get_flask_app().app_context():
+      result = reconcile(datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None)
+    
+    logger.info(f"Booked count reconciliation: {result['drifted']} of {result['checked']} slots repaired")
+    return dict(result, status='completed')
+      
+  except Exception as e:
+    logger.error(f"Error in reconcile_booked_counts: {str(e)}")
+    return {
+      'status': 'failed',
+      'error': str(e)
+    }
+
+@celery.task(bind=True, name='tasks.log_scheduling_conflict')
+def log_scheduling_conflict(self, conflict):
+  """
+  Record a scheduling conflict found during booking validation, off the
+  request path (see AppointmentService.defer_conflict_log)
+  """
+  try:
+    from celery_worker.cache_tasks import get_flask_app
+    from app.services.appointment_service import AppointmentService
+    
+    with get_flask_app().app_context():
+      logged = AppointmentService.log_conflict(
+        conflict['conflict_type'],
+        conflict.get('user_id'),
+        datetime.strptime(conflict['attempted_date'], '%Y-%m-%d').date(),
+        datetime.strptime(conflict['attempted_time'], '%H:%M:%S').time(),
+        doctor_id=conflict.get('doctor_id'),
+        patient_id=conflict.get('patient_id')
+      )
+    
+    return {
+      'status': 'completed' if logged else 'failed',
+      'conflict_type': conflict['conflict_type']
+    }
+      
+  except Exception as e:
+    logger.error(f"Error in log_scheduling_conflict: {str(e)}")
+    return {
+      'status': 'failed',
+      'error': str(e)
+    }
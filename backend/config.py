@@ -9,10 +9,73 @@ class Config:
   # Redis configuration
   REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
   
+  # Cache backend: 'redis', or 'memory' for an in-process stand-in (benchmarks,
+  # CI, no Redis server); CACHE_ENABLED=false turns every lookup into a miss
+  CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'redis'
+  CACHE_ENABLED = (os.environ.get('CACHE_ENABLED') or 'true').lower() not in ('0', 'false', 'no')
+  
+  # Cache Redis; set CACHE_REDIS_URL (another DB or instance) to keep cache
+  # entries away from the Celery broker and result backend
+  CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+  
+  # Per-namespace soft limits, e.g. "doctors=64mb:lfu,stats=8mb"; policy is
+  # lru, lfu or ttl (CACHE_EVICTION_POLICY when omitted)
+  CACHE_NAMESPACE_BUDGETS = os.environ.get('CACHE_NAMESPACE_BUDGETS')
+  CACHE_EVICTION_POLICY = os.environ.get('CACHE_EVICTION_POLICY') or 'lru'
+  
+  # Cache connection pool and circuit breaker
+  CACHE_REDIS_MAX_CONNECTIONS = int(os.environ.get('CACHE_REDIS_MAX_CONNECTIONS') or 50)
+  CACHE_REDIS_CONNECT_TIMEOUT = float(os.environ.get('CACHE_REDIS_CONNECT_TIMEOUT') or 1)
+  CACHE_REDIS_TIMEOUT = float(os.environ.get('CACHE_REDIS_TIMEOUT') or 1)
+  CACHE_BREAKER_FAILURES = int(os.environ.get('CACHE_BREAKER_FAILURES') or 5)
+  CACHE_BREAKER_COOLDOWN = float(os.environ.get('CACHE_BREAKER_COOLDOWN') or 30)
+  
+  # Schedule index hashes (appointments::slots) are reloaded from the database
+  # this many seconds after they were built, bounding drift from racing writes
+  SCHEDULE_INDEX_TTL = int(os.environ.get('SCHEDULE_INDEX_TTL') or 300)
+  
   # Celery configuration
   CELERY_BROKER_URL = REDIS_URL
   CELERY_RESULT_BACKEND = REDIS_URL
   
+  # Bookings that fail on lock contention are retried this often, backing
+  # off exponentially from BOOKING_RETRY_BASE_DELAY seconds
+  BOOKING_MAX_RETRIES = int(os.environ.get('BOOKING_MAX_RETRIES') or 3)
+  BOOKING_RETRY_BASE_DELAY = float(os.environ.get('BOOKING_RETRY_BASE_DELAY') or 0.05)
+  
+  # Scheduling conflicts found by booking validation are written to the
+  # conflict log by a Celery task
+  CONFLICT_LOG_ENABLED = (os.environ.get('CONFLICT_LOG_ENABLED') or 'true').lower() not in ('0', 'false', 'no')
+  
+  # A statement fingerprint repeated more often than this in one request is
+  # reported as a possible N+1; strict mode raises (default: in testing only)
+  N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD') or 5)
+  QUERY_INSPECTION_STRICT = None
+  
+  # Statements slower than this (ms) are kept, with their EXPLAIN plan, in a
+  # per-process ring buffer of SLOW_QUERY_LOG_SIZE entries
+  SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS') or 200)
+  SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE') or 500)
+  SLOW_QUERY_EXPLAIN = (os.environ.get('SLOW_QUERY_EXPLAIN') or 'true').lower() not in ('0', 'false', 'no')
+  
+  # Admin requests with X-Profile: 1 (or: sample) are profiled and kept in
+  # PROFILE_DIR, oldest first out beyond PROFILE_STORE_MAX_COUNT/_MAX_BYTES
+  PROFILING_ENABLED = (os.environ.get('PROFILING_ENABLED') or 'true').lower() not in ('0', 'false', 'no')
+  PROFILE_DIR = os.environ.get('PROFILE_DIR')
+  PROFILE_STORE_MAX_COUNT = int(os.environ.get('PROFILE_STORE_MAX_COUNT') or 200)
+  PROFILE_STORE_MAX_BYTES = int(os.environ.get('PROFILE_STORE_MAX_BYTES') or 50 * 1024 * 1024)
+  PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL') or 0.005)
+  
+  # Request/task trace spans: 'memory' (per process), 'none', or 'file' (JSON
+  # lines shared by web and worker processes, rotated beyond
+  # TRACE_FILE_MAX_BYTES; one synchronous write per span, so opt-in)
+  TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER') or 'memory'
+  TRACE_FILE = os.environ.get('TRACE_FILE')
+  TRACE_FILE_MAX_BYTES = int(os.environ.get('TRACE_FILE_MAX_BYTES') or 20 * 1024 * 1024)
+  
+  # Optional bearer token required by GET /metrics
+  METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+  
   # JWT configuration
   JWT_SECRET_KEY = SECRET_KEY
   JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
@@ -0,0 +1,88 @@
+import os
+from datetime import datetime, time as dt_time, timedelta
+
+# Config reads the environment at import time: in-memory SQLite, the
+# in-process Redis stand-in and no span export
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['CACHE_REDIS_URL'] = 'memory://tests'
+os.environ['TRACE_EXPORTER'] = 'none'
+os.environ['SLOW_QUERY_EXPLAIN'] = 'false'
+os.environ['CONFLICT_LOG_ENABLED'] = 'false'
+os.environ['PROFILING_ENABLED'] = 'false'
+
+import pytest
+
+from app import create_app
+from app.models import User, Department, Doctor, Patient, DoctorAvailability, db
+from app.services.cache_service import cache_service
+
+
+@pytest.fixture
+def app():
+  app = create_app()
+  app.config['TESTING'] = True
+  with app.app_context():
+    cache_service.reset()
+    cache_service.redis_client.flushdb()
+    db.drop_all()
+    db.create_all()
+    yield app
+    db.session.remove()
+    db.drop_all()
+  cache_service.reset()
+
+
+@pytest.fixture
+def client(app):
+  return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+  def log_in(user):
+    """Log the test client in as user (Flask-Login session cookie)"""
+    with client.session_transaction() as session:
+      session['_user_id'] = str(user.id)
+      session['_fresh'] = True
+  return log_in
+
+
+@pytest.fixture
+def make_doctor(app):
+  def make(name='doctor', is_available=True):
+    department = Department.query.first() or Department(name='General', description='General')
+    user = User(username=name, email=f'{name}@example.com', role='doctor')
+    user.set_password('x')
+    doctor = Doctor(user=user, department=department, specialization='General', is_available=is_available)
+    db.session.add(doctor)
+    db.session.commit()
+    return doctor
+  return make
+
+
+@pytest.fixture
+def make_patient(app):
+  def make(name='patient'):
+    user = User(username=name, email=f'{name}@example.com', role='patient')
+    user.set_password('x')
+    patient = Patient(user=user, first_name='Test', last_name=name,
+                      date_of_birth=datetime(1990, 1, 1).date(), gender='female')
+    db.session.add(patient)
+    db.session.commit()
+    return patient
+  return make
+
+
+@pytest.fixture
+def make_slot(app):
+  def make(doctor, days_ahead=1, hour=9, max_patients=2, is_available=True):
+    slot = DoctorAvailability(
+      doctor_id=doctor.id, date=datetime.now().date() + timedelta(days=days_ahead),
+      start_time=dt_time(hour, 0), end_time=dt_time(hour + 1, 0),
+      is_available=is_available, max_patients=max_patients
+    )
+    db.session.add(slot)
+    db.session.commit()
+    return slot
+  return make
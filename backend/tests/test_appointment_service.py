@@ -0,0 +1,251 @@
+from datetime import date, time as dt_time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app.models import Appointment, DoctorAvailability, db
+from app.services import appointment_service
+from app.services.appointment_service import AppointmentService, BookingContext
+from app.utils.booking_counts import reserve_slot
+
+
+def _booked(slot):
+  return db.session.get(DoctorAvailability, slot.id).booked_count
+
+
+def test_reserve_slot_stops_at_max_patients(app, make_doctor, make_slot):
+  slot = make_slot(make_doctor(), max_patients=2)
+
+  assert reserve_slot(db.session, slot.doctor_id, slot.date, slot.start_time)
+  assert reserve_slot(db.session, slot.doctor_id, slot.date, slot.start_time)
+  assert not reserve_slot(db.session, slot.doctor_id, slot.date, slot.start_time)
+  db.session.commit()
+  assert _booked(slot) == 2
+
+
+def test_reserve_slot_refuses_closed_and_missing_slots(app, make_doctor, make_slot):
+  doctor = make_doctor()
+  closed = make_slot(doctor, is_available=False)
+
+  assert not reserve_slot(db.session, doctor.id, closed.date, closed.start_time)
+  assert not reserve_slot(db.session, doctor.id, closed.date, dt_time(18, 0))
+
+
+def test_book_appointment_counts_each_booking_once(app, make_doctor, make_patient, make_slot):
+  slot = make_slot(make_doctor(), max_patients=2)
+  patients = [make_patient(f'patient{number}') for number in range(3)]
+
+  results = [
+    AppointmentService.book_appointment(patient.id, slot.doctor_id, slot.date, slot.start_time, 'Checkup')
+    for patient in patients
+  ]
+
+  assert [appointment is not None for appointment, _ in results] == [True, True, False]
+  assert results[2][1] == 'This time slot is fully booked'
+  assert _booked(slot) == 2
+  assert Appointment.query.count() == 2
+
+
+def test_refused_booking_leaves_the_counter_alone(app, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor, max_patients=3)
+  other = make_slot(make_doctor('other'), max_patients=3)
+
+  assert AppointmentService.book_appointment(patient.id, doctor.id, slot.date, slot.start_time, 'Checkup')[0]
+  # Same patient, same time, another doctor: refused after the reservation
+  appointment, error = AppointmentService.book_appointment(patient.id, other.doctor_id, other.date, other.start_time, 'Checkup')
+
+  assert appointment is None and error
+  assert (_booked(slot), _booked(other)) == (1, 0)
+
+
+def test_reschedule_reserves_the_new_slot(app, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  morning, afternoon = make_slot(doctor, hour=9), make_slot(doctor, hour=14)
+  appointment, _ = AppointmentService.book_appointment(patient.id, doctor.id, morning.date, morning.start_time, 'Checkup')
+
+  moved, error = AppointmentService.reschedule_appointment(appointment, afternoon.date, afternoon.start_time)
+  db.session.commit()
+
+  assert moved, error
+  assert (_booked(morning), _booked(afternoon)) == (0, 1)
+
+
+def _locked():
+  return OperationalError('UPDATE doctor_availabilities ...', {}, Exception('database is locked'))
+
+
+def test_transient_lock_conflicts_are_retried(app, monkeypatch):
+  monkeypatch.setattr(appointment_service.time_module, 'sleep', lambda seconds: None)
+  attempts = []
+
+  def operation():
+    attempts.append(1)
+    if len(attempts) < 3:
+      raise _locked()
+    return 'booked'
+
+  assert appointment_service._with_retries(operation) == 'booked'
+  assert len(attempts) == 3
+
+
+def test_retries_are_bounded_and_skip_other_errors(app, monkeypatch):
+  monkeypatch.setattr(appointment_service.time_module, 'sleep', lambda seconds: None)
+  app.config['BOOKING_MAX_RETRIES'] = 2
+  attempts = []
+
+  def locked():
+    attempts.append(1)
+    raise _locked()
+
+  with pytest.raises(OperationalError):
+    appointment_service._with_retries(locked)
+  assert len(attempts) == 3
+
+  def broken():
+    attempts.append(1)
+    raise OperationalError('SELECT 1', {}, Exception('no such table: doctors'))
+
+  attempts.clear()
+  with pytest.raises(OperationalError):
+    appointment_service._with_retries(broken)
+  assert len(attempts) == 1
+
+
+def test_audit_log_failures_are_logged_with_traceback(app, monkeypatch, caplog, capsys):
+  def fail():
+    raise OperationalError('INSERT', {}, Exception('database is locked'))
+  monkeypatch.setattr(db.session, 'commit', fail)
+
+  with caplog.at_level('ERROR'):
+    assert AppointmentService.log_conflict('patient_overlap', 1, date.today(), dt_time(9, 0)) is False
+    assert AppointmentService.log_appointment_history(1, 'created', changed_by=1) is False
+
+  assert [record.getMessage() for record in caplog.records] == [
+    'Error logging conflict (patient_overlap)',
+    'Error logging appointment history for appointment 1'
+  ]
+  assert all(record.exc_info for record in caplog.records)
+  assert capsys.readouterr().out == ''
+
+
+def _violation(doctor, patient, slot, exclude_appointment_id=None):
+  return BookingContext.load(doctor.id, patient.id, slot.date, slot.start_time, exclude_appointment_id).violation()
+
+
+def test_booking_context_loads_in_two_queries(app, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor)
+  # Read the ids now: committed instances reload on first access
+  arguments = (doctor.id, patient.id, slot.date, slot.start_time)
+  statements = []
+
+  def count(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+  event.listen(db.engine, 'before_cursor_execute', count)
+  try:
+    assert BookingContext.load(*arguments).violation() is None
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', count)
+
+  assert len(statements) == 2
+
+
+def test_unavailable_doctor_and_closed_or_missing_slots_are_refused(app, make_doctor, make_patient, make_slot):
+  patient = make_patient()
+  away = make_doctor('away', is_available=False)
+  assert _violation(away, patient, make_slot(away)) == ('doctor_unavailable', "Doctor is not available")
+
+  doctor = make_doctor()
+  closed = make_slot(doctor, is_available=False)
+  assert _violation(doctor, patient, closed) == ('doctor_unavailable', "Doctor is not available at this time slot")
+  missing = SimpleNamespace(date=closed.date, start_time=dt_time(18, 0))
+  assert _violation(doctor, patient, missing) == ('doctor_unavailable', "Doctor is not available at this time slot")
+
+
+def test_doctor_cannot_be_double_booked_beyond_slot_capacity(app, make_doctor, make_patient, make_slot):
+  doctor = make_doctor()
+  single, double = make_slot(doctor, hour=9, max_patients=1), make_slot(doctor, hour=14, max_patients=2)
+  first, second, third = make_patient('first'), make_patient('second'), make_patient('third')
+
+  assert AppointmentService.book_appointment(first.id, doctor.id, single.date, single.start_time, 'Checkup')[0]
+  assert _violation(doctor, second, single) == ('doctor_unavailable', "This time slot is fully booked")
+
+  assert AppointmentService.book_appointment(first.id, doctor.id, double.date, double.start_time, 'Checkup')[0]
+  assert _violation(doctor, second, double) is None
+  assert AppointmentService.book_appointment(second.id, doctor.id, double.date, double.start_time, 'Checkup')[0]
+  assert _violation(doctor, third, double) == ('doctor_unavailable', "This time slot is fully booked")
+
+
+def test_patient_overlaps_are_refused(app, make_doctor, make_patient, make_slot):
+  patient = make_patient()
+  booked, other = make_doctor('booked'), make_doctor('other')
+  nine = make_slot(booked, hour=9)
+  appointment, _ = AppointmentService.book_appointment(patient.id, booked.id, nine.date, nine.start_time, 'Checkup')
+
+  assert _violation(other, patient, make_slot(other, hour=9)) == \
+    ('patient_conflict', "You already have an appointment scheduled at this time")
+  assert _violation(other, patient, make_slot(other, hour=11)) == \
+    ('patient_conflict', "You have another appointment within 2 hours of this time")
+  assert _violation(other, patient, make_slot(other, hour=12)) is None
+
+  # The appointment being rescheduled does not conflict with itself
+  assert _violation(booked, patient, make_slot(booked, hour=10), exclude_appointment_id=appointment.id) is None
+
+  appointment.status = 'cancelled'
+  db.session.commit()
+  assert _violation(other, patient, make_slot(other, hour=10)) is None
+
+
+def test_booking_window_refuses_past_and_far_future_dates(app, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+
+  assert _violation(doctor, patient, make_slot(doctor, days_ahead=-1)) == (None, "Cannot book appointments in the past")
+  assert _violation(doctor, patient, make_slot(doctor, days_ahead=89)) is None
+  assert _violation(doctor, patient, make_slot(doctor, days_ahead=91)) == \
+    (None, "Cannot book appointments more than 3 months in advance")
+
+
+def _check(client, slot, **extra):
+  return client.post('/api/appointments/conflicts/check', json=dict({
+    'doctor_id': slot.doctor_id,
+    'appointment_date': slot.date.isoformat(),
+    'appointment_time': slot.start_time.strftime('%H:%M')
+  }, **extra))
+
+
+def test_conflict_check_route_reports_availability(app, client, login, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor)
+  login(patient.user)
+
+  response = _check(client, slot)
+
+  # Within the route's query budget, which raises in test mode
+  assert response.status_code == 200
+  assert response.get_json() == {'available': True, 'message': 'Validation successful'}
+
+
+def test_conflict_check_route_reports_the_broken_rule(app, client, login, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor, max_patients=1)
+  AppointmentService.book_appointment(make_patient('other').id, doctor.id, slot.date, slot.start_time, 'Checkup')
+  login(patient.user)
+
+  response = _check(client, slot)
+
+  assert response.status_code == 200
+  assert response.get_json() == {'available': False, 'message': 'This time slot is fully booked'}
+
+
+def test_conflict_check_route_requires_a_patient_for_staff(app, client, login, make_doctor, make_slot):
+  doctor = make_doctor()
+  login(doctor.user)
+
+  response = _check(client, make_slot(doctor))
+
+  assert response.status_code == 400
+  assert response.get_json() == {'error': 'patient_id is required for non-patient users'}
@@ -0,0 +1,109 @@
+from datetime import date, time as dt_time
+
+from sqlalchemy import event, text
+
+from app.models import Appointment, DoctorAvailability, db
+from app.utils.booking_counts import reconcile_booked_counts
+
+
+def _book(patient, slot, status='scheduled'):
+  appointment = Appointment(patient_id=patient.id, doctor_id=slot.doctor_id, appointment_date=slot.date,
+                            appointment_time=slot.start_time, reason='Checkup', status=status)
+  db.session.add(appointment)
+  db.session.commit()
+  return appointment
+
+
+def _booked(slot):
+  return db.session.get(DoctorAvailability, slot.id).booked_count
+
+
+def test_bookings_and_cancellations_move_the_counter(app, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor)
+
+  first = _book(patient, slot)
+  _book(make_patient('second'), slot)
+  assert _booked(slot) == 2
+
+  first.status = 'cancelled'
+  db.session.commit()
+  assert _booked(slot) == 1
+
+  first.status = 'scheduled'
+  db.session.commit()
+  assert _booked(slot) == 2
+
+
+def test_reschedule_moves_the_place_between_slots(app, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  morning, afternoon = make_slot(doctor, hour=9), make_slot(doctor, hour=14)
+  appointment = _book(patient, morning)
+
+  appointment.appointment_time = afternoon.start_time
+  db.session.commit()
+  assert (_booked(morning), _booked(afternoon)) == (0, 1)
+
+  db.session.delete(appointment)
+  db.session.commit()
+  assert _booked(afternoon) == 0
+
+
+def test_unbooked_statuses_and_rollbacks_are_not_counted(app, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor)
+  _book(patient, slot, status='cancelled')
+
+  db.session.add(Appointment(patient_id=patient.id, doctor_id=doctor.id, appointment_date=slot.date,
+                             appointment_time=slot.start_time, reason='Checkup'))
+  db.session.flush()
+  db.session.rollback()
+  assert _booked(slot) == 0
+
+
+def test_reconcile_repairs_writes_that_bypass_the_orm(app, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor)
+  _book(patient, slot)
+  db.session.execute(text('UPDATE doctor_availabilities SET booked_count = 5'))
+  db.session.commit()
+
+  result = reconcile_booked_counts(start_date=date.min)
+  assert (result['checked'], result['drifted']) == (1, 1)
+  assert _booked(slot) == 1
+  assert reconcile_booked_counts(start_date=date.min)['drifted'] == 0
+
+
+def test_reconcile_keeps_a_booking_committed_while_it_runs(app, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor)
+  _book(patient, slot)
+  db.session.execute(text('UPDATE doctor_availabilities SET booked_count = 5'))
+  db.session.commit()
+  booked = {'counted': False, 'done': False}
+
+  def book_after_the_count(conn, cursor, statement, parameters, context, executemany):
+    """Once reconcile has counted the appointments, book one more, as another request would"""
+    if booked['counted'] and not booked['done']:
+      booked['done'] = True
+      conn.execute(Appointment.__table__.insert().values(
+        patient_id=patient.id, doctor_id=doctor.id, appointment_date=slot.date,
+        appointment_time=slot.start_time, reason='Checkup', status='scheduled'
+      ))
+      conn.execute(DoctorAvailability.__table__.update().where(DoctorAvailability.__table__.c.id == slot.id).values(
+        booked_count=DoctorAvailability.__table__.c.booked_count + 1
+      ))
+    if 'count(appointments.id)' in statement.lower():
+      booked['counted'] = True
+
+  event.listen(db.engine, 'before_cursor_execute', book_after_the_count)
+  try:
+    result = reconcile_booked_counts(start_date=date.min)
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', book_after_the_count)
+
+  assert booked['done']
+  assert result['drifted'] == 1
+  assert Appointment.query.filter_by(doctor_id=doctor.id).count() == 2
+  assert _booked(slot) == 2
+  assert reconcile_booked_counts(start_date=date.min)['drifted'] == 0
@@ -0,0 +1,119 @@
+import pytest
+
+from app.services.cache_service import cache_service, cached, cached_batch
+from app.utils.cache_keys import CacheKeys
+
+
+@pytest.fixture
+def mgets(app, monkeypatch):
+  """Record the keys of every MGET for cache entries (not generation counters)"""
+  client = cache_service.redis_client
+  calls = []
+  mget = client.mget
+  def recording_mget(keys, *args):
+    if not all(key.startswith(CacheKeys.generation('')) for key in keys):
+      calls.append(list(keys))
+    return mget(keys, *args)
+  monkeypatch.setattr(client, 'mget', recording_mget)
+  return calls
+
+
+def _doctor_lookup(known, calls, negative_ttl=None):
+  @cached_batch(CacheKeys.doctor_detail('{doctor_id}'), expiry=60, negative_ttl=negative_ttl)
+  def lookup(doctor_ids):
+    calls.append(list(doctor_ids))
+    return {doctor_id: {'id': doctor_id} for doctor_id in doctor_ids if doctor_id in known}
+  return lookup
+
+
+def test_get_many_returns_hits_only_with_one_mget(mgets):
+  cache_service.set(CacheKeys.doctor_detail(1), {'id': 1})
+  cache_service.set(CacheKeys.doctor_detail(3), {'id': 3})
+  keys = [CacheKeys.doctor_detail(doctor_id) for doctor_id in (1, 2, 3, 1)]
+
+  assert cache_service.get_many(keys) == {
+    CacheKeys.doctor_detail(1): {'id': 1},
+    CacheKeys.doctor_detail(3): {'id': 3}
+  }
+  assert len(mgets) == 1
+  assert len(mgets[0]) == 3
+
+
+def test_get_many_reads_redis_only_for_local_misses(mgets):
+  cache_service.set(CacheKeys.doctor_detail(1), {'id': 1}, local_ttl=60)
+  cache_service.set(CacheKeys.doctor_detail(2), {'id': 2})
+
+  result = cache_service.get_many([CacheKeys.doctor_detail(1), CacheKeys.doctor_detail(2)], local_ttl=60)
+
+  assert result == {CacheKeys.doctor_detail(1): {'id': 1}, CacheKeys.doctor_detail(2): {'id': 2}}
+  assert mgets == [[cache_service.versioned_key(CacheKeys.doctor_detail(2))]]
+
+
+def test_cached_batch_loads_only_the_misses_in_request_order(mgets):
+  calls = []
+  lookup = _doctor_lookup({1, 2, 3, 4, 5}, calls)
+  assert lookup([2, 4]) == {2: {'id': 2}, 4: {'id': 4}}
+
+  mgets.clear()
+  result = lookup([5, 4, 3, 2, 1])
+
+  assert calls == [[2, 4], [5, 3, 1]]
+  assert result == {doctor_id: {'id': doctor_id} for doctor_id in (1, 2, 3, 4, 5)}
+  assert len(mgets) == 1
+
+  # Everything is cached now: no call, still one MGET
+  mgets.clear()
+  assert lookup([1, 2, 3, 4, 5]) == result
+  assert calls == [[2, 4], [5, 3, 1]]
+  assert len(mgets) == 1
+
+
+def test_cached_batch_shares_entries_with_cached(app):
+  calls = []
+  lookup = _doctor_lookup({1, 2}, calls)
+
+  @cached(CacheKeys.doctor_detail('{doctor_id}'), expiry=60)
+  def single(doctor_id):
+    calls.append(doctor_id)
+    return {'id': doctor_id}
+
+  assert single(1) == {'id': 1}
+  assert lookup([1, 2]) == {1: {'id': 1}, 2: {'id': 2}}
+  assert single(2) == {'id': 2}
+  assert calls == [1, [2]]
+
+
+def test_cached_batch_without_negative_ttl_retries_unknown_ids(app):
+  calls = []
+  lookup = _doctor_lookup({1}, calls)
+
+  assert lookup([1, 404]) == {1: {'id': 1}}
+  assert lookup([1, 404]) == {1: {'id': 1}}
+  assert calls == [[1, 404], [404]]
+
+
+def test_cached_batch_caches_negative_entries_within_a_batch(mgets):
+  calls = []
+  lookup = _doctor_lookup({1, 2}, calls, negative_ttl=30)
+
+  assert lookup([1, 404, 2, 405]) == {1: {'id': 1}, 2: {'id': 2}}
+  mgets.clear()
+  assert lookup([405, 2, 404, 1]) == {1: {'id': 1}, 2: {'id': 2}}
+  assert calls == [[1, 404, 2, 405]]
+  assert len(mgets) == 1
+
+  # Only the unknown ids were negative: a new id is still loaded, alone
+  assert lookup([404, 3]) == {}
+  assert calls == [[1, 404, 2, 405], [3]]
+
+
+def test_negative_batch_entries_expire(app, monkeypatch):
+  from app.services import cache_service as cache_module
+  calls = []
+  lookup = _doctor_lookup(set(), calls, negative_ttl=30)
+  assert lookup([404]) == {}
+
+  now = cache_module.time.time()
+  monkeypatch.setattr(cache_module.time, 'time', lambda: now + 31)
+  assert lookup([404]) == {}
+  assert calls == [[404], [404]]
@@ -0,0 +1,111 @@
+import pytest
+
+from app.services.cache_service import cache_service
+from app.utils.cache_keys import CacheKeys
+
+
+@pytest.fixture
+def budget(app, monkeypatch):
+  """Give the doctors namespace a 2kb budget, shed soonest-expiring first"""
+  from celery_worker import cache_tasks
+  checks = []
+  monkeypatch.setattr(cache_tasks.enforce_cache_budgets, 'delay', lambda namespaces: checks.append(namespaces))
+  app.config['CACHE_NAMESPACE_BUDGETS'] = 'doctors=2kb:ttl'
+  cache_service.reset()
+  yield checks
+  cache_service.reset()
+
+
+def _accounting(namespace='doctors'):
+  client = cache_service.redis_client
+  sizes = {key: int(size) for key, size in client.hgetall(CacheKeys.namespace_sizes(namespace)).items()}
+  members = set(client.zrange(CacheKeys.namespace_index(namespace), 0, -1))
+  return sizes, members
+
+
+def _assert_consistent(namespace='doctors'):
+  """The size hash, the expiry zset and the stored keys describe the same entries"""
+  client = cache_service.redis_client
+  sizes, members = _accounting(namespace)
+  stored = set(client.scan_iter(match=f'{namespace}::g*'))
+
+  assert set(sizes) == members == stored
+  assert all(len(client.get(key)) == size for key, size in sizes.items())
+  return sum(sizes.values())
+
+
+def _versioned(key):
+  return cache_service.versioned_key(key).encode('utf-8')
+
+
+def test_overwrites_replace_the_accounted_size(budget):
+  key = CacheKeys.doctor_detail(1)
+  cache_service.set(key, 'x' * 300)
+  first = _assert_consistent()
+
+  cache_service.set(key, 'x' * 100)
+  assert _assert_consistent() < first
+  cache_service.set_many({key: 'x' * 500})
+
+  sizes, members = _accounting()
+  assert list(sizes) == [_versioned(key)]
+  assert members == {_versioned(key)}
+  assert _assert_consistent() == cache_service.budget_usage()['doctors']['used_bytes']
+
+
+def test_deletes_drop_entries_from_the_accounting(budget):
+  keys = [CacheKeys.doctor_detail(doctor_id) for doctor_id in range(4)]
+  cache_service.set_many({key: 'x' * 100 for key in keys})
+  assert len(_accounting()[0]) == 4
+
+  cache_service.delete(keys[0])
+  cache_service.delete_many(keys[1:3])
+
+  assert _accounting() == ({_versioned(keys[3]): len(cache_service.redis_client.get(_versioned(keys[3])))},
+                           {_versioned(keys[3])})
+  _assert_consistent()
+
+
+def test_unbudgeted_namespaces_are_not_accounted(budget):
+  cache_service.set(CacheKeys.department_list(), ['General'])
+  assert _accounting('departments') == ({}, set())
+
+
+def test_eviction_sheds_soonest_expiring_and_keeps_accounting_consistent(budget):
+  keys = [CacheKeys.doctor_detail(doctor_id) for doctor_id in range(10)]
+  for expiry, key in enumerate(keys, start=1):
+    cache_service.set(key, 'x' * 300, expiry_seconds=expiry * 60)
+
+  used = _assert_consistent()
+  assert used > 2048
+  assert budget == [['doctors']]
+
+  [result] = cache_service.enforce_budgets(['doctors'])
+
+  remaining = _assert_consistent()
+  assert result['used_bytes'] == remaining <= 2048 * 0.9
+  assert result['shed_bytes'] == used - remaining
+  shed = result['shed_keys']
+  assert all(cache_service.get(key) is None for key in keys[:shed])
+  assert all(cache_service.get(key) == 'x' * 300 for key in keys[shed:])
+
+  # Writes after an eviction are accounted as usual, and a namespace under
+  # its budget is left alone
+  cache_service.set(keys[0], 'x' * 10)
+  total = _assert_consistent()
+  assert cache_service.enforce_budgets(['doctors'])[0]['shed_keys'] == 0
+  assert _assert_consistent() == total
+
+
+def test_expired_entries_leave_the_accounting(budget, monkeypatch):
+  from app.services import cache_budget
+  cache_service.set(CacheKeys.doctor_detail(1), 'x' * 100, expiry_seconds=60)
+  cache_service.set(CacheKeys.doctor_detail(2), 'x' * 100, expiry_seconds=600)
+
+  now = cache_budget.time.time()
+  monkeypatch.setattr(cache_budget.time, 'time', lambda: now + 120)
+
+  assert cache_service.budget_usage()['doctors']['used_bytes'] == len(
+    cache_service.redis_client.get(_versioned(CacheKeys.doctor_detail(2)))
+  )
+  assert _accounting()[1] == {_versioned(CacheKeys.doctor_detail(2))}
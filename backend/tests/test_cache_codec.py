@@ -0,0 +1,92 @@
+import json
+import zlib
+from datetime import date, datetime, time
+
+import pytest
+
+from app.models.read_models import DepartmentView, DoctorView
+from app.services import cache_codec
+from app.services.cache_codec import CacheCodec
+
+DOCTOR = DoctorView(
+  id=1, user_id=2, name='smith', email='smith@example.com', specialization='Cardiology',
+  department_id=3, department_name='Cardiology', qualification='MD', experience=10,
+  consultation_fee=500.0, bio=None, is_available=True, created_at=datetime(2026, 1, 2, 9, 30)
+)
+
+
+@pytest.mark.parametrize('serializer', ['msgpack', 'json'])
+def test_read_models_round_trip_inside_containers(serializer):
+  codec = CacheCodec(serializer=serializer)
+  value = {
+    'doctors': [DOCTOR, DOCTOR.replace(id=4, name='jones')],
+    'department': DepartmentView(id=3, name='Cardiology', description=None, created_at=None, doctor_count=2),
+    'slots': {'2026-01-05': [time(9, 0), time(10, 30)]},
+    'from': date(2026, 1, 5)
+  }
+
+  decoded = codec.decode(codec.encode(value))
+
+  assert decoded == value
+  assert isinstance(decoded['doctors'][0], DoctorView)
+  assert decoded['doctors'][0].created_at == datetime(2026, 1, 2, 9, 30)
+
+
+def test_msgpack_encodes_read_models_without_pickle():
+  payload = CacheCodec(serializer='msgpack').encode([DOCTOR])
+  assert payload[:1] == cache_codec.FORMAT_MSGPACK
+
+
+def test_json_falls_back_to_pickle_for_unsupported_values():
+  codec = CacheCodec(serializer='json')
+  payload = codec.encode({'at': date(2026, 1, 5)})
+  assert payload[:1] == cache_codec.FORMAT_PICKLE
+  assert codec.decode(payload) == {'at': date(2026, 1, 5)}
+
+
+def test_pickled_payloads_still_decode():
+  import pickle
+  payload = cache_codec.FORMAT_PICKLE + cache_codec.COMPRESSION_ZLIB + zlib.compress(pickle.dumps([DOCTOR]))
+  assert CacheCodec(serializer='json', compression=None).decode(payload) == [DOCTOR]
+
+
+def test_payloads_are_compressed_from_the_threshold_on():
+  codec = CacheCodec(compression='zlib', compress_threshold=64)
+
+  small = codec.encode('x' * 10)
+  large = codec.encode('x' * 500)
+
+  assert small[1:2] == cache_codec.COMPRESSION_NONE
+  assert large[1:2] == cache_codec.COMPRESSION_ZLIB
+  assert len(large) < 500
+  assert codec.decode(large) == 'x' * 500
+
+
+def test_compressed_payloads_decode_with_any_codec_settings():
+  payload = CacheCodec(compression='zlib', compress_threshold=0).encode([1, 2, 3])
+  assert CacheCodec(compression=None).decode(payload) == [1, 2, 3]
+
+
+@pytest.mark.parametrize('payload', [
+  b'',
+  b'M',
+  # A plain JSON value, as stored before the codec header existed
+  json.dumps({'id': 1}).encode('utf-8'),
+  b'X-' + b'{}',
+  b'Mz' + b'not zlib',
+  b'J?' + b'{}',
+])
+def test_legacy_and_corrupt_payloads_are_rejected(payload):
+  with pytest.raises((ValueError, zlib.error)):
+    CacheCodec().decode(payload)
+
+
+def test_unknown_ext_types_are_passed_through():
+  msgpack = pytest.importorskip('msgpack')
+  payload = cache_codec.FORMAT_MSGPACK + cache_codec.COMPRESSION_NONE + msgpack.packb(msgpack.ExtType(42, b'x'))
+  assert CacheCodec().decode(payload) == msgpack.ExtType(42, b'x')
+
+
+def test_str_payloads_are_accepted():
+  payload = CacheCodec(serializer='json').encode({'id': 1})
+  assert CacheCodec().decode(payload.decode('latin1')) == {'id': 1}
@@ -0,0 +1,63 @@
+from app.models import db
+from app.models.cached_models import CachedDoctor
+from app.services.cache_service import cache_service
+from app.utils.cache_keys import CacheKeys
+
+
+def test_doctor_update_refreshes_detail_and_list_on_commit(app, make_doctor):
+  doctor = make_doctor('smith')
+  assert CachedDoctor.get_doctor_with_details(doctor.id).specialization == 'General'
+  assert [view.specialization for view in CachedDoctor.get_available_doctors()] == ['General']
+
+  doctor.specialization = 'Cardiology'
+  db.session.commit()
+
+  assert CachedDoctor.get_doctor_with_details(doctor.id).specialization == 'Cardiology'
+  assert [view.specialization for view in CachedDoctor.get_available_doctors()] == ['Cardiology']
+
+
+def test_doctor_leaving_the_available_list_on_commit(app, make_doctor):
+  doctor = make_doctor('smith')
+  assert len(CachedDoctor.get_available_doctors()) == 1
+
+  doctor.is_available = False
+  db.session.commit()
+
+  assert CachedDoctor.get_available_doctors() == []
+  assert CachedDoctor.get_doctor_with_details(doctor.id).is_available is False
+
+
+def test_username_change_refreshes_doctor_views_on_commit(app, make_doctor):
+  doctor = make_doctor('smith')
+  assert CachedDoctor.get_doctor_with_details(doctor.id).name == 'smith'
+  assert [view.name for view in CachedDoctor.get_available_doctors(search='smith')] == ['smith']
+
+  doctor.user.username = 'jones'
+  db.session.commit()
+
+  assert CachedDoctor.get_doctor_with_details(doctor.id).name == 'jones'
+  assert CachedDoctor.get_available_doctors(search='smith') == []
+  assert [view.name for view in CachedDoctor.get_available_doctors(search='jones')] == ['jones']
+
+
+def test_rolled_back_changes_do_not_invalidate(app, make_doctor):
+  doctor = make_doctor('smith')
+  CachedDoctor.get_doctor_with_details(doctor.id)
+  CachedDoctor.get_available_doctors()
+  detail_key = cache_service.versioned_key(CachedDoctor.get_doctor_with_details.cache_key(doctor.id))
+  list_key = cache_service.versioned_key(CachedDoctor.get_available_doctors.cache_key())
+  generation = cache_service.redis_client.get(CacheKeys.generation('doctors'))
+
+  doctor.specialization = 'Cardiology'
+  doctor.user.username = 'jones'
+  db.session.flush()
+  db.session.rollback()
+
+  assert cache_service.versioned_key(CachedDoctor.get_doctor_with_details.cache_key(doctor.id)) == detail_key
+  assert cache_service.versioned_key(CachedDoctor.get_available_doctors.cache_key()) == list_key
+  assert cache_service.redis_client.get(CacheKeys.generation('doctors')) == generation
+  assert CachedDoctor.get_doctor_with_details(doctor.id).name == 'smith'
+
+  # The next commit does not replay the rolled-back targets either
+  db.session.commit()
+  assert cache_service.versioned_key(CachedDoctor.get_doctor_with_details.cache_key(doctor.id)) == detail_key
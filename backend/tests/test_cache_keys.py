@@ -0,0 +1,53 @@
+from datetime import date
+
+from app.utils.cache_keys import CacheKeys, MAX_KEY_LENGTH, build_cache_key, shorten_key
+
+
+def test_short_keys_are_kept():
+  key = CacheKeys.doctor_availability(5, date(2026, 1, 1), date(2026, 1, 7))
+  assert shorten_key(key) == key
+
+
+def test_long_scoped_key_keeps_entity_scope():
+  key = CacheKeys.doctor_availability(5, 'x' * MAX_KEY_LENGTH, date(2026, 1, 7))
+  shortened = shorten_key(key)
+
+  assert len(shortened) < MAX_KEY_LENGTH
+  assert shortened.startswith('doctors::availability::5::#')
+  assert CacheKeys.scopes_for(shortened) == CacheKeys.scopes_for(key) == ('doctors', 'doctors::availability::5')
+
+
+def test_long_unscoped_key_keeps_namespace():
+  key = CacheKeys.search_doctors('q' * MAX_KEY_LENGTH)
+  shortened = shorten_key(key)
+
+  assert shortened.startswith('search::#')
+  assert CacheKeys.scopes_for(shortened) == ('search', None)
+
+
+def test_long_keys_stay_distinct():
+  assert shorten_key(CacheKeys.search_doctors('a' * 300)) != shorten_key(CacheKeys.search_doctors('b' * 300))
+
+
+def test_build_cache_key_normalizes_arguments():
+  def lookup(doctor_id, day):
+    pass
+
+  key = build_cache_key(CacheKeys.appointment_slots('{doctor_id}', '{day}'), lookup, (7,), {'day': date(2026, 3, 1)})
+  assert key == 'appointments::slots::7::2026-03-01'
+
+
+def test_strings_are_kept_verbatim_unless_normalized():
+  def lookup(search=None, status=None):
+    pass
+
+  assert build_cache_key(None, lookup, (), {'status': 'Scheduled'}) != build_cache_key(None, lookup, (), {'status': 'scheduled'})
+  assert build_cache_key(CacheKeys.doctor_list, lookup, (), {'search': ' Smith '}, normalize=('search',)) == \
+    build_cache_key(CacheKeys.doctor_list, lookup, (), {'search': 'smith'}, normalize=('search',)) == 'doctors::list::search::smith'
+
+
+def test_cached_doctor_list_folds_search_case_only():
+  from app.models.cached_models import CachedDoctor
+
+  assert CachedDoctor.get_available_doctors.cache_key(search='Smith') == \
+    CachedDoctor.get_available_doctors.cache_key(search='smith')
@@ -0,0 +1,262 @@
+import re
+import threading
+import time
+
+import redis
+
+from app.models import User, db
+from app.services.cache_service import _unwrap_entry, _wrap_entry, cache_service, cached
+from app.services.circuit_breaker import CircuitBreaker
+from app.utils.cache_keys import CacheKeys
+
+
+def test_sub_namespace_pattern_reaches_versioned_keys(app):
+  cache_service.set(CacheKeys.doctor_list(search='smith'), ['smith'])
+  cache_service.set(CacheKeys.doctor_detail(1), {'id': 1})
+
+  assert cache_service.invalidate('doctors::list::*')
+  assert cache_service.get(CacheKeys.doctor_list(search='smith')) is None
+  assert cache_service.get(CacheKeys.doctor_detail(1)) == {'id': 1}
+
+
+def test_clear_all_covers_module_keys(app):
+  calls = []
+
+  @cached(expiry=60)
+  def lookup(number):
+    calls.append(number)
+    return number * 2
+
+  lookup(2)
+  cache_service.set(CacheKeys.department_list(), ['General'])
+
+  assert cache_service.invalidate('*')
+  assert cache_service.get(CacheKeys.department_list()) is None
+  lookup(2)
+  assert calls == [2, 2]
+
+
+def test_unmappable_pattern_is_rejected(app):
+  assert cache_service.invalidate('doc*::list') is False
+  assert cache_service.invalidate_many(['doctors::*', '*::detail::1']) is False
+
+
+def test_clear_cache_route_rejects_unmappable_pattern(app, client, login):
+  admin = User(username='admin', email='admin@example.com', role='admin')
+  admin.set_password('x')
+  db.session.add(admin)
+  db.session.commit()
+  login(admin)
+
+  response = client.post('/api/cached/cache/clear', json={'pattern': '*::detail::*'})
+  assert response.status_code == 400
+
+  response = client.post('/api/cached/cache/clear', json={'pattern': 'doctors::list::*'})
+  assert response.status_code == 200
+
+
+def test_namespace_bump_hides_every_key_below_it(app):
+  cache_service.set(CacheKeys.doctor_detail(1), {'id': 1})
+  cache_service.set(CacheKeys.department_list(), ['General'])
+
+  assert cache_service.invalidate(CacheKeys.pattern_doctors())
+  assert cache_service.get(CacheKeys.doctor_detail(1)) is None
+  assert cache_service.get(CacheKeys.department_list()) == ['General']
+
+
+def test_entity_scope_bump_leaves_other_entities(app):
+  five = CacheKeys.doctor_next_available(5, '2026-01-01')
+  six = CacheKeys.doctor_next_available(6, '2026-01-01')
+  cache_service.set(five, '2026-01-02')
+  cache_service.set(six, '2026-01-03')
+
+  assert cache_service.invalidate(CacheKeys.doctor_availability_scope(5))
+  assert cache_service.get(five) is None
+  assert cache_service.get(six) == '2026-01-03'
+
+
+def test_generation_bump_reaches_other_processes_local_tier(app):
+  key = CacheKeys.department_list()
+  cache_service.set(key, ['General'], local_ttl=60)
+  stale = cache_service.versioned_key(key)
+
+  # Another process bumps the namespace; this one drops its memo on the
+  # published message (or after GENERATION_TTL without the subscriber)
+  cache_service.redis_client.incr(CacheKeys.generation('departments'))
+  cache_service._generations.clear()
+
+  assert cache_service.versioned_key(key) != stale
+  assert cache_service.get(key, local_ttl=60) is None
+
+
+def _expire(function, *args):
+  """Rewrite a @cached entry as already expired, keeping its value"""
+  key = function.cache_key(*args)
+  value, delta, _ = _unwrap_entry(cache_service.get(key))
+  cache_service.set(key, _wrap_entry(value, -1, delta), 60)
+
+
+def test_stale_while_revalidate_serves_old_value_and_enqueues_once(app, monkeypatch):
+  from celery_worker import cache_tasks
+  enqueued = []
+  monkeypatch.setattr(cache_tasks.refresh_cached_entry, 'delay', lambda *args: enqueued.append(args))
+  calls = []
+
+  @cached(CacheKeys.doctor_detail('{doctor_id}'), expiry=60, stale_ttl=30)
+  def lookup(doctor_id):
+    calls.append(doctor_id)
+    return {'id': doctor_id, 'version': len(calls)}
+
+  assert lookup(1) == {'id': 1, 'version': 1}
+  _expire(lookup, 1)
+
+  assert lookup(1) == {'id': 1, 'version': 1}
+  assert lookup(1) == {'id': 1, 'version': 1}
+  assert calls == [1]
+  assert len(enqueued) == 1
+
+  # What the Celery task runs
+  lookup.refresh(1)
+  assert lookup(1) == {'id': 1, 'version': 2}
+
+
+def test_single_flight_serves_stale_value_while_another_worker_rebuilds(app):
+  calls = []
+
+  @cached(CacheKeys.doctor_detail('{doctor_id}'), expiry=60, single_flight=True)
+  def lookup(doctor_id):
+    calls.append(doctor_id)
+    return len(calls)
+
+  assert lookup(1) == 1
+  _expire(lookup, 1)
+
+  lock = cache_service.lock(lookup.cache_key(1))
+  assert lock.acquire(blocking=False)
+  try:
+    assert lookup(1) == 1
+    assert calls == [1]
+  finally:
+    lock.release()
+
+  assert lookup(1) == 2
+
+
+def test_negative_results_are_cached_for_negative_ttl(app):
+  calls = []
+
+  @cached(CacheKeys.doctor_detail('{doctor_id}'), expiry=60, negative_ttl=30)
+  def lookup(doctor_id):
+    calls.append(doctor_id)
+    return None
+
+  assert lookup(404) is None
+  assert lookup(404) is None
+  assert calls == [404]
+
+
+def test_coalesce_shares_one_call_between_threads(app):
+  started, release = threading.Event(), threading.Event()
+  calls = []
+
+  @cached(CacheKeys.doctor_detail('{doctor_id}'), expiry=60, coalesce=True)
+  def lookup(doctor_id):
+    calls.append(doctor_id)
+    started.set()
+    release.wait(5)
+    return doctor_id
+
+  results = []
+  def call():
+    with app.app_context():
+      results.append(lookup(3))
+
+  first = threading.Thread(target=call)
+  first.start()
+  started.wait(5)
+  followers = [threading.Thread(target=call) for _ in range(3)]
+  for thread in followers:
+    thread.start()
+  time.sleep(0.05)
+  release.set()
+  for thread in [first] + followers:
+    thread.join(5)
+
+  assert results == [3, 3, 3, 3]
+  assert calls == [3]
+
+
+class _FailingClient:
+  """Stands in for a Redis client whose server is unreachable"""
+  def __getattr__(self, name):
+    def fail(*args, **kwargs):
+      raise redis.exceptions.ConnectionError('Connection refused')
+    return fail
+
+
+def test_breaker_opens_after_connection_errors_and_skips_redis(app, monkeypatch):
+  breaker = cache_service.breaker
+  client = cache_service.redis_client
+  monkeypatch.setattr(cache_service, '_client', _FailingClient())
+
+  for _ in range(breaker.failure_threshold):
+    assert cache_service.get(CacheKeys.department_list()) is None
+  assert breaker.state == CircuitBreaker.OPEN
+  assert not cache_service.is_connected()
+
+  # After the cooldown one probe is let through and closes the circuit
+  monkeypatch.setattr(cache_service, '_client', client)
+  breaker.opened_at -= breaker.recovery_timeout
+  assert cache_service.get(CacheKeys.department_list()) is None
+  assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_breaker_lets_one_probe_through():
+  breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+  breaker.record_failure()
+  assert breaker.allow()
+  breaker.record_failure()
+  assert not breaker.allow()
+
+  breaker.opened_at -= 30
+  assert breaker.allow()
+  assert not breaker.allow()
+  breaker.record_failure()
+  assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_undecodable_entry_is_a_miss_and_is_dropped(app):
+  key = CacheKeys.doctor_detail(1)
+  cache_service.set(key, {'id': 1})
+  cache_service.set(CacheKeys.doctor_detail(2), {'id': 2})
+  versioned_key = cache_service.versioned_key(key)
+  cache_service.redis_client.set(versioned_key, b'not a cache payload')
+
+  assert cache_service.get(key) is None
+  assert cache_service.get_many([key, CacheKeys.doctor_detail(2)]) == {CacheKeys.doctor_detail(2): {'id': 2}}
+  assert not cache_service.redis_client.exists(versioned_key)
+  assert cache_service.breaker.failures == 0
+  assert cache_service.breaker.state == CircuitBreaker.CLOSED
+
+
+def _cached_routes(app):
+  return [
+    (re.sub(r'<[^>]+>', '1', rule.rule), 'POST' if 'POST' in rule.methods else 'GET')
+    for rule in app.url_map.iter_rules() if rule.endpoint.startswith('cached.')
+  ]
+
+
+def test_cached_routes_require_login(app, client):
+  routes = _cached_routes(app)
+  assert ('/api/cached/cache/health', 'GET') in routes
+
+  for path, method in routes:
+    assert client.open(path, method=method, json={}).status_code == 401, path
+
+
+def test_cache_management_routes_require_an_admin(app, client, login, make_patient):
+  login(make_patient().user)
+
+  for path, method in _cached_routes(app):
+    if path.startswith('/api/cached/cache/'):
+      assert client.open(path, method=method, json={}).status_code == 403, path
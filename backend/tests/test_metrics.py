@@ -0,0 +1,56 @@
+import pytest
+
+from app.models import User, db
+
+# Metrics are a no-op without the optional prometheus_client
+prometheus_client = pytest.importorskip('prometheus_client')
+
+
+def _requests_seen(endpoint, status):
+  return prometheus_client.REGISTRY.get_sample_value(
+    'http_request_duration_seconds_count',
+    {'blueprint': 'auth', 'endpoint': endpoint, 'method': 'GET', 'status': status}
+  ) or 0
+
+
+def test_requests_are_observed_per_endpoint(app, client, login):
+  user = User(username='metrics', email='metrics@example.com', role='admin')
+  user.set_password('x')
+  db.session.add(user)
+  db.session.commit()
+  login(user)
+  before = _requests_seen('auth.get_current_user', '200')
+
+  assert client.get('/api/auth/me').status_code == 200
+  assert client.get('/api/auth/me').status_code == 200
+
+  assert _requests_seen('auth.get_current_user', '200') == before + 2
+  body = client.get('/metrics').get_data(as_text=True)
+  assert 'http_request_duration_seconds_bucket{' in body
+  assert 'endpoint="auth.get_current_user"' in body
+
+
+def test_metrics_scrape_is_not_observed_itself(app, client):
+  client.get('/metrics')
+  body = client.get('/metrics').get_data(as_text=True)
+  assert 'endpoint="metrics.prometheus_metrics"' not in body
+
+
+def test_metrics_token_is_required_when_configured(app, client):
+  app.config['METRICS_TOKEN'] = 'secret'
+  assert client.get('/metrics').status_code == 403
+  assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_published_tasks_are_counted_once_however_often_metrics_are_set_up(app):
+  from celery.signals import after_task_publish
+  from app.services.metrics import setup_celery_metrics
+
+  setup_celery_metrics()
+  setup_celery_metrics()
+  labels = {'task': 'tasks.metrics_probe'}
+  before = prometheus_client.REGISTRY.get_sample_value('celery_tasks_published_total', labels) or 0
+
+  after_task_publish.send(sender='tasks.metrics_probe', headers={'task': 'tasks.metrics_probe'})
+
+  assert prometheus_client.REGISTRY.get_sample_value('celery_tasks_published_total', labels) == before + 1
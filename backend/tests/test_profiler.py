@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from app.models import User, db
+from app.services.profiler import ProfileStore, RequestProfiler, profile_store
+
+
+@pytest.fixture
+def store(app, tmp_path, monkeypatch):
+  monkeypatch.setattr(profile_store, 'directory', str(tmp_path))
+  return profile_store
+
+
+@pytest.fixture
+def admin(app, login):
+  user = User(username='admin', email='admin@example.com', role='admin')
+  user.set_password('x')
+  db.session.add(user)
+  db.session.commit()
+  login(user)
+  return user
+
+
+def test_profiled_request_stores_a_cprofile_run(app, client, store, admin):
+  app.config['PROFILING_ENABLED'] = True
+
+  response = client.get('/api/auth/me', headers={'X-Profile': '1'})
+
+  assert response.status_code == 200
+  profile_id = response.headers['X-Profile-Id']
+  [metadata] = store.list()
+  assert metadata['id'] == profile_id
+  assert metadata['mode'] == 'cprofile'
+  assert metadata['endpoint'] == 'auth.get_current_user'
+  assert metadata['status'] == 200
+  assert metadata['size'] == os.path.getsize(os.path.join(store.directory, profile_id + '.prof')) > 0
+  assert 'get_current_user' in store.summary(profile_id)
+
+
+def test_sampled_request_stores_collapsed_stacks(app, client, store, admin):
+  app.config['PROFILING_ENABLED'] = True
+
+  response = client.get('/api/auth/me', headers={'X-Profile': 'sample'})
+
+  [metadata] = store.list()
+  assert metadata['id'] == response.headers['X-Profile-Id']
+  assert metadata['mode'] == 'sample'
+  assert os.path.exists(os.path.join(store.directory, metadata['id'] + '.collapsed'))
+  assert store.summary(metadata['id']) is None
+
+
+def test_profiling_is_a_no_op_when_disabled(app, client, store, admin):
+  assert app.config['PROFILING_ENABLED'] is False
+
+  response = client.get('/api/auth/me', headers={'X-Profile': '1'})
+
+  assert response.status_code == 200
+  assert 'X-Profile-Id' not in response.headers
+  assert store.list() == []
+  assert os.listdir(store.directory) == []
+
+
+def test_only_admin_requests_are_profiled(app, client, store, login, make_patient):
+  app.config['PROFILING_ENABLED'] = True
+  login(make_patient().user)
+
+  response = client.get('/api/auth/me', headers={'X-Profile': '1'})
+
+  assert response.status_code == 200
+  assert 'X-Profile-Id' not in response.headers
+  assert store.list() == []
+
+
+def test_store_keeps_the_newest_profiles_within_its_caps(tmp_path):
+  store = ProfileStore(str(tmp_path), max_profiles=2)
+  ids = []
+  for _ in range(3):
+    profiler = RequestProfiler('cprofile')
+    profiler.start()
+    sum(range(1000))
+    profiler.stop()
+    ids.append(store.save(profiler, {'path': '/'}))
+
+  assert {profile['id'] for profile in store.list()} == set(ids[1:])
+  assert store.get(ids[0]) is None
+  assert store.delete(ids[1])
+  assert [profile['id'] for profile in store.list()] == [ids[2]]
+
+
+def test_store_rejects_ids_outside_its_directory(tmp_path):
+  store = ProfileStore(str(tmp_path))
+  assert store.get('../etc/passwd') is None
+  assert store.delete('20260101000000-zzzzzzzz') is False
@@ -0,0 +1,103 @@
+import pytest
+from sqlalchemy import text
+
+from app.middleware.query_inspection import QueryBudgetExceeded, fingerprint_sql
+from app.models import db
+from app.utils.decorators import query_budget
+
+
+# The app fixture keeps one app context (and so one g) across requests, so
+# each test sends a single request
+
+def _add_route(app, name, statements, budget=None):
+  """Register a route that runs statements (SQL strings) and returns 200"""
+  def view():
+    for statement in statements:
+      db.session.execute(text(statement))
+    return 'ok'
+  view.__name__ = name
+  if budget is not None:
+    view = query_budget(budget)(view)
+  app.add_url_rule(f'/_test/{name}', name, view)
+  return f'/_test/{name}'
+
+
+def _repeated(count):
+  return [f'SELECT id FROM users WHERE id = {number}' for number in range(count)]
+
+
+def _distinct(count):
+  return [f'SELECT count(*) FROM {table.name}' for table in db.metadata.sorted_tables[:count]]
+
+
+def test_fingerprints_ignore_literals_parameters_and_in_list_length():
+  assert fingerprint_sql("SELECT * FROM users WHERE id = 1 AND name = 'a'") == \
+    fingerprint_sql("select *  from users\nwhere id = 22 and name = 'b''c'") == \
+    'select * from users where id = ? and name = ?'
+  assert fingerprint_sql('SELECT * FROM users WHERE id IN (?, ?, ?)') == \
+    fingerprint_sql('SELECT * FROM users WHERE id IN (%(id_1)s)') == 'select * from users where id in (?)'
+  assert fingerprint_sql('SELECT * FROM users') != fingerprint_sql('SELECT * FROM doctors')
+
+
+def test_repeated_statement_raises_in_test_mode(app, client):
+  path = _add_route(app, 'repeated', _repeated(6))
+
+  with pytest.raises(QueryBudgetExceeded, match='Possible N\\+1 in repeated: 1 statement\\(s\\) repeated, worst 6x'):
+    client.get(path)
+
+
+@pytest.mark.parametrize('statements', [_repeated(5), _distinct(6)], ids=['threshold', 'distinct'])
+def test_statements_up_to_the_threshold_and_distinct_statements_pass(app, client, statements):
+  assert len(statements) in (5, 6)
+  path = _add_route(app, 'allowed', statements)
+
+  response = client.get(path)
+
+  assert response.status_code == 200
+  assert 'X-Query-Warning' not in response.headers
+
+
+def test_repeated_statement_only_warns_when_not_strict(app, client):
+  app.config['QUERY_INSPECTION_STRICT'] = False
+  path = _add_route(app, 'repeated', _repeated(6))
+
+  response = client.get(path)
+
+  assert response.status_code == 200
+  assert response.headers['X-Query-Warning'].startswith('Possible N+1 in repeated')
+
+
+def test_query_budget_allows_up_to_budget(app, client):
+  within = _add_route(app, 'within', _distinct(3), budget=3)
+
+  response = client.get(within)
+
+  assert response.status_code == 200
+  assert 'X-Query-Warning' not in response.headers
+
+
+def test_query_budget_raises_in_test_mode(app, client):
+  over = _add_route(app, 'over', _distinct(4), budget=3)
+
+  with pytest.raises(QueryBudgetExceeded, match='Query budget exceeded in over: 4 queries \\(budget 3\\)'):
+    client.get(over)
+
+
+def test_query_budget_only_warns_outside_test_mode(app, client):
+  app.testing = False
+  over = _add_route(app, 'over', _distinct(4), budget=3)
+
+  response = client.get(over)
+
+  assert response.status_code == 200
+  assert response.headers['X-Query-Warning'] == 'Query budget exceeded in over: 4 queries (budget 3)'
+
+
+def test_strict_setting_overrides_test_mode(app, client):
+  app.testing = False
+  app.config['QUERY_INSPECTION_STRICT'] = True
+  app.config['PROPAGATE_EXCEPTIONS'] = True
+  over = _add_route(app, 'over', _distinct(4), budget=3)
+
+  with pytest.raises(QueryBudgetExceeded):
+    client.get(over)
@@ -0,0 +1,206 @@
+import threading
+from datetime import datetime, timedelta
+
+from app.models import DoctorAvailability, db
+from app.services import schedule_index as schedule_index_module
+from app.services.appointment_service import AppointmentService
+from app.services.cache_service import cache_service
+from app.services.schedule_index import schedule_index
+from app.utils.cache_keys import CacheKeys
+
+
+def _count_sql_fallbacks(monkeypatch):
+  calls = []
+  load = schedule_index_module.load_next_available_dates
+
+  def counting(doctor_ids, *args, **kwargs):
+    calls.append(sorted(doctor_ids))
+    return load(doctor_ids, *args, **kwargs)
+
+  monkeypatch.setattr(schedule_index_module, 'load_next_available_dates', counting)
+  return calls
+
+
+def _indexed_slot(slot):
+  """The slot as the index serves it, loading its day on a miss"""
+  return schedule_index.days([(slot.doctor_id, slot.date)])[(slot.doctor_id, slot.date)][slot.start_time.strftime('%H:%M')]
+
+
+def test_get_doctors_stays_within_its_query_budget(app, client, login, monkeypatch, make_doctor, make_patient, make_slot):
+  patient = make_patient()
+  full = make_doctor('full')
+  slot = make_slot(full, max_patients=1)
+  AppointmentService.book_appointment(make_patient('other').id, full.id, slot.date, slot.start_time, 'Checkup')
+  make_doctor('empty')
+  later = make_doctor('later')
+  make_slot(later, days_ahead=30)
+  calls = _count_sql_fallbacks(monkeypatch)
+  login(patient.user)
+
+  # Raises QueryBudgetExceeded in testing if the lookup fans out per window
+  response = client.get('/api/patient/doctors')
+  assert response.status_code == 200, response.get_json()
+  next_available = {doctor['name']: doctor['next_available'] for doctor in response.get_json()['doctors']}
+  today = datetime.now().date()
+  assert next_available == {'full': None, 'empty': None, 'later': (today + timedelta(days=30)).isoformat()}
+  assert len(calls) == 1
+
+  # Doctors without a free date are cached as such too
+  assert client.get('/api/patient/doctors').status_code == 200
+  assert len(calls) == 1
+
+
+def test_next_available_dates_are_read_from_indexed_days(app, monkeypatch, make_doctor, make_slot):
+  doctor = make_doctor()
+  make_slot(doctor, days_ahead=2)
+  today = datetime.now().date()
+  schedule_index.availability([doctor.id], today, today + timedelta(days=13))
+  calls = _count_sql_fallbacks(monkeypatch)
+
+  assert schedule_index.next_available_dates([doctor.id], today) == {doctor.id: today + timedelta(days=2)}
+  assert calls == []
+
+
+def test_a_gap_in_the_index_goes_to_sql(app, monkeypatch, make_doctor, make_slot):
+  doctor = make_doctor()
+  make_slot(doctor, days_ahead=5)
+  today = datetime.now().date()
+  # Days 3.. are not indexed, so day 5 cannot be trusted from the index alone
+  schedule_index.availability([doctor.id], today, today + timedelta(days=2))
+  calls = _count_sql_fallbacks(monkeypatch)
+
+  assert schedule_index.next_available_dates([doctor.id], today) == {doctor.id: today + timedelta(days=5)}
+  assert calls == [[doctor.id]]
+
+
+def test_horizon_bounds_the_search(app, make_doctor, make_slot):
+  doctor = make_doctor()
+  make_slot(doctor, days_ahead=100)
+  assert schedule_index.next_available_dates([doctor.id], datetime.now().date()) == {}
+
+
+def test_bookings_update_indexed_days_in_place(app, make_doctor, make_patient, make_slot):
+  doctor = make_doctor()
+  slot = make_slot(doctor, max_patients=2)
+  assert _indexed_slot(slot)['booked'] == 0
+
+  appointment, _ = AppointmentService.book_appointment(make_patient().id, doctor.id, slot.date, slot.start_time, 'Checkup')
+  indexed, _ = schedule_index._read([(doctor.id, slot.date)])
+  assert indexed[(doctor.id, slot.date)]['09:00']['booked'] == 1
+
+  appointment.status = 'cancelled'
+  db.session.commit()
+  indexed, _ = schedule_index._read([(doctor.id, slot.date)])
+  assert indexed[(doctor.id, slot.date)]['09:00']['booked'] == 0
+
+
+def test_rolled_back_reservations_leave_the_index_alone(app, make_doctor, make_slot):
+  from app.utils.booking_counts import reserve_slot
+
+  doctor = make_doctor()
+  slot = make_slot(doctor)
+  _indexed_slot(slot)
+
+  assert reserve_slot(db.session, doctor.id, slot.date, slot.start_time)
+  db.session.rollback()
+  assert _indexed_slot(slot)['booked'] == 0
+
+
+def test_without_redis_every_lookup_uses_the_database(app, make_doctor, make_slot):
+  doctor = make_doctor()
+  slot = make_slot(doctor, days_ahead=3)
+  cache_service.enabled = False
+  today = datetime.now().date()
+
+  assert schedule_index.next_available_dates([doctor.id], today) == {doctor.id: slot.date}
+  assert schedule_index.availability([doctor.id], today, today + timedelta(days=6))[doctor.id][0]['id'] == slot.id
+
+
+def _in_another_request(app, operation):
+  """Run operation() to completion on another thread, with its own app context and session"""
+  result = []
+
+  def run():
+    with app.app_context():
+      try:
+        result.append(operation())
+      finally:
+        db.session.remove()
+
+  thread = threading.Thread(target=run)
+  thread.start()
+  thread.join(5)
+  return result[0] if result else None
+
+
+def _booked_in_db(slot):
+  # Another request may have booked it since this session loaded the slot
+  return db.session.scalar(db.select(DoctorAvailability.booked_count).filter_by(id=slot.id))
+
+
+def test_load_between_a_commit_and_its_index_update_does_not_count_it_twice(app, monkeypatch, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor, max_patients=3)
+  pair = (doctor.id, slot.date)
+  apply = schedule_index.apply_booking_deltas
+  loads = []
+
+  def load_then_apply(*args, **kwargs):
+    # The booking is committed, its HINCRBY not sent yet: another request
+    # loads the day from the database, which already counts the booking
+    loads.append(_in_another_request(app, lambda: schedule_index.days([pair])[pair]['09:00']['booked']))
+    return apply(*args, **kwargs)
+
+  monkeypatch.setattr(schedule_index, 'apply_booking_deltas', load_then_apply)
+  AppointmentService.book_appointment(patient.id, doctor.id, slot.date, slot.start_time, 'Checkup')
+
+  assert loads == [1]
+  assert _booked_in_db(slot) == 1
+  assert _indexed_slot(slot)['booked'] == 1
+  indexed, _ = schedule_index._read([pair])
+  assert indexed[pair]['09:00']['booked'] == 1
+
+
+def test_load_that_missed_a_commit_is_not_stored(app, monkeypatch, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor, max_patients=3)
+  slot_date, slot_time = slot.date, slot.start_time
+  pair = (doctor.id, slot_date)
+  load = schedule_index._load
+
+  def load_then_book(pairs):
+    # The day is read before the booking commits and stored after it
+    loaded = load(pairs)
+    _in_another_request(app, lambda: AppointmentService.book_appointment(
+      patient.id, doctor.id, slot_date, slot_time, 'Checkup'
+    ))
+    return loaded
+
+  monkeypatch.setattr(schedule_index, '_load', load_then_book)
+  assert schedule_index.days([pair])[pair]['09:00']['booked'] == 0
+  monkeypatch.setattr(schedule_index, '_load', load)
+
+  assert _booked_in_db(slot) == 1
+  assert schedule_index._read([pair])[0] == {}
+  assert _indexed_slot(slot)['booked'] == 1
+
+
+def test_unfinished_bookings_release_their_days(app, make_doctor, make_slot):
+  from app.utils.booking_counts import reserve_slot
+
+  doctor = make_doctor()
+  slot = make_slot(doctor)
+  pair = (doctor.id, slot.date)
+  guard = CacheKeys.schedule_guard(doctor.id, slot.date)
+
+  assert reserve_slot(db.session, doctor.id, slot.date, slot.start_time)
+  assert cache_service.redis_client.hget(guard, 'active') == b'1'
+  # While the booking is in flight the day is served but not indexed
+  assert schedule_index.days([pair])[pair]['09:00']['booked'] == 1
+  assert schedule_index._read([pair])[0] == {}
+
+  # Closing the session without a rollback releases the day too
+  db.session.close()
+  assert cache_service.redis_client.hget(guard, 'active') == b'0'
+  assert _indexed_slot(slot)['booked'] == 0
+  assert schedule_index._read([pair])[0][pair]['09:00']['booked'] == 0
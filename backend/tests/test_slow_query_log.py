@@ -0,0 +1,33 @@
+from app.models import Department, db
+from app.services.slow_query_log import SlowQueryLog
+
+
+def test_explain_keeps_the_request_transaction(app):
+  log = SlowQueryLog(threshold_ms=0)
+  db.session.add(Department(name='Cardiology', description='Heart'))
+  db.session.flush()
+  conn = db.session.connection()
+
+  assert log._explain(conn, 'SELECT * FROM no_such_table', ()) is None
+  plan = log._explain(conn, 'SELECT * FROM departments WHERE name = ?', ('Cardiology',))
+  assert plan and isinstance(plan[0], str)
+
+  # Still the request's own, uncommitted transaction
+  assert Department.query.filter_by(name='Cardiology').count() == 1
+  db.session.rollback()
+  assert Department.query.filter_by(name='Cardiology').count() == 0
+
+
+def test_slow_statements_are_grouped_by_fingerprint(app):
+  log = SlowQueryLog(threshold_ms=10, explain=False)
+  conn = db.session.connection()
+  log.record(conn, 'SELECT * FROM departments WHERE id = ?', (1,), False, 5, 'admin.get_departments')
+  log.record(conn, 'SELECT * FROM departments WHERE id = ?', (1,), False, 30, 'admin.get_departments')
+  log.record(conn, 'SELECT * FROM departments WHERE id = ?', (2,), False, 50, 'patient.get_doctors')
+
+  top = log.top()
+  assert len(top) == 1
+  assert top[0]['count'] == 2
+  assert top[0]['total_ms'] == 80
+  assert top[0]['endpoints'] == ['admin.get_departments', 'patient.get_doctors']
+  assert top[0]['parameters'] == ['int']
@@ -0,0 +1,22 @@
+from celery_worker import cache_tasks, tasks
+from app.services.cache_service import cache_service
+
+
+class _RecordingApp:
+  """The worker's Flask app, recording when its context is entered"""
+  def __init__(self, app):
+    self.app = app
+    self.entered = 0
+
+  def app_context(self):
+    self.entered += 1
+    return self.app.app_context()
+
+
+def test_sweep_runs_in_the_app_context(app, monkeypatch):
+  worker_app = _RecordingApp(app)
+  monkeypatch.setattr(cache_tasks, '_flask_app', worker_app)
+  monkeypatch.setattr(cache_service, 'sweep_orphaned_keys', lambda: 3)
+
+  assert tasks.sweep_orphaned_cache_keys.run() == {'status': 'completed', 'removed_keys': 3}
+  assert worker_app.entered == 1
@@ -0,0 +1,60 @@
+import json
+
+from app.services import tracing
+from app.services.tracing import FileExporter, InMemoryCollector, Tracer
+
+
+def test_memory_is_the_default_exporter(monkeypatch):
+  monkeypatch.delenv('TRACE_EXPORTER', raising=False)
+  tracer = Tracer()
+  tracer.configure_from_env()
+  assert isinstance(tracer.exporter, InMemoryCollector)
+
+
+def test_file_exporter_rotates_once_past_max_bytes(tmp_path):
+  path = str(tmp_path / 'traces.jsonl')
+  exporter = FileExporter(path, max_bytes=200)
+  for number in range(10):
+    exporter.export({'trace_id': 't', 'number': number, 'padding': 'x' * 40})
+
+  with open(path + '.1') as rotated:
+    rotated_numbers = [json.loads(line)['number'] for line in rotated]
+  assert rotated_numbers and rotated_numbers == sorted(rotated_numbers)
+  assert [span['number'] for span in exporter.spans()][-1] == 9
+
+
+def test_rotation_is_skipped_when_another_process_already_rotated(tmp_path, monkeypatch):
+  path = str(tmp_path / 'traces.jsonl')
+  exporter = FileExporter(path, max_bytes=10)
+  with open(path + '.1', 'w') as rotated:
+    rotated.write('{"number": 1}\n')
+  with open(path, 'w') as current:
+    current.write('{"number": 2}\n')
+
+  # The size seen before taking the lock is stale: the file was just rotated
+  sizes = iter([100])
+  monkeypatch.setattr(exporter, '_size', lambda file_path: next(sizes, 0))
+  exporter.export({'number': 3})
+
+  with open(path + '.1') as rotated:
+    assert [json.loads(line)['number'] for line in rotated] == [1]
+
+
+def test_file_reads_are_bounded(tmp_path):
+  path = str(tmp_path / 'traces.jsonl')
+  exporter = FileExporter(path, max_bytes=10 ** 6, read_bytes=300)
+  for number in range(100):
+    exporter.export({'trace_id': 't', 'number': number})
+
+  numbers = [span['number'] for span in exporter.spans()]
+  assert 0 < len(numbers) < 100
+  assert numbers == list(range(100 - len(numbers), 100))
+
+
+def test_trace_id_is_current_until_the_trace_ends():
+  token = tracing.start_trace('request-1')
+  try:
+    assert tracing.current_request_id() == 'request-1'
+  finally:
+    tracing.end_trace(token)
+  assert tracing.current_request_id() is None
@@ -0,0 +1,41 @@
+from datetime import date
+
+from sqlalchemy import inspect, text
+
+from app.models import Appointment, DoctorAvailability, db
+from upgrade_db import upgrade_database
+
+
+def test_upgrade_adds_booked_count_and_backfills_it(app, make_doctor, make_patient, make_slot):
+  doctor, patient = make_doctor(), make_patient()
+  slot = make_slot(doctor)
+  db.session.add(Appointment(patient_id=patient.id, doctor_id=doctor.id, appointment_date=slot.date,
+                             appointment_time=slot.start_time, reason='Checkup'))
+  db.session.commit()
+
+  # A database from before the counter existed
+  db.session.execute(text('ALTER TABLE doctor_availabilities DROP COLUMN booked_count'))
+  db.session.commit()
+
+  summary = upgrade_database()
+  assert summary['added_columns'] == ['doctor_availabilities.booked_count']
+  assert summary['booked_count_backfill']['repaired'] == 1
+  assert db.session.get(DoctorAvailability, slot.id).booked_count == 1
+
+
+def test_upgrade_is_a_no_op_on_a_current_database(app):
+  summary = upgrade_database()
+  assert summary == {
+    'added_columns': [],
+    'created_indexes': [],
+    'rebuilt_indexes': [],
+    'booked_count_backfill': None
+  }
+
+
+def test_upgrade_creates_missing_indexes(app):
+  db.session.execute(text('DROP INDEX ix_appointments_date_status'))
+  db.session.commit()
+
+  assert upgrade_database()['created_indexes'] == ['ix_appointments_date_status']
+  assert 'ix_appointments_date_status' in {index['name'] for index in inspect(db.engine).get_indexes('appointments')}
@@ -0,0 +1,70 @@
+"""
+Bring an existing database up to the models: add missing columns and
+indexes, rebuild PostgreSQL indexes whose INCLUDE columns changed, and
+backfill DoctorAvailability.booked_count when the column is new.
+
+Run once per deploy, before starting the web and Celery processes
+(create_app() only creates missing tables):
+  python upgrade_db.py
+  python upgrade_db.py --reconcile   # recount every slot's booked_count
+"""
+import argparse
+from contextlib import contextmanager
+from datetime import date
+from sqlalchemy import text
+from app import create_app, db
+from app.models import add_missing_columns, create_missing_indexes, rebuild_changed_indexes
+
+# pg_advisory_lock key, so two deploys never upgrade at the same time
+UPGRADE_LOCK_ID = 72210522
+
+@contextmanager
+def upgrade_lock(engine):
+  if engine.dialect.name != 'postgresql':
+    yield
+    return
+  with engine.connect() as conn:
+    conn.execute(text('SELECT pg_advisory_lock(:id)'), {'id': UPGRADE_LOCK_ID})
+    try:
+      yield
+    finally:
+      conn.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': UPGRADE_LOCK_ID})
+
+def upgrade_database(reconcile=False):
+  """Run the upgrade in the current app context; returns what was changed"""
+  from app.utils.booking_counts import reconcile_booked_counts
+
+  with upgrade_lock(db.engine):
+    db.create_all()
+    added_columns = add_missing_columns(db.engine)
+    created_indexes = create_missing_indexes(db.engine)
+    rebuilt_indexes = rebuild_changed_indexes(db.engine)
+
+    backfill = None
+    if reconcile or 'doctor_availabilities.booked_count' in added_columns:
+      backfill = reconcile_booked_counts(start_date=date.min)
+
+  return {
+    'added_columns': added_columns,
+    'created_indexes': created_indexes,
+    'rebuilt_indexes': rebuilt_indexes,
+    'booked_count_backfill': backfill
+  }
+
+def run_upgrade(reconcile):
+  app = create_app()
+
+  with app.app_context():
+    summary = upgrade_database(reconcile=reconcile)
+    print(f"Columns added: {', '.join(summary['added_columns']) or 'none'}")
+    print(f"Indexes created: {', '.join(summary['created_indexes']) or 'none'}")
+    print(f"Indexes rebuilt: {', '.join(summary['rebuilt_indexes']) or 'none'}")
+    backfill = summary['booked_count_backfill']
+    if backfill:
+      print(f"booked_count: {backfill['repaired']} of {backfill['checked']} slots updated")
+    print('Database upgrade completed!')
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Upgrade an existing database to the current models')
+  parser.add_argument('--reconcile', action='store_true', help='recount booked_count for every slot')
+  run_upgrade(parser.parse_args().reconcile)
@@ -0,0 +1,17 @@
+import argparse
+from app import create_app
+from app.services.cache_warmup import warm_cache
+
+def run_cache_warmup(days):
+  app = create_app()
+
+  with app.app_context():
+    summary = warm_cache(days=days)
+    for group, count in summary.items():
+      print(f'{group}: {count} entries')
+    print('Cache warm-up completed!')
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Pre-populate the Redis cache')
+  parser.add_argument('--days', type=int, default=7, help='days of availability to warm')
+  run_cache_warmup(parser.parse_args().days)